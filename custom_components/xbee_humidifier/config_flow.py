@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+import asyncio
 from typing import Any
 
 import voluptuous as vol
@@ -19,7 +20,7 @@ from . import (
     CONF_TARGET_HUMIDITY,
 )
 from .const import DOMAIN
-from .coordinator import XBeeHumidifierApiClient
+from .coordinator import DEFAULT_ZONES, XBeeHumidifierApiClient
 
 DEFAULT_NAME = "XBee Humidifier"
 
@@ -47,58 +48,36 @@ class XBeeHumidifierFlowHandler:
 
     async def async_step_humidifier(
         self,
-        number,
         user_input: dict[str, Any] | None = None,
     ) -> config_entries.FlowResult:
-        """Handle humidifier configuration."""
+        """Handle the configuration of the humidifiers, one zone at a time."""
         _errors = {}
+        number = len(self.humidifier)
         if user_input is not None:
             self.humidifier[number] = user_input
-            if number < 2:
-                return await getattr(self, "async_step_humidifier_" + str(number + 1))()
-
-            return self._async_create_entry(
-                title=self.device_ieee,
-                data={
-                    CONF_DEVICE_IEEE: self.device_ieee,
-                },
-                options={
-                    "humidifier_0": self.humidifier[0],
-                    "humidifier_1": self.humidifier[1],
-                    "humidifier_2": self.humidifier[2],
-                },
-            )
+            number += 1
+            if number >= len(self.hum):
+                return self._async_create_entry(
+                    title=self.device_ieee,
+                    data={
+                        CONF_DEVICE_IEEE: self.device_ieee,
+                    },
+                    options={
+                        "humidifier_" + str(zone): options
+                        for zone, options in self.humidifier.items()
+                    },
+                )
 
         return self.async_show_form(
-            step_id="humidifier_" + str(number),
+            step_id="humidifier",
             data_schema=self.add_suggested_values_to_schema(
                 vol.Schema(XBEE_HUMIDIFIER_SCHEMA),
                 self.hum[number],
             ),
             errors=_errors,
+            description_placeholders={"number": str(number + 1)},
         )
 
-    async def async_step_humidifier_0(
-        self,
-        user_input: dict[str, Any] | None = None,
-    ) -> config_entries.FlowResult:
-        """Handle humidifier 0 configuration."""
-        return await self.async_step_humidifier(0, user_input)
-
-    async def async_step_humidifier_1(
-        self,
-        user_input: dict[str, Any] | None = None,
-    ) -> config_entries.FlowResult:
-        """Handle humidifier 1 configuration."""
-        return await self.async_step_humidifier(1, user_input)
-
-    async def async_step_humidifier_2(
-        self,
-        user_input: dict[str, Any] | None = None,
-    ) -> config_entries.FlowResult:
-        """Handle humidifier 2 configuration."""
-        return await self.async_step_humidifier(2, user_input)
-
 
 class XBeeHumidifierOptionsFlowHandler(
     XBeeHumidifierFlowHandler, config_entries.OptionsFlow
@@ -113,8 +92,14 @@ class XBeeHumidifierOptionsFlowHandler(
         self.device_ieee = self.config_entry.data[CONF_DEVICE_IEEE]
         self.humidifier = {}
 
+        coordinator = self.hass.data.get(DOMAIN, {}).get(self.config_entry.entry_id)
+        zone_count = (
+            coordinator.zone_count
+            if coordinator is not None
+            else sum(key.startswith("humidifier_") for key in self.config_entry.options)
+        )
         self.hum = {}
-        for number in range(0, 3):
+        for number in range(zone_count):
             self.hum[number] = {
                 CONF_SENSOR: self.config_entry.options.get(
                     "humidifier_" + str(number), {}
@@ -133,7 +118,7 @@ class XBeeHumidifierOptionsFlowHandler(
                 ).get(CONF_MAX_HUMIDITY),
             }
 
-        return await self.async_step_humidifier_0(user_input=user_input)
+        return await self.async_step_humidifier(user_input=user_input)
 
     def _async_create_entry(
         self, title: str, data: dict[str, Any], options: dict[str, Any]
@@ -172,15 +157,22 @@ class XBeeHumidifierConfigFlowHandler(
                 await self.async_set_unique_id(unique_id)
                 self._abort_if_unique_id_configured()
 
+                try:
+                    zones = await client.async_command("zones")
+                except RuntimeError:
+                    zones = DEFAULT_ZONES
+                humidity = await asyncio.gather(
+                    *(
+                        client.async_command(cmd, number)
+                        for number in range(zones["zones"])
+                        for cmd in ("target_hum", "sav_hum")
+                    )
+                )
                 self.hum = {}
-                for number in range(0, 3):
+                for number in range(zones["zones"]):
                     self.hum[number] = {
-                        CONF_TARGET_HUMIDITY: await client.async_command(
-                            "target_hum", number
-                        ),
-                        CONF_AWAY_HUMIDITY: await client.async_command(
-                            "sav_hum", number
-                        ),
+                        CONF_TARGET_HUMIDITY: humidity[number * 2],
+                        CONF_AWAY_HUMIDITY: humidity[number * 2 + 1],
                         CONF_MIN_HUMIDITY: 15,
                         CONF_MAX_HUMIDITY: 100,
                     }
@@ -191,7 +183,7 @@ class XBeeHumidifierConfigFlowHandler(
             else:
                 self.device_ieee = user_input[CONF_DEVICE_IEEE]
                 self.humidifier = {}
-                return await self.async_step_humidifier_0()
+                return await self.async_step_humidifier()
 
         return self.async_show_form(
             step_id="user",
@@ -6,6 +6,8 @@ import asyncio
 import datetime as dt
 import json
 import logging
+import random
+import struct
 
 from homeassistant.components.zha import DOMAIN as ZHA_DOMAIN
 from homeassistant.components.zha.websocket_api import (
@@ -15,6 +17,7 @@ from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import ATTR_COMMAND
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+from homeassistant.util import dt as dt_util
 from zha.application.const import (
     ATTR_CLUSTER_ID,
     ATTR_CLUSTER_TYPE,
@@ -28,6 +31,7 @@ from zha.application.const import (
 )
 
 from .const import DOMAIN
+from .log_catalog import LOG_CATALOG
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -39,6 +43,87 @@ XBEE_DATA_ENDPOINT = 0xE8
 
 REMOTE_COMMAND_TIMEOUT = 5
 DEFAULT_RETRY_COUNT = 5
+DEFAULT_MAX_IN_FLIGHT = 4
+REQUEST_ID_MAX = 0x10000
+
+CRASH_LOG_EVENT_LOG = 1
+CRASH_LOG_EVENT_RESET = 2
+CRASH_LOG_EVENT_STATS = 3
+CRASH_LOG_HEADER = struct.Struct("<BBIB")
+
+# Zones of the firmware that does not report them
+DEFAULT_ZONES = {"zones": 3, "valves": 4, "drop_valve": 3}
+
+TRACE_RECORD = struct.Struct("<HBB")
+TRACE_CYCLE_STATES = ("idle", "pumping", "pressure_drop_wait", "draining", "cooldown")
+TRACE_REQUESTS = {1: "start", 2: "stop", 3: "hard stop"}
+
+
+def expand_log_message(msg, args=None):
+    """Expand a catalogued log message id back to text."""
+    if not isinstance(msg, int):
+        return msg
+    fmt = LOG_CATALOG.get(msg)
+    if fmt is not None:
+        try:
+            return fmt.format(*args)
+        except (IndexError, KeyError, ValueError):
+            pass
+    return f"Log message {msg}: {args}"
+
+
+def decode_crash_log(data):
+    """Split the device crash log into (event, arg, time, payload) records."""
+    records = []
+    offset = 0
+    while offset + CRASH_LOG_HEADER.size <= len(data):
+        event, arg, time, length = CRASH_LOG_HEADER.unpack_from(data, offset)
+        offset += CRASH_LOG_HEADER.size
+        records.append((event, arg, time, data[offset : offset + length]))
+        offset += length
+    return records
+
+
+def _trace_event(event, arg):
+    """Describe a trace record."""
+    if event == 1:
+        if arg < len(TRACE_CYCLE_STATES):
+            return f"Duty cycle {TRACE_CYCLE_STATES[arg]}"
+    elif event == 2:
+        return f"Pump {'on' if arg else 'off'}"
+    elif event == 3:
+        return "Pump start blocked"
+    elif event == 4:
+        return f"Duty cycle {TRACE_REQUESTS.get(arg, arg)} requested"
+    elif event == 5:
+        return f"Zone {arg >> 1} {'on' if arg & 1 else 'off'}"
+    elif event == 6:
+        return f"Valve {arg - 1} opened" if arg else "All valves closed"
+    elif event == 7:
+        return f"Pressure drop valve {'open' if arg else 'closed'}"
+    elif event == 8:
+        return f"Humidifier {arg >> 1} {'on' if arg & 1 else 'off'}"
+    elif event == 9:
+        return f"Humidifier {arg} sensor not responding"
+    elif event == 10:
+        return f"Humidifier {arg} schedule applied"
+    return f"Event {event}: {arg}"
+
+
+def decode_trace(data, age=0):
+    """Turn the device trace into (seconds ago, event) records, oldest first."""
+    records = []
+    for offset in range(0, len(data) - TRACE_RECORD.size + 1, TRACE_RECORD.size):
+        records.append(TRACE_RECORD.unpack_from(data, offset))
+
+    timeline = []
+    time = age
+    for delta, event, arg in reversed(records):
+        timeline.append((round(time / 1000, 3), _trace_event(event, arg)))
+        # Delays over 32 s are recorded in seconds
+        time += (delta & 0x7FFF) * 1000 if delta & 0x8000 else delta
+    timeline.reverse()
+    return timeline
 
 
 class XBeeHumidifierApiClient:
@@ -48,16 +133,17 @@ class XBeeHumidifierApiClient:
         self,
         hass: HomeAssistant,
         device_ieee,
+        max_in_flight=DEFAULT_MAX_IN_FLIGHT,
     ) -> None:
         """Initialize the XBee Humidifier API Client."""
 
         self.hass = hass
         self.device_ieee = device_ieee
-        self._cmd_lock = {}
-        self._cmd_resp_lock = asyncio.Lock()
+        self._window = asyncio.Semaphore(max_in_flight)
         self._awaiting = {}
         self._callbacks = {}
         self._remove_listener = None
+        self._request_id = random.randrange(REQUEST_ID_MAX)
         self.start()
 
     def __del__(self):
@@ -131,42 +217,35 @@ class XBeeHumidifierApiClient:
         else:
             data = {"cmd": command}
 
+        # The same id is used for all retries so the device can replay the response
+        self._request_id = (self._request_id + 1) % REQUEST_ID_MAX
+        request_id = self._request_id
+        data["id"] = request_id
+
         data = json.dumps(data)
 
         _LOGGER.debug("data: %s", data)
 
-        if command not in self._cmd_lock:
-            self._cmd_lock[command] = asyncio.Lock()
-
-        async with self._cmd_lock[command]:
-            e = ValueError("Non-positive retry_count")
-            for i in range(retry_count):
-                if i:
-                    _LOGGER.debug("Retrying...")
-                try:
+        e = ValueError("Non-positive retry_count")
+        for i in range(retry_count):
+            if i:
+                _LOGGER.debug("Retrying...")
+            try:
+                async with self._window:
                     return await asyncio.wait_for(
-                        self._cmd(command, data),
+                        self._cmd(command, data, request_id),
                         timeout=REMOTE_COMMAND_TIMEOUT,
                     )
-                except TimeoutError:
-                    _LOGGER.error(f"No response to {command} command")
-                    try:
-                        del self._awaiting[command]
-                    except KeyError:
-                        pass
-                    e = TimeoutError(f"No response to {command} command")
-                except Exception as exp:
-                    _LOGGER.error(
-                        f"Error getting response for {command} command: {exp}"
-                    )
-                    e = exp
+            except TimeoutError:
+                _LOGGER.error(f"No response to {command} command")
+                e = TimeoutError(f"No response to {command} command")
+            except Exception as exp:
+                _LOGGER.error(f"Error getting response for {command} command: {exp}")
+                e = exp
 
-            raise e
-
-    async def _cmd(self, command, data):
-        if command in self._awaiting:
-            raise RuntimeError("Command is already executing")
+        raise e
 
+    async def _cmd(self, command, data, request_id):
         data = {
             ATTR_CLUSTER_ID: XBEE_DATA_CLUSTER,
             ATTR_CLUSTER_TYPE: CLUSTER_TYPE_IN,
@@ -179,37 +258,52 @@ class XBeeHumidifierApiClient:
 
         future = asyncio.Future()
 
-        self._awaiting[command] = future
+        self._awaiting[request_id] = (command, future)
 
         try:
             await self.hass.services.async_call(
                 ZHA_DOMAIN, SERVICE_ISSUE_ZIGBEE_CLUSTER_COMMAND, data, True
             )
+            return await future
         except Exception as e:
             _LOGGER.error(e)
-            future.set_exception(e)
-            del self._awaiting[command]
-
-        return await future
+            raise
+        finally:
+            if self._awaiting.get(request_id, (None, None))[1] is future:
+                del self._awaiting[request_id]
+
+    def _pop_awaiting(self, command, request_id):
+        """Find the pending command the response belongs to."""
+        if request_id is not None:
+            awaiting = self._awaiting.get(request_id)
+            if awaiting is None or awaiting[0] != command:
+                return None
+            return self._awaiting.pop(request_id)[1]
+
+        # Responses from firmware without request id support
+        for request_id, awaiting in self._awaiting.items():
+            if awaiting[0] == command:
+                del self._awaiting[request_id]
+                return awaiting[1]
+        return None
 
     async def _async_data_received(self, data):
         data = json.loads(data)
         for key, value in data.items():
-            if key == "nonce":
+            if key in ("nonce", "id"):
                 continue
             if key[-5:] == "_resp":
-                async with self._cmd_resp_lock:
-                    command = key[:-5]
-                    if command not in self._awaiting:
-                        continue
-                    future = self._awaiting.pop(command)
-                    if isinstance(value, dict) and "err" in value:
-                        future.set_exception(
-                            RuntimeError(f"Command response: {value['err']}")
-                        )
-                        continue
-                    _LOGGER.debug("%s response: %s", command, value)
-                    future.set_result(value)
+                command = key[:-5]
+                future = self._pop_awaiting(command, data.get("id"))
+                if future is None or future.done():
+                    continue
+                if isinstance(value, dict) and "err" in value:
+                    future.set_exception(
+                        RuntimeError(f"Command response: {value['err']}")
+                    )
+                    continue
+                _LOGGER.debug("%s response: %s", command, value)
+                future.set_result(value)
             elif key in self._callbacks:
                 if key != "log":
                     _LOGGER.debug("%s = %s", key, value)
@@ -247,9 +341,17 @@ class XBeeHumidifierDataUpdateCoordinator(DataUpdateCoordinator):
         self._device_reset = True
         self._callbacks = {}
         self._uptime = None
+        self._utc_offset = None
+        self.zone_count = None
+        self.valve_count = None
+        self.drop_valve = None
 
         async def async_log(data):
-            self._xbee_logger.log(data["sev"], data["msg"])
+            if isinstance(data, dict):
+                self._xbee_logger.log(data["sev"], data["msg"])
+                return
+            for record in data:
+                self._xbee_logger.log(record[0], expand_log_message(*record[1:]))
 
         self._remove_log_handler = self.client.add_subscriber("log", async_log)
 
@@ -330,8 +432,10 @@ class XBeeHumidifierDataUpdateCoordinator(DataUpdateCoordinator):
     async def async_config_entry_first_refresh(self) -> None:
         """Refresh data for the first time when a config entry is setup."""
         await super().async_config_entry_first_refresh()
-        self.unique_id = await self.client.async_command("unique_id")
-        version_info = await self.client.async_command("atcmd", "VL")
+        self.unique_id, version_info = await asyncio.gather(
+            self.client.async_command("unique_id"),
+            self.client.async_command("atcmd", "VL"),
+        )
         version_info = (
             ("Model: " + version_info)
             .replace(" RELE", "\rVR")
@@ -343,10 +447,117 @@ class XBeeHumidifierDataUpdateCoordinator(DataUpdateCoordinator):
         version_info = [v.split(": ", 1) for v in version_info]
         self.version_info = dict(version_info)
 
+    async def _async_read_zones(self):
+        """Read the number of zones and valves and the pressure drop valve."""
+        try:
+            zones = await self.client.async_command("zones")
+        except RuntimeError:
+            zones = DEFAULT_ZONES
+        self.zone_count = zones["zones"]
+        self.valve_count = zones["valves"]
+        self.drop_valve = zones["drop_valve"]
+
+    async def _async_sync_utc_offset(self):
+        """Send the local time offset used by the device schedules."""
+        offset = int(dt_util.now().utcoffset().total_seconds()) // 60
+        if offset == self._utc_offset:
+            return
+        try:
+            await self.client.async_command("utc_offset", offset)
+        except RuntimeError as e:
+            _LOGGER.debug(f"Cannot set UTC offset: {e}")
+        self._utc_offset = offset
+
+    def valve_zone(self, number):
+        """Return the zone served by the valve, None for the pressure drop valve."""
+        if number == self.drop_valve:
+            return None
+        zone = number if number < self.drop_valve else number - 1
+        return zone if zone < self.zone_count else None
+
+    async def async_read_crash_log(self):
+        """Read the persistent event log of the device."""
+        data = b""
+        while True:
+            chunk = await self.client.async_command("crashlog", len(data))
+            data += bytes.fromhex(chunk["data"])
+            if not chunk["data"] or len(data) >= chunk["size"]:
+                return decode_crash_log(data)
+
+    async def async_read_trace(self):
+        """Read the recent duty cycle and humidifier events of the device."""
+        data = b""
+        while True:
+            chunk = await self.client.async_command("trace", len(data))
+            data += bytes.fromhex(chunk["data"])
+            if not chunk["data"] or len(data) >= chunk["size"]:
+                return decode_trace(data, chunk["age"])
+
+    async def _async_report_crash_log(self):
+        """Log the events recorded before the last reset, return the last error."""
+        try:
+            records = await self.async_read_crash_log()
+        except Exception as e:
+            _LOGGER.debug(f"Cannot read crash log: {e}")
+            return None
+
+        resets = [
+            n for n, record in enumerate(records) if record[0] == CRASH_LOG_EVENT_RESET
+        ]
+        if len(resets) < 2:
+            return None
+
+        last_error = None
+        for event, arg, time, payload in records[resets[-2] + 1 : resets[-1]]:
+            if event == CRASH_LOG_EVENT_LOG:
+                try:
+                    msg = expand_log_message(*json.loads(payload))
+                except (TypeError, ValueError):
+                    _LOGGER.debug(f"Cannot decode crash log record: {payload!r}")
+                    msg = payload.decode(errors="replace")
+                self._xbee_logger.log(arg, f"Before reset, at {time}s: {msg}")
+                last_error = msg
+            elif event == CRASH_LOG_EVENT_STATS:
+                mem_free, mem_alloc = struct.unpack("<II", payload)
+                self._xbee_logger.debug(
+                    f"Before reset, at {time}s: {arg} tasks, "
+                    f"{mem_alloc} bytes allocated, {mem_free} bytes free"
+                )
+        return last_error
+
+    async def _async_query(self, queries, optional=()):
+        """
+        Issue independent commands concurrently and collect their results.
+
+        The optional commands are missing from older firmware, their result is None
+        then.
+        """
+        results = await asyncio.gather(
+            *(
+                (
+                    self._async_optional_command(*args)
+                    if key in optional
+                    else self.client.async_command(*args)
+                )
+                for key, args in queries.items()
+            )
+        )
+        return dict(zip(queries, results, strict=True))
+
+    async def _async_optional_command(self, *args):
+        """Issue the command, return None if the firmware does not know it."""
+        try:
+            return await self.client.async_command(*args)
+        except RuntimeError as e:
+            _LOGGER.debug(f"Cannot read {args[0]}: {e}")
+            return None
+
     @callback
     async def async_update_data(self):
         """Update data."""
         await self.client.async_command("bind")
+        if self.zone_count is None:
+            await self._async_read_zones()
         data = {"humidifier": {}, "valve": {}}
         if self._device_reset and self._uptime is not None:
             data["uptime"] = self._uptime
@@ -354,40 +565,44 @@ class XBeeHumidifierDataUpdateCoordinator(DataUpdateCoordinator):
             data["uptime"] = await self.client.async_command("uptime")
             self._timestamp = dt.datetime.now(tz=dt.timezone.utc).timestamp()
         self._uptime = None
-        data["reset_cause"] = await self.client.async_command("reset_cause")
-        data["pump"] = await self.client.async_command("pump")
-        data["fan"] = await self.client.async_command("fan")
-        data["aux_led"] = await self.client.async_command("aux_led")
-        data["pump_temp"] = await self.client.async_command("pump_temp")
-        data["pressure_in"] = await self.client.async_command("pressure_in")
-        data["pump_speed"] = await self.client.async_command("pump_speed")
-        for number in range(0, 4):
-            data["valve"][number] = await self.client.async_command("valve", number)
+        data.update(
+            await self._async_query(
+                {
+                    "reset_cause": ("reset_cause",),
+                    "pump": ("pump",),
+                    "fan": ("fan",),
+                    "aux_led": ("aux_led",),
+                    "pump_temp": ("pump_temp",),
+                    "pressure_in": ("pressure_in",),
+                    "pressure_in_variance": ("pressure_in_variance",),
+                    "pump_speed": ("pump_speed",),
+                    "pump_stats": ("pump_stats",),
+                },
+                optional=("pressure_in_variance", "pump_stats"),
+            )
+        )
+        data["valve"] = await self._async_query(
+            {number: ("valve", number) for number in range(self.valve_count)}
+        )
         if data["uptime"] > 0:
             data["pump_block"] = await self.client.async_command("pump_block")
-            for number in range(0, 3):
-                data["humidifier"][number] = {}
-                data["humidifier"][number]["sav_hum"] = await self.client.async_command(
-                    "sav_hum", number
-                )
-                data["humidifier"][number]["available"] = (
-                    await self.client.async_command("available", number)
-                )
-                data["humidifier"][number]["working"] = await self.client.async_command(
-                    "zone", number
-                )
-                data["humidifier"][number]["is_on"] = await self.client.async_command(
-                    "hum", number
-                )
-                data["humidifier"][number]["cur_hum"] = await self.client.async_command(
-                    "cur_hum", number
-                )
-                data["humidifier"][number]["target_hum"] = (
-                    await self.client.async_command("target_hum", number)
-                )
-                data["humidifier"][number]["mode"] = await self.client.async_command(
-                    "mode", number
+            humidifiers = await asyncio.gather(
+                *(
+                    self._async_query(
+                        {
+                            "sav_hum": ("sav_hum", number),
+                            "available": ("available", number),
+                            "working": ("zone", number),
+                            "is_on": ("hum", number),
+                            "cur_hum": ("cur_hum", number),
+                            "target_hum": ("target_hum", number),
+                            "mode": ("mode", number),
+                        }
+                    )
+                    for number in range(self.zone_count)
                 )
+            )
+            data["humidifier"] = dict(enumerate(humidifiers))
         else:
             if not self._device_reset:
                 self._device_reset = True
@@ -395,6 +610,9 @@ class XBeeHumidifierDataUpdateCoordinator(DataUpdateCoordinator):
             value = int(self._timestamp + data["uptime"] + 0.5)
             await self.client.async_command("uptime", value)
             data["new_uptime"] = value
+            self._utc_offset = None  # Lost with the reset
+            data["last_error"] = await self._async_report_crash_log()
             self._device_reset = False
 
+        await self._async_sync_utc_offset()
         return data
@@ -0,0 +1,34 @@
+"""Diagnostics support for xbee_humidifier."""
+
+from __future__ import annotations
+
+import logging
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+    try:
+        trace = await coordinator.async_read_trace()
+    except Exception as e:
+        _LOGGER.debug(f"Cannot read trace: {e}")
+        trace = None
+    return {
+        "version_info": coordinator.version_info,
+        "data": coordinator.data,
+        "trace": (
+            None
+            if trace is None
+            else [{"seconds_ago": time, "event": event} for time, event in trace]
+        ),
+    }
@@ -41,8 +41,8 @@ async def async_setup_entry(hass, entry, async_add_entities):
     """Set up the humidifier platform."""
     humidifiers = []
     coordinator = hass.data[DOMAIN][entry.entry_id]
-    for number in range(0, 3):
-        config = entry.options["humidifier_" + str(number)]
+    for number in range(coordinator.zone_count):
+        config = entry.options.get("humidifier_" + str(number), {})
         sensor_entity_id = config.get(CONF_SENSOR)
         target_humidity = config.get(CONF_TARGET_HUMIDITY)
         away_humidity = config.get(CONF_AWAY_HUMIDITY)
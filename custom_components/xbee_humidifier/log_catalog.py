@@ -0,0 +1,64 @@
+"""Log message catalog generated by flash/tools/strip_logging.py."""
+
+# Do not edit or renumber, the ids are used by the deployed firmware
+LOG_CATALOG = {
+    1: "Main loop started",
+    2: "Cancelling existing duty cycle schedule",
+    3: "Humidifier {} turned on, scheduling duty cycle start",
+    4: "Humidifier {} turned on, but its zone is off",
+    5: "Humidifier {} turned off, scheduling duty cycle stop",
+    6: "Zone turned on, scheduling duty cycle start",
+    7: "All zones turned off, scheduling duty cycle stop",
+    8: "Pump blocking turned on, scheduling duty cycle stop",
+    9: "Pump blocking turned off, scheduling duty cycle start",
+    10: "Pump start blocked",
+    11: "Cancelling existing pump timeout schedule",
+    12: "Cancelling pressure drop start",
+    13: "Cancelling pressure drop stop",
+    14: "Scheduling duty cycle stop after timeout",
+    15: "Scheduling duty cycle start after timeout",
+    16: "Scheduling pressure drop after timeout",
+    17: "Cancelling schedule for pressure drop cycle",
+    18: "Cancelling existing schedule to close all valves",
+    19: "Pressure drop valve opened, scheduling closing all valves",
+    20: "Opening pressure drop valve",
+    21: "Closing all valves",
+    22: "Pump timeout, cancelling it",
+    23: "Stopping the cycle",
+    24: "Starting the cycle",
+    25: "The pump is already not running",
+    26: "Stopping the pump",
+    27: "The pump is already running",
+    28: "All zones are off, not starting the pump",
+    29: "Setting up switches",
+    30: "Starting the pump",
+    31: "Sensor has not been updated for {} seconds",
+    32: "Sensor is stalled, call the emergency stop",
+    33: "{}: {}: {}",
+    34: "Obtained current and target humidity. Humidifier active. {}, {}",
+    35: "Mainloop exception: {}: {}",
+    36: "Mainloop exited",
+    37: "callback error for {}",
+    38: "{}: {}",
+    39: "Replaying response to {} {}",
+    40: "Exception on transmit: {}: {}",
+    41: "mainloop: error with {}",
+    42: "mainloop: SystemExit: {}",
+    43: "Failed to update relay state",
+    44: "Failed to get temperature",
+    45: "Slowing down the pump",
+    46: "Speeding the pump up again",
+    47: "Starting the pump softly",
+    48: "Ramp interrupted by a new value",
+    49: "Entering {} state",
+    50: "Pump timeout, stopping the cycle",
+    51: "Pump timeout, starting the cycle",
+    52: "Zone {} turned on, joining the run",
+    53: "Zone {} turned off, closing its valve",
+    54: "Zone run complete, closing its valves",
+    55: "Valve slot for zone {}",
+    56: "Pressure dropped to {}",
+    57: "Applying schedule entry {}",
+    58: "No zone left in the run, stopping the cycle",
+    59: "Pump run timed out, letting the pump stop",
+}
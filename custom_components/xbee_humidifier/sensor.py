@@ -10,7 +10,7 @@ from homeassistant.components.sensor import (
     SensorEntityDescription,
     SensorStateClass,
 )
-from homeassistant.const import EntityCategory
+from homeassistant.const import EntityCategory, UnitOfTime
 from homeassistant.core import callback
 
 from .const import DOMAIN
@@ -18,6 +18,8 @@ from .coordinator import XBeeHumidifierDataUpdateCoordinator
 from .entity import XBeeHumidifierEntity
 
 ATTR_RESET_CAUSE = "reset_cause"
+ATTR_LAST_ERROR = "last_error"
+ATTR_ADC_VARIANCE = "adc_variance"
 BROWNOUT_RESET = "brownout"
 LOCKUP_RESET = "lockup"
 PWRON_RESET = "power on"
@@ -27,6 +29,8 @@ SOFT_RESET = "soft reset"
 UNKNOWN_RESET = "unknown cause {}"
 UNKNOWN = "unknown"
 
+PUMP_STATS = "pump_stats"
+
 
 async def async_setup_entry(hass, entry, async_add_entities):
     """Set up the sensor platform."""
@@ -62,7 +66,7 @@ async def async_setup_entry(hass, entry, async_add_entities):
         state_class=SensorStateClass.MEASUREMENT,
     )
     sensors.append(
-        XBeeHumidifierSensor(
+        XBeeHumidifierPressureSensor(
             name="pressure_in",
             coordinator=coordinator,
             entity_description=entity_description,
@@ -92,9 +96,57 @@ async def async_setup_entry(hass, entry, async_add_entities):
         )
     )
 
+    for key, name, icon, is_time in (
+        ("pump_time", "Pump Run Time", "mdi:timer-outline", True),
+        ("pump_starts", "Pump Starts", "mdi:counter", False),
+        ("pump_timeouts", "Pump Timeouts", "mdi:timer-alert-outline", False),
+        ("blocked_starts", "Blocked Pump Starts", "mdi:pump-off", False),
+        ("drop_time", "Pressure Drop Time", "mdi:timer-outline", True),
+    ):
+        sensors.append(
+            XBeeHumidifierStatsSensor(
+                name=key,
+                coordinator=coordinator,
+                entity_description=_stats_description(key, name, icon, is_time),
+            )
+        )
+
+    for number in range(coordinator.valve_count):
+        sensors.append(
+            XBeeHumidifierStatsSensor(
+                name=f"valve_{number}_time",
+                number=coordinator.valve_zone(number),
+                coordinator=coordinator,
+                entity_description=_stats_description(
+                    f"valve_{number + 1}_time",
+                    (
+                        "Valve Open Time"
+                        if number != coordinator.drop_valve
+                        else "Pressure Drop Valve Open Time"
+                    ),
+                    "mdi:pipe-valve",
+                    True,
+                ),
+            )
+        )
+
     async_add_entities(sensors)
 
 
+def _stats_description(key, name, icon, is_time):
+    """Describe a pump counter sensor."""
+    return SensorEntityDescription(
+        key="xbee_humidifier_" + key,
+        name=name,
+        has_entity_name=True,
+        icon=icon,
+        device_class=SensorDeviceClass.DURATION if is_time else None,
+        entity_category=EntityCategory.DIAGNOSTIC,
+        native_unit_of_measurement=UnitOfTime.SECONDS if is_time else None,
+        state_class=SensorStateClass.TOTAL_INCREASING,
+    )
+
+
 class XBeeHumidifierSensor(XBeeHumidifierEntity, SensorEntity):
     """Representation of an XBee Humidifier sensors."""
 
@@ -139,6 +191,17 @@ class XBeeHumidifierSensor(XBeeHumidifierEntity, SensorEntity):
         self.schedule_update_ha_state()
 
 
+class XBeeHumidifierPressureSensor(XBeeHumidifierSensor):
+    """Representation of an XBee Humidifier pressure sensor."""
+
+    @property
+    def extra_state_attributes(self):
+        """Return the sample variance of the raw ADC readings."""
+        return {
+            ATTR_ADC_VARIANCE: self.coordinator.data.get(self._name + "_variance"),
+        }
+
+
 class XBeeHumidifierUptimeSensor(XBeeHumidifierSensor):
     """Representation of an XBee Humidifier Uptime sensor."""
 
@@ -152,11 +215,15 @@ class XBeeHumidifierUptimeSensor(XBeeHumidifierSensor):
         """Initialize the switch class."""
         super().__init__(name, coordinator, entity_description, conversion)
         self._attr_reset_cause = UNKNOWN
+        self._attr_last_error = None
 
     @property
     def extra_state_attributes(self):
         """Return the optional state attributes."""
-        return {ATTR_RESET_CAUSE: self._attr_reset_cause}
+        return {
+            ATTR_RESET_CAUSE: self._attr_reset_cause,
+            ATTR_LAST_ERROR: self._attr_last_error,
+        }
 
     @callback
     def _handle_coordinator_update(self) -> None:
@@ -181,4 +248,36 @@ class XBeeHumidifierUptimeSensor(XBeeHumidifierSensor):
             except KeyError:
                 self._attr_reset_cause = UNKNOWN_RESET.format(reset_cause)
 
+        if "last_error" in self.coordinator.data:
+            self._attr_last_error = self.coordinator.data["last_error"]
+
+        self.schedule_update_ha_state()
+
+
+class XBeeHumidifierStatsSensor(XBeeHumidifierEntity, SensorEntity):
+    """Representation of an XBee Humidifier pump counter."""
+
+    def __init__(
+        self,
+        name,
+        coordinator: XBeeHumidifierDataUpdateCoordinator,
+        entity_description: SensorEntityDescription,
+        number=None,
+    ) -> None:
+        """Initialize the sensor class."""
+        super().__init__(coordinator, number)
+        self.entity_description = entity_description
+        self._name = name
+        self._attr_unique_id = coordinator.unique_id + name
+
+    async def async_added_to_hass(self):
+        """Run when entity about to be added."""
+        await super().async_added_to_hass()
+        self._handle_coordinator_update()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Handle updated data from the coordinator."""
+        stats = self.coordinator.data.get(PUMP_STATS) or {}
+        self._attr_native_value = stats.get(self._name)
         self.schedule_update_ha_state()
@@ -20,10 +20,10 @@ async def async_setup_entry(hass, entry, async_add_entities):
     """Set up the switch platform."""
     valves = []
     coordinator = hass.data[DOMAIN][entry.entry_id]
-    for number in range(0, 4):
+    for number in range(coordinator.valve_count):
         entity_description = ValveEntityDescription(
             key="xbee_humidifier_valve_" + str(number + 1),
-            name="Valve" if number != 3 else "Pressure Drop Valve",
+            name="Valve" if number != coordinator.drop_valve else "Pressure Drop Valve",
             has_entity_name=True,
             icon="mdi:pipe-valve",
             device_class=ValveDeviceClass.WATER,
@@ -59,7 +59,7 @@ class XBeeHumidifierValve(XBeeHumidifierEntity, ValveEntity):
         self._attr_unique_id = coordinator.unique_id + (
             name if number is None else name + str(number)
         )
-        super().__init__(coordinator, number if number != 3 else None)
+        super().__init__(coordinator, coordinator.valve_zone(number))
         self._name = name
         self._number = number
 
@@ -4,11 +4,13 @@ from gc import collect, mem_alloc, mem_free
 
 import config
 from commands import HumidifierCommands
-from dutycycle import DutyCycle
+from dutycycle import COUNTERS_PATH, DutyCycle
 from humidifier import Humidifier
 from lib import logging
 from lib.core import Sensor, Switch
+from lib.crashlog import crash_log
 from lib.mainloop import main_loop
+from machine import reset_cause
 from micropython import kbd_intr
 
 collect()
@@ -18,14 +20,16 @@ _LOGGER = logging.getLogger(__name__)
 
 def setup(debug):
     """Initialize the application."""
-    zone = [Switch() for x in range(3)]
-    sensor = [Sensor() for x in range(3)]
-    available = [Switch() for x in range(3)]
+    crash_log.start(reset_cause())
+
+    zone = [Switch() for x in range(config.zone_count)]
+    sensor = [Sensor() for x in range(config.zone_count)]
+    available = [Switch() for x in range(config.zone_count)]
 
     if debug:
         print("\nTOSR0X not detected, enabling emulation")
 
-        for x in range(3):
+        for x in range(config.zone_count):
             zone[x].subscribe(
                 (lambda n: lambda v: print("ZONE{} = {}".format(n, v)))(x)
             )
@@ -37,7 +41,7 @@ def setup(debug):
             )
 
         config.pump.subscribe(lambda v: print("PUMP = {}".format(v)))
-        for x in range(4):
+        for x in range(len(config.valve_switch)):
             config.valve_switch[x].subscribe(
                 (lambda n: lambda v: print("VALVE{} = {}".format(n, v)))(x)
             )
@@ -60,8 +64,10 @@ def setup(debug):
             wet_tolerance=0,
             away_humidity=35,
             sensor_stale_duration=120 * 60,
+            number=x,
+            pid=config.humidity_pid,
         )
-        for x in range(3)
+        for x in range(config.zone_count)
     ]
     collect()
 
@@ -69,7 +75,7 @@ def setup(debug):
     collect()
 
     if debug:
-        for x in range(3):
+        for x in range(config.zone_count):
             humidifier[x].subscribe(
                 (lambda n: lambda v: print("HUMIDIFIER{} = {}".format(n, v)))(x)
             )
@@ -77,7 +83,7 @@ def setup(debug):
         pump_block.subscribe(lambda v: print("PUMP_BLOCK = {}".format(v)))
         collect()
 
-    DutyCycle(
+    duty_cycle = DutyCycle(
         config.pump,
         humidifier,
         zone,
@@ -87,6 +93,15 @@ def setup(debug):
         config.pressure_drop_delay,
         config.pressure_drop_time,
         config.idle_time,
+        config.valve_bank,
+        config.pump_speed,
+        config.pump_ramp_rate,
+        config.demand_run_time,
+        config.valve_slot_time,
+        COUNTERS_PATH,
+        config.pressure_in,
+        config.pressure_drop_threshold,
+        config.drop_valve,
     )
     collect()
 
@@ -96,6 +111,7 @@ def setup(debug):
         available,
         zone,
         pump_block,
+        duty_cycle,
     )
     collect()
 
@@ -8,9 +8,14 @@ from micropython import opt_level
 from xbee import atcmd
 
 _bundle_list = [
+    "lib/clock.mpy",
     "lib/core.mpy",
+    "lib/counters.mpy",
+    "lib/crashlog.mpy",
     "lib/logging.mpy",
     "lib/mainloop.mpy",
+    "lib/pid.mpy",
+    "lib/trace.mpy",
     "lib/xbeepin.mpy",
     "__init__.mpy",
     "commands.mpy",
@@ -16,6 +16,7 @@ class HumidifierCommands(Commands):
         available,
         zone,
         pump_block,
+        duty_cycle=None,
     ):
         """Init the module."""
         super().__init__()
@@ -24,14 +25,15 @@ class HumidifierCommands(Commands):
         self._available = available
         self._zone = zone
         self._pump_block = pump_block
+        self._duty_cycle = duty_cycle
 
         self._binds = {
             "pump": {},
             "pump_temp": {},
             "pressure_in": {},
-            "available": [{}, {}, {}],
-            "zone": [{}, {}, {}],
-            "valve": [{}, {}, {}, {}],
+            "available": [{} for x in zone],
+            "zone": [{} for x in zone],
+            "valve": [{} for x in config.valve_switch],
         }
 
     def __del__(self):
@@ -47,6 +49,14 @@ class HumidifierCommands(Commands):
         """Get humidifier 'available' attribute."""
         return self._available[number].state
 
+    def cmd_zones(self, sender_eui64=None):
+        """Get the number of zones and valves and the pressure drop valve."""
+        return {
+            "zones": len(self._zone),
+            "valves": len(config.valve_switch),
+            "drop_valve": config.drop_valve,
+        }
+
     def cmd_zone(self, sender_eui64, number):
         """Get humidifier zone state."""
         return self._zone[number].state
@@ -72,6 +82,13 @@ class HumidifierCommands(Commands):
         self._humidifier[number].mode = mode
         return "OK"
 
+    def cmd_schedule(self, sender_eui64, number, schedule=None):
+        """Get or set the humidifier schedule."""
+        if schedule is None:
+            return self._humidifier[number].schedule
+        self._humidifier[number].schedule = schedule
+        return "OK"
+
     def cmd_cur_hum(self, sender_eui64, number, state=None):
         """Get or set current humidity."""
         if state is None:
@@ -83,6 +100,10 @@ class HumidifierCommands(Commands):
         """Get current inbound pressure."""
         return config.pressure_in.state
 
+    def cmd_pressure_in_variance(self, sender_eui64=None):
+        """Get the sample variance of the last inbound pressure burst."""
+        return getattr(config.pressure_in, "variance", None)
+
     def cmd_pump(self, sender_eui64=None, state=None):
         """Get or set the pump state."""
         if state is None:
@@ -97,11 +118,14 @@ class HumidifierCommands(Commands):
         self._pump_block.state = state
         return "OK"
 
-    def cmd_pump_speed(self, sender_eui64=None, state=None):
-        """Get or set the pump speed."""
+    def cmd_pump_speed(self, sender_eui64=None, state=None, rate=None):
+        """Get or set the pump speed, ramp to it at rate per second if given."""
         if state is None:
             return config.pump_speed.state
-        config.pump_speed.state = state
+        if rate:
+            config.pump_speed.ramp(state, rate)
+        else:
+            config.pump_speed.state = state
         return "OK"
 
     def cmd_fan(self, sender_eui64=None, state=None):
@@ -118,8 +142,18 @@ class HumidifierCommands(Commands):
         config.aux_led.state = state
         return "OK"
 
+    def cmd_cycle_state(self, sender_eui64=None):
+        """Get the duty cycle state."""
+        return self._duty_cycle.state if self._duty_cycle is not None else None
+
+    def cmd_pump_stats(self, sender_eui64=None):
+        """Get the pump and valve counters."""
+        return self._duty_cycle.stats() if self._duty_cycle is not None else None
+
     def cmd_pump_temp(self, sender_eui64=None):
-        """Get current pump temperature."""
+        """Get the last pump temperature, None if outdated."""
+        if config.pump_temp.stale:
+            return None
         return config.pump_temp.state
 
     def cmd_valve(self, sender_eui64, number, state=None):
@@ -142,14 +176,14 @@ class HumidifierCommands(Commands):
         bind(config.pump_temp, self._binds["pump_temp"], "pump_temp")
         bind(config.pump, self._binds["pump"], "pump")
         bind(config.pressure_in, self._binds["pressure_in"], "pressure_in")
-        for number in range(4):
+        for number in range(len(config.valve_switch)):
             bind(
                 config.valve_switch[number],
                 self._binds["valve"][number],
                 "valve_{}".format(number),
             )
 
-        for number in range(3):
+        for number in range(len(self._zone)):
             bind(
                 self._available[number],
                 self._binds["available"][number],
@@ -177,10 +211,10 @@ class HumidifierCommands(Commands):
         unbind(config.pump_temp, self._binds["pump_temp"])
         unbind(config.pump, self._binds["pump"])
         unbind(config.pressure_in, self._binds["pressure_in"])
-        for number in range(4):
+        for number in range(len(config.valve_switch)):
             unbind(config.valve_switch[number], self._binds["valve"][number])
 
-        for number in range(3):
+        for number in range(len(self._zone)):
             unbind(self._available[number], self._binds["available"][number])
             unbind(self._zone[number], self._binds["zone"][number])
         return "OK"
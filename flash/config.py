@@ -5,37 +5,49 @@ from gc import collect
 from micropython import const
 from tosr0x import tosr0x_version
 
+zone_count = const(3)
+drop_valve = const(3)  # The pressure drop valve, the others serve the zones in order
 pump_on_timeout = const(10 * 60)
 pressure_drop_delay = const(8)
 pressure_drop_time = const(52)
+pressure_drop_threshold = None  # pressure_in reading, 714 for about 0.2 bar
 idle_time = const(2 * 60)
+pump_ramp_rate = None  # pump_speed change per second, e.g. 200
+demand_run_time = None  # Pump run per percent of humidity deficit, e.g. 60
+valve_slot_time = None  # Seconds per zone valve slot, e.g. 30
+humidity_pid = None  # (kp, ki, kd) to stop on the PID demand, kd predicts the lag
 
 debug = False
 
 if tosr0x_version() is None:
-    from lib.core import Sensor, Switch
+    from lib.core import Number, Sensor, Switch, SwitchBank
 
     collect()
     debug = True
     pump = Switch()
     pump_temp = Sensor(37)
-    valve_switch = [Switch() for x in range(4)]
+    valve_switch = [Switch() for x in range(zone_count + 1)]
+    valve_bank = SwitchBank(valve_switch)
     pressure_in = Sensor(1234)
     pressure_out = Sensor(59)  # Ignored for now
     water_temperature = Sensor(14)  # Ignored for now
     aux_din = Switch(False)  # Ignored for now
     aux_led = Switch(False)
-    pump_speed = Sensor(255)
+    pump_speed = Number(255)
     fan = Switch(False)
 else:
     from lib.xbeepin import AnalogInput, AnalogOutput, DigitalInput, DigitalOutput
     from machine import Pin
-    from tosr import tosr_switch as valve_switch, tosr_temp as pump_temp  # noqa: F401
+    from tosr import (  # noqa: F401
+        tosr_switch as valve_switch,
+        tosr_temp as pump_temp,
+        valve_bank,
+    )
 
     collect()
     Pin("D0", mode=Pin.ALT, alt=Pin.AF0_COMMISSION)
-    pressure_in = AnalogInput("D1")
-    pressure_out = AnalogInput("D2")
+    pressure_in = AnalogInput("D1", samples=5, median=True, decimation=2)
+    pressure_out = AnalogInput("D2", samples=5, median=True)
     water_temperature = AnalogInput("D3")
     aux_din = DigitalInput("D4")
     Pin("D5", mode=Pin.ALT, alt=Pin.AF5_ASSOC_IND)
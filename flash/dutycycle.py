@@ -1,15 +1,81 @@
 """Implementation of a slow PWM for humidifiers."""
 
+from time import ticks_add, ticks_diff, ticks_ms
+
 from lib import logging
-from lib.mainloop import main_loop
+from lib.core import SwitchBank
+from lib.counters import Counters
+from lib.mainloop import Task, main_loop
+from lib.trace import (
+    EV_BLOCKED,
+    EV_DROP_VALVE,
+    EV_PUMP,
+    EV_REQUEST,
+    EV_STATE,
+    EV_VALVES,
+    EV_ZONE,
+    trace,
+)
 from micropython import const
 
 _LOGGER = logging.getLogger(__name__)
 
+IDLE = const(0)
+PUMPING = const(1)
+PRESSURE_DROP_WAIT = const(2)
+DRAINING = const(3)
+COOLDOWN = const(4)
+
+STATES = ("idle", "pumping", "pressure_drop_wait", "draining", "cooldown")
+
+_PUMP_ON = const(0)
+_PUMP_OFF = const(1)
+_VALVE_OPEN = const(2)
+_VALVE_CLOSED = const(3)
+
+# The next state by the current state and the event, None to ignore the event
+_TRANSITIONS = (
+    # Pump on, pump off, drop valve open, drop valve closed
+    (PUMPING, None, DRAINING, None),  # IDLE
+    (None, PRESSURE_DROP_WAIT, None, None),  # PUMPING
+    (PUMPING, None, DRAINING, None),  # PRESSURE_DROP_WAIT
+    (PUMPING, None, None, COOLDOWN),  # DRAINING
+    (PUMPING, None, DRAINING, None),  # COOLDOWN
+)
+
+_MIN_RUN_MS = const(60000)
+_MIN_SLOT_MS = const(10000)  # Limits the relay switching rate
+
+COUNTERS = (
+    "pump_time",
+    "pump_starts",
+    "pump_timeouts",
+    "blocked_starts",
+    "drop_time",
+)  # Followed by "valve_<number>_time" for every valve
+COUNTERS_PATH = "counters.bin"
+
+_PUMP_TIME = const(0)
+_PUMP_STARTS = const(1)
+_PUMP_TIMEOUTS = const(2)
+_BLOCKED_STARTS = const(3)
+_DROP_TIME = const(4)
+_VALVE_TIME = const(5)
+
+_DROP_POLL_MS = const(500)
+_SAMPLE_MS = const(5000)
+_SAVE_MS = const(600000)
+
+_START = const(1)
+_STOP = const(2)
+_HARD_STOP = const(3)
+
 
 class DutyCycle:
     """Slow PWM for humidifiers."""
 
+    _atexit = None
+
     def __init__(
         self,
         pump,
@@ -21,13 +87,38 @@ class DutyCycle:
         pressure_drop_delay,
         pressure_drop_time,
         idle_time,
+        valve_bank=None,
+        pump_speed=None,
+        ramp_rate=None,
+        demand_run_time=None,
+        valve_slot_time=None,
+        counters_path=None,
+        pressure=None,
+        drop_pressure=None,
+        drop_valve=None,
     ):
         """Init the class."""
         self._pump = pump
         self._humidifier = humidifiers
         self._zone = zone
         self._valve_switch = valve_switch
+        # The pressure drop valve follows the zone valves unless given
+        self._drop_valve = len(zone) if drop_valve is None else drop_valve
+        if len(valve_switch) <= len(zone):
+            raise ValueError("{} zones need {} valves".format(len(zone), len(zone) + 1))
+        if not 0 <= self._drop_valve < len(valve_switch):
+            raise ValueError("Invalid pressure drop valve {}".format(drop_valve))
+        self._zone_valve = [
+            number for number in range(len(valve_switch)) if number != self._drop_valve
+        ][: len(zone)]
+        self._valve_bank = (
+            valve_bank if valve_bank is not None else SwitchBank(valve_switch)
+        )
         self._pump_block = pump_block
+        self._pump_speed = pump_speed
+        self._ramp_rate = ramp_rate if pump_speed is not None else None
+        self._speed = None
+        self._stopping = False
 
         self._pump_on_timeout_ms = const(pump_on_timeout * 1000)
         self._pressure_drop_delay_ms = const(pressure_drop_delay * 1000)
@@ -37,17 +128,62 @@ class DutyCycle:
             + self._pressure_drop_delay_ms
             + self._pressure_drop_time_ms
         )
+        self._idle_time_ms = const(idle_time * 1000)
+        # End the pressure drop once the pressure falls to drop_pressure
+        self._pressure = pressure
+        self._drop_pressure = drop_pressure if pressure is not None else None
+        self._drain_start = None
+        # Pump run per percent of the humidity deficit, None to run until timeout
+        self._demand_run_ms = demand_run_time * 1000 if demand_run_time else None
+        self._run_start = None
+        self._deadline = [None] * len(self._zone)
+        # Open one zone at a time in slots weighted by the deficit
+        self._slot_ms = (
+            max(valve_slot_time * 1000, _MIN_SLOT_MS) if valve_slot_time else None
+        )
+        self._slot_zone = None
+        self._slot_end = None
+        self._credit = [0] * len(self._zone)
 
         self._pump.state = False
 
-        self._pump_timeout = None
-        self._close_valves = None
-        self._pressure_drop = None
-        self._loop_schedule = None
+        self._state = IDLE
+        self._pump_off_time = None
+        self._timeouts = (
+            None,
+            self._pump_on_timeout_ms,
+            self._pressure_drop_delay_ms,
+            (
+                self._pressure_drop_time_ms
+                if self._drop_pressure is None
+                else min(_DROP_POLL_MS, self._pressure_drop_time_ms)
+            ),
+            None,  # Counted from the pump stop
+        )
+        self._actions = (
+            None,
+            self._run_step,
+            self._start_pressure_drop,
+            self._drain_step,
+            self._pump_off_timeout,
+        )
+        self._counters = Counters(
+            COUNTERS
+            + tuple("valve_{}_time".format(x) for x in range(len(valve_switch))),
+            counters_path,
+        )
+        self._since = ticks_ms()
+        self._saved = self._since
+        self._stats_task = main_loop.schedule_task(
+            lambda: self._sample(), period=_SAMPLE_MS
+        )
+        self._timer = Task(lambda: self._actions[self._state]())
+        self._request = None
+        self._request_task = Task(lambda: self._run_request())
 
         self._pump_subscriber = self._pump.subscribe(lambda x: self._pump_changed(x))
-        self._valve_subscriber = self._valve_switch[3].subscribe(
-            lambda x: self._pressure_drop_valve_changed(x)
+        self._valve_subscriber = self._valve_switch[self._drop_valve].subscribe(
+            lambda x: self._drop_valve_changed(x)
         )
         self._block_subscriber = self._pump_block.subscribe(
             lambda x: self._pump_block_changed(x)
@@ -71,20 +207,23 @@ class DutyCycle:
                 zone.subscribe((lambda n: lambda x: self._zone_changed(n, x))(number))
             )
 
-        self._atexit = main_loop.atexit(lambda: self.stop_cycle())
+        self._atexit = main_loop.atexit(lambda: self._exit())
 
         self.start_cycle()
 
     def __del__(self):
         """Cancel callbacks."""
+        if self._atexit is None:
+            return  # The init has failed
         main_loop.remove_atexit(self._atexit)
-        self.stop_cycle()
-        main_loop.remove_task(self._loop_schedule)
-        main_loop.remove_task(self._pump_timeout)
-        main_loop.remove_task(self._close_valves)
-        main_loop.remove_task(self._pressure_drop)
+        self.stop_cycle(soft=False)
+        main_loop.remove_task(self._request_task)
+        main_loop.remove_task(self._timer)
+        main_loop.remove_task(self._stats_task)
+        if self._ramp_rate:
+            self._pump_speed.stop_ramp()
         self._pump.unsubscribe(self._pump_subscriber)
-        self._valve_switch[3].unsubscribe(self._valve_subscriber)
+        self._valve_switch[self._drop_valve].unsubscribe(self._valve_subscriber)
         self._pump_block.unsubscribe(self._block_subscriber)
         for number, subscriber in enumerate(self._humidifier_subscriber):
             self._humidifier[number].unsubscribe(subscriber)
@@ -92,192 +231,431 @@ class DutyCycle:
             self._zone[number].unsubscribe(subscriber)
         self._close_all_valves()
 
+    @property
+    def state(self):
+        """Return the name of the current state."""
+        return STATES[self._state]
+
+    def stats(self):
+        """Return the cumulative counters."""
+        self._account()
+        return self._counters.as_dict()
+
+    def _account(self):
+        """Add the whole seconds spent in the current state and with open valves."""
+        seconds = ticks_diff(ticks_ms(), self._since) // 1000
+        if seconds <= 0:
+            return
+        self._since = ticks_add(self._since, seconds * 1000)
+        if self._state == PUMPING:
+            self._counters.add(_PUMP_TIME, seconds)
+        elif self._state == DRAINING:
+            self._counters.add(_DROP_TIME, seconds)
+        for number, valve in enumerate(self._valve_switch):
+            if valve.state:
+                self._counters.add(_VALVE_TIME + number, seconds)
+
+    def _sample(self):
+        """Update the counters and save them from time to time."""
+        self._account()
+        if ticks_diff(self._since, self._saved) >= _SAVE_MS:
+            self._saved = self._since
+            self._counters.save()
+
+    def _exit(self):
+        """Stop the pump at once and save the counters on shutdown."""
+        self.stop_cycle(soft=False)
+        self._account()
+        self._counters.save()
+
+    def _event(self, event):
+        """Make the transition for the event."""
+        state = _TRANSITIONS[self._state][event]
+        if state is not None:
+            self._enter(state)
+
+    def _enter(self, state):
+        """Enter the state and arm its timer."""
+        _LOGGER.debug("Entering {} state".format(STATES[state]))
+        self._account()
+        trace.record(EV_STATE, state)
+        self._state = state
+        if state == PUMPING:
+            self._counters.add(_PUMP_STARTS)
+            self._run_start = ticks_ms()
+            self._slot_zone = None
+            for number in range(len(self._deadline)):
+                self._deadline[number] = None
+        elif state == PRESSURE_DROP_WAIT:
+            self._pump_off_time = ticks_ms()
+        elif state == DRAINING:
+            self._drain_start = ticks_ms()
+        elif state == IDLE:
+            self._pump_off_time = None
+
+        if state == COOLDOWN:
+            # Idle time after the pressure drop, or less if it took too long
+            timeout = (
+                0
+                if self._pump_off_time is None
+                else max(
+                    min(
+                        ticks_diff(
+                            ticks_add(self._pump_off_time, self._pump_off_timeout_ms),
+                            ticks_ms(),
+                        ),
+                        self._idle_time_ms,
+                    ),
+                    0,
+                )
+            )
+        else:
+            timeout = self._timeouts[state]
+
+        if timeout is None:
+            main_loop.remove_task(self._timer)
+        else:
+            main_loop.rearm(self._timer, timeout)
+
+    def _schedule(self, request):
+        """Run start or stop with the next loop iteration, the last request wins."""
+        trace.record(EV_REQUEST, request)
+        self._request = request
+        main_loop.rearm(self._request_task)
+
+    def _cancel_request(self):
+        """Cancel the scheduled start or stop."""
+        if self._request is not None:
+            _LOGGER.debug("Cancelling existing duty cycle schedule")
+            main_loop.remove_task(self._request_task)
+            self._request = None
+
+    def _run_request(self):
+        """Run the scheduled start or stop."""
+        request = self._request
+        self._request = None
+        if request == _START:
+            self.start_cycle()
+        elif request is not None:
+            self.stop_cycle(soft=request == _STOP)
+
     def _humidifier_changed(self, number, value):
         """Handle humidifier on/off."""
         if value:
             if self._zone[number].state:
-                if self._loop_schedule:
-                    _LOGGER.debug("Cancelling existing duty cycle schedule")
-                    main_loop.remove_task(self._loop_schedule)
                 _LOGGER.debug(
                     "Humidifier {} turned on, scheduling duty cycle start".format(
                         number
                     )
                 )
-                self._loop_schedule = main_loop.schedule_task(
-                    lambda: self.start_cycle()
-                )
+                self._schedule(_START)
             else:
                 _LOGGER.debug(
                     "Humidifier {} turned on, but its zone is off".format(number)
                 )
         else:
-            if self._loop_schedule:
-                _LOGGER.debug("Cancelling existing duty cycle schedule")
-                main_loop.remove_task(self._loop_schedule)
             _LOGGER.debug(
                 "Humidifier {} turned off, scheduling duty cycle stop".format(number)
             )
-            self._loop_schedule = main_loop.schedule_task(lambda: self.stop_cycle())
+            self._schedule(_STOP)
 
     def _zone_changed(self, number, value):
         """Handle humidifier zone on/off."""
+        trace.record(EV_ZONE, number << 1 | bool(value))
         if value:
-            if self._pump_timeout is None:
-                if self._loop_schedule:
-                    _LOGGER.debug("Cancelling existing duty cycle schedule")
-                    main_loop.remove_task(self._loop_schedule)
+            if self._state == IDLE:
                 _LOGGER.debug("Zone turned on, scheduling duty cycle start")
-                self._loop_schedule = main_loop.schedule_task(
-                    lambda: self.start_cycle()
-                )
+                self._schedule(_START)
+            elif self._state == PUMPING and (self._demand_run_ms or self._slot_ms):
+                _LOGGER.debug("Zone {} turned on, joining the run".format(number))
+                if self._demand_run_ms:
+                    self._plan_zone(number)
+                if not self._slot_ms:
+                    self._valve_switch[self._zone_valve[number]].state = True
+                self._arm_run()
         elif all(not zone.state for zone in self._zone):
-            if self._loop_schedule:
-                _LOGGER.debug("Cancelling existing duty cycle schedule")
-                main_loop.remove_task(self._loop_schedule)
             _LOGGER.debug("All zones turned off, scheduling duty cycle stop")
-            self._loop_schedule = main_loop.schedule_task(lambda: self.stop_cycle())
+            self._schedule(_STOP)
+        elif self._state == PUMPING and (self._demand_run_ms or self._slot_ms):
+            self._deadline[number] = None
+            if not any(self._active(x) for x in range(len(self._zone))):
+                _LOGGER.debug("No zone left in the run, stopping the cycle")
+                self.stop_cycle()
+                return
+            _LOGGER.debug("Zone {} turned off, closing its valve".format(number))
+            if not self._slot_ms:
+                self._valve_switch[self._zone_valve[number]].state = False
+            elif number == self._slot_zone:
+                # Keep the slot for the minimum time to limit the relay switching
+                self._slot_end = ticks_add(self._slot_end, _MIN_SLOT_MS - self._slot_ms)
+                if ticks_diff(self._slot_end, ticks_ms()) <= 0:
+                    self._next_slot()
+            self._arm_run()
 
     def _pump_block_changed(self, value):
         """Handle block on/off."""
         if value:
-            if self._loop_schedule:
-                _LOGGER.debug("Cancelling existing duty cycle schedule")
-                main_loop.remove_task(self._loop_schedule)
             _LOGGER.debug("Pump blocking turned on, scheduling duty cycle stop")
-            self._loop_schedule = main_loop.schedule_task(lambda: self.stop_cycle())
+            self._schedule(_HARD_STOP)
         else:
-            if self._loop_schedule:
-                _LOGGER.debug("Cancelling existing duty cycle schedule")
-                main_loop.remove_task(self._loop_schedule)
             _LOGGER.debug("Pump blocking turned off, scheduling duty cycle start")
-            self._loop_schedule = main_loop.schedule_task(lambda: self.start_cycle())
+            self._schedule(_START)
 
     def _pump_changed(self, value):
         """Handle pump on/off."""
+        trace.record(EV_PUMP, value)
         if value and self._pump_block.state:
-            if self._loop_schedule:
-                _LOGGER.debug("Cancelling existing duty cycle schedule")
-                main_loop.remove_task(self._loop_schedule)
             _LOGGER.warning("Pump start blocked")
-            self._loop_schedule = main_loop.schedule_task(lambda: self.stop_cycle())
+            trace.record(EV_BLOCKED)
+            self._counters.add(_BLOCKED_STARTS)
+            self._schedule(_HARD_STOP)
             return
+        self._event(_PUMP_ON if value else _PUMP_OFF)
 
-        if self._pump_timeout is not None:
-            _LOGGER.debug("Cancelling existing pump timeout schedule")
-            main_loop.remove_task(self._pump_timeout)
-        if self._pressure_drop is not None:
-            _LOGGER.debug("Cancelling pressure drop start")
-            main_loop.remove_task(self._pressure_drop)
-        if value and self._close_valves is not None:
-            _LOGGER.debug("Cancelling pressure drop stop")
-            main_loop.remove_task(self._close_valves)
-            self._close_valves = None
+    def _start_pressure_drop(self):
+        """Initiate pressure drop."""
+        _LOGGER.debug("Opening pressure drop valve")
+        self._valve_switch[self._drop_valve].state = True
 
-        if value:
-            _LOGGER.debug("Scheduling duty cycle stop after timeout")
-            self._pump_timeout = main_loop.schedule_task(
-                lambda: self._pump_on_timeout(),
-                next_run=self._pump_on_timeout_ms,
-            )
-            self._pressure_drop = None
-        else:
-            _LOGGER.debug("Scheduling duty cycle start after timeout")
-            self._pump_timeout = main_loop.schedule_task(
-                lambda: self._pump_off_timeout(),
-                next_run=self._pump_off_timeout_ms,
-            )
-            _LOGGER.debug("Scheduling pressure drop after timeout")
-            self._pressure_drop = main_loop.schedule_task(
-                lambda: self._start_pressure_drop(),
-                next_run=self._pressure_drop_delay_ms,
+    def _drain_step(self):
+        """End the pressure drop once the pressure is low or the time is up."""
+        if self._drop_pressure is not None:
+            remaining = self._pressure_drop_time_ms - ticks_diff(
+                ticks_ms(), self._drain_start
             )
+            pressure = self._pressure.state
+            if remaining > 0 and (pressure is None or pressure > self._drop_pressure):
+                main_loop.rearm(self._timer, min(_DROP_POLL_MS, remaining))
+                return
+            if remaining > 0:
+                _LOGGER.debug("Pressure dropped to {}".format(pressure))
+        self._close_all_valves()
 
-    def _pressure_drop_valve_changed(self, value):
+    def _drop_valve_changed(self, value):
         """Handle pressure drop valve on/off."""
-        if self._pressure_drop is not None:
-            _LOGGER.debug("Cancelling schedule for pressure drop cycle")
-            main_loop.remove_task(self._pressure_drop)
-            self._pressure_drop = None
-        if self._close_valves is not None:
-            _LOGGER.debug("Cancelling existing schedule to close all valves")
-            main_loop.remove_task(self._close_valves)
-
-        if value:
-            _LOGGER.debug("Pressure drop valve opened, scheduling closing all valves")
-            self._close_valves = main_loop.schedule_task(
-                lambda: self._close_all_valves(),
-                next_run=self._pressure_drop_time_ms,
-            )
-        else:
-            self._close_valves = None
-
-    def _start_pressure_drop(self):
-        """Initiate pressure drop."""
-        _LOGGER.debug("Opening pressure drop valve")
-        self._valve_switch[3].state = True
+        trace.record(EV_DROP_VALVE, value)
+        self._event(_VALVE_OPEN if value else _VALVE_CLOSED)
 
     def _close_all_valves(self):
         """Complete pressure drop."""
         _LOGGER.debug("Closing all valves")
-        for switch in self._valve_switch:
-            switch.state = False
-
-    def _pump_on_timeout(self):
-        """Handle pump staying on too long."""
-        if self._pump_timeout is not None:
-            _LOGGER.debug("Pump timeout, cancelling it")
-            main_loop.remove_task(self._pump_timeout)
-            self._pump_timeout = None
-        _LOGGER.debug("Stopping the cycle")
+        trace.record(EV_VALVES, 0)
+        self._valve_bank.set([False] * len(self._valve_bank))
+        self._event(_VALVE_CLOSED)
+
+    def _set_zone_valves(self, states, other):
+        """Set the zone valves to the states, the remaining ones to other."""
+        valves = [other] * len(self._valve_switch)
+        for number, state in enumerate(states):
+            valves[self._zone_valve[number]] = state
+        self._valve_bank.set(valves)
+
+    def _run_step(self):
+        """Complete the zone runs, switch the valve slot or stop the pump."""
+        now = ticks_ms()
+        if ticks_diff(ticks_add(self._run_start, self._pump_on_timeout_ms), now) > 0:
+            done = [
+                deadline is not None and ticks_diff(deadline, now) <= 0
+                for deadline in self._deadline
+            ]
+            for number, zone_done in enumerate(done):
+                if zone_done:
+                    self._deadline[number] = None
+            if any(self._active(number) for number in range(len(self._zone))):
+                if not self._slot_ms:
+                    if any(done):
+                        _LOGGER.debug("Zone run complete, closing its valves")
+                        self._set_zone_valves(
+                            [False if x else None for x in done], None
+                        )
+                elif (
+                    self._slot_zone is None
+                    or done[self._slot_zone]
+                    or ticks_diff(self._slot_end, now) <= 0
+                ):
+                    self._next_slot()
+                self._arm_run()
+                return
+        else:
+            self._counters.add(_PUMP_TIMEOUTS)
+        _LOGGER.debug("Pump timeout, stopping the cycle")
         self.stop_cycle()
 
+    def _active(self, number):
+        """Return True if the zone takes part in the current run."""
+        return self._zone[number].state and (
+            not self._demand_run_ms or self._deadline[number] is not None
+        )
+
+    def _plan_zone(self, number):
+        """Set the end of the zone run from its humidity deficit."""
+        deficit = self._humidifier[number].deficit
+        run = (
+            self._pump_on_timeout_ms
+            if deficit is None
+            else max(int(deficit * self._demand_run_ms), _MIN_RUN_MS)
+        )
+        limit = ticks_diff(
+            ticks_add(self._run_start, self._pump_on_timeout_ms), ticks_ms()
+        )
+        self._deadline[number] = ticks_add(ticks_ms(), max(min(run, limit), 0))
+
+    def _plan_run(self):
+        """Plan the zone runs and the valve slots of the new pump run."""
+        for number, zone in enumerate(self._zone):
+            self._credit[number] = 0
+            if self._demand_run_ms and zone.state:
+                self._plan_zone(number)
+        if self._slot_ms:
+            self._next_slot()
+        self._arm_run()
+
+    def _next_slot(self):
+        """Give the next slot to the zone with the most credit."""
+        total = 0
+        zone = None
+        for number in range(len(self._zone)):
+            if self._active(number):
+                weight = self._weight(number)
+                self._credit[number] += weight
+                total += weight
+                if zone is None or self._credit[number] > self._credit[zone]:
+                    zone = number
+        if zone is None:
+            return
+        self._credit[zone] -= total
+        self._slot_end = ticks_add(ticks_ms(), self._slot_ms)
+        if zone != self._slot_zone:
+            _LOGGER.debug("Valve slot for zone {}".format(zone))
+            self._slot_zone = zone
+        # Open the next valve before closing the others to keep an outlet open
+        valve = self._zone_valve[zone]
+        trace.record(EV_VALVES, valve + 1)
+        self._valve_switch[valve].state = True
+        self._set_zone_valves(
+            [None if number == zone else False for number in range(len(self._zone))],
+            None,
+        )
+
+    def _weight(self, number):
+        """Return the slot weight of the zone from its humidity deficit."""
+        deficit = self._humidifier[number].deficit
+        return 1 if deficit is None else max(deficit, 1)
+
+    def _arm_run(self):
+        """Arm the timer for the next zone to complete or the next slot."""
+        now = ticks_ms()
+        remaining = [
+            ticks_diff(ticks_add(self._run_start, self._pump_on_timeout_ms), now)
+        ]
+        for deadline in self._deadline:
+            if deadline is not None:
+                remaining.append(ticks_diff(deadline, now))
+        if self._slot_zone is not None:
+            remaining.append(ticks_diff(self._slot_end, now))
+        main_loop.rearm(self._timer, max(min(remaining), 0))
+
     def _pump_off_timeout(self):
         """Handle pump staying off too long."""
-        if self._pump_timeout is not None:
-            _LOGGER.debug("Pump timeout, cancelling it")
-            main_loop.remove_task(self._pump_timeout)
-            self._pump_timeout = None
-        _LOGGER.debug("Starting the cycle")
+        _LOGGER.debug("Pump timeout, starting the cycle")
+        self._enter(IDLE)
         self.start_cycle()
 
-    def stop_cycle(self):
+    def stop_cycle(self, soft=True):
         """End duty cycle."""
-        main_loop.remove_task(self._loop_schedule)
-        self._loop_schedule = None
+        self._cancel_request()
 
         if not self._pump.state:
             _LOGGER.debug("The pump is already not running")
             return
 
+        if self._ramp_rate:
+            if not self._pump_speed.ramping:
+                self._speed = self._pump_speed.state
+            if soft:
+                if not self._stopping:
+                    _LOGGER.debug("Slowing down the pump")
+                    self._stopping = True
+                    self._pump_speed.ramp(
+                        0, self._ramp_rate, lambda: self._soft_stop_done()
+                    )
+                return
+            self._pump_speed.stop_ramp()
+
         _LOGGER.debug("Stopping the pump")
         self._pump.state = False
+        self._restore_speed()
+
+    def _soft_stop_done(self):
+        """Stop the pump once slowed down."""
+        _LOGGER.debug("Stopping the pump")
+        self._pump.state = False
+        self._restore_speed()
+
+    def _restore_speed(self):
+        """Restore the pump speed for the next start."""
+        if self._ramp_rate:
+            self._stopping = False
+            self._pump_speed.state = self._speed
 
     def start_cycle(self):
         """Enter duty cycle."""
-        main_loop.remove_task(self._loop_schedule)
-        self._loop_schedule = None
+        self._cancel_request()
 
         if self._pump.state:
+            if self._stopping and not self._pump_block.state:
+                if self._state == PUMPING and (
+                    ticks_diff(
+                        ticks_add(self._run_start, self._pump_on_timeout_ms),
+                        ticks_ms(),
+                    )
+                    <= 0
+                ):
+                    _LOGGER.debug("Pump run timed out, letting the pump stop")
+                    return
+                _LOGGER.debug("Speeding the pump up again")
+                self._stopping = False
+                self._pump_speed.ramp(self._speed, self._ramp_rate)
+                if self._state == PUMPING:
+                    self._arm_run()
+                return
             _LOGGER.debug("The pump is already running")
             return
 
         if self._pump_block.state:
             _LOGGER.debug("Pump start blocked")
+            trace.record(EV_BLOCKED)
+            self._counters.add(_BLOCKED_STARTS)
             return
 
-        if (
-            not self._zone[0].state
-            and not self._zone[1].state
-            and not self._zone[2].state
-        ):
+        if not any(zone.state for zone in self._zone):
             _LOGGER.debug("All zones are off, not starting the pump")
             return
 
         _LOGGER.debug("Setting up switches")
-        for x in range(3):
-            self._valve_switch[x].state = self._zone[x].state
-        self._valve_switch[3].state = False
+        states = [zone.state for zone in self._zone]
+        if self._slot_ms:
+            # Only the valve of the first slot, the zone _next_slot picks first
+            first = max(
+                (number for number, state in enumerate(states) if state),
+                key=self._weight,
+            )
+            states = [number == first for number in range(len(states))]
+        for number, state in enumerate(states):
+            if state:
+                trace.record(EV_VALVES, self._zone_valve[number] + 1)
+        self._set_zone_valves(states, False)
+
+        if self._ramp_rate:
+            _LOGGER.debug("Starting the pump softly")
+            if not self._pump_speed.ramping:
+                self._speed = self._pump_speed.state
+            self._pump_speed.state = 0
+            self._pump.state = True
+            self._pump_speed.ramp(self._speed, self._ramp_rate)
+        else:
+            _LOGGER.debug("Starting the pump")
+            self._pump.state = True
 
-        _LOGGER.debug("Starting the pump")
-        self._pump.state = True
+        if (self._demand_run_ms or self._slot_ms) and self._state == PUMPING:
+            self._plan_run()
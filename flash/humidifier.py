@@ -3,14 +3,54 @@
 from time import ticks_diff, ticks_ms
 
 from lib import logging
+from lib.clock import clock
 from lib.core import Switch
-from lib.mainloop import main_loop
+from lib.mainloop import Task, main_loop
+from lib.pid import PID
+from lib.trace import EV_HUMIDIFIER, EV_SCHEDULE, EV_STALE, trace
+from micropython import const
 
 _LOGGER = logging.getLogger(__name__)
 
 _MODE_NORMAL = "normal"
 _MODE_AWAY = "away"
 
+_CHECK_PERIOD = const(60000)
+
+# Schedule entries: weekday mask, minute of the day with the mode flags, target
+_MAX_SCHEDULE = const(16)
+_SET_NORMAL = const(0x40)
+_SET_AWAY = const(0x80)
+_KEEP_TARGET = const(0xFF)
+_WEEK_MINUTES = const(7 * 1440)
+_MAX_CATCH_UP = const(60)  # Minutes, a longer gap means the clock was changed
+
+_humidifiers = []
+_last_minute = None
+
+
+def _check():
+    """Check the stale sensors and run the schedules once a minute."""
+    global _last_minute
+    now = ticks_ms()
+    start = end = None
+    local = clock.local_minute()
+    if local is not None:
+        minute = local[0] * 1440 + local[1]
+        if _last_minute is not None:
+            gap = (minute - _last_minute) % _WEEK_MINUTES
+            if 0 < gap <= _MAX_CATCH_UP:
+                start, end = _last_minute, minute
+        _last_minute = minute
+    for humidifier in _humidifiers:
+        humidifier._check_stale(now)
+        if start is not None:
+            humidifier._run_schedule(start, end)
+
+
+# One watchdog for all humidifiers, the sensor updates only store the time
+_watchdog = Task(_check, period=_CHECK_PERIOD)
+
 
 class Humidifier(Switch):
     """Representation of a Humidifier device."""
@@ -25,6 +65,8 @@ class Humidifier(Switch):
         wet_tolerance=3,
         away_humidity=35,
         sensor_stale_duration=None,
+        number=0,
+        pid=None,
         *args,
         **kwargs
     ):
@@ -39,14 +81,15 @@ class Humidifier(Switch):
         self._cur_humidity = None
         self._target_humidity = target_humidity
         self._stale_duration = sensor_stale_duration
-        self._stale_tracking = None
+        self._sensor_last_updated = ticks_ms()
         self._is_away = False
+        self._number = number
+        # (kp, ki, kd) to stop on the PID demand instead of the wet tolerance
+        self._pid = None if pid is None else PID(*pid)
         super().__init__(*args, **kwargs)
 
         self._operate_task = None
-        self._state_subscriber = self.subscribe(
-            lambda x: self._schedule_operate(force=True)
-        )
+        self._state_subscriber = self.subscribe(lambda x: self._state_changed(x))
 
         self._sensor_subscriber = self._sensor.subscribe(
             lambda x: self._sensor_changed(x)
@@ -54,28 +97,60 @@ class Humidifier(Switch):
 
         self._sensor_changed(self._sensor.state)
 
+        self._schedule = bytearray()
+        _humidifiers.append(self)
+        main_loop.rearm(_watchdog, _CHECK_PERIOD)
+
     def __del__(self):
         """Cancel callbacks."""
         self.unsubscribe(self._state_subscriber)
         self._sensor.unsubscribe(self._sensor_subscriber)
-        main_loop.remove_task(self._stale_tracking)
+        if self in _humidifiers:
+            _humidifiers.remove(self)
         main_loop.remove_task(self._operate_task)
 
+    def _state_changed(self, value):
+        """Handle humidifier on/off."""
+        trace.record(EV_HUMIDIFIER, self._number << 1 | bool(value))
+        self._schedule_operate(force=True)
+
     def _sensor_changed(self, new_state):
         """Handle ambient humidity changes."""
         if new_state is None:
             return
 
-        if self._stale_duration:
-            main_loop.remove_task(self._stale_tracking)
-            self._stale_tracking = main_loop.schedule_task(
-                lambda: self._sensor_not_responding(),
-                self._stale_duration * 1000,
-            )
-
         self._update_humidity(new_state)
         self._schedule_operate()
 
+    def _check_stale(self, now):
+        """Check the time since the last sensor update."""
+        if (
+            self._stale_duration
+            and self._cur_humidity is not None
+            and ticks_diff(now, self._sensor_last_updated)
+            >= self._stale_duration * 1000
+        ):
+            self._sensor_not_responding()
+
+    def _run_schedule(self, start, end):
+        """Apply the schedule entries due after start until end minute of the week."""
+        schedule = self._schedule
+        for x in range(0, len(schedule), 4):
+            minute = schedule[x + 1] | (schedule[x + 2] & 0x07) << 8
+            for day in range(7):
+                if not schedule[x] & 1 << day:
+                    continue
+                due = (day * 1440 + minute - start) % _WEEK_MINUTES
+                if 0 < due <= (end - start) % _WEEK_MINUTES:
+                    _LOGGER.debug("Applying schedule entry {}".format(x // 4))
+                    trace.record(EV_SCHEDULE, self._number)
+                    if schedule[x + 2] & _SET_AWAY:
+                        self.mode = _MODE_AWAY
+                    elif schedule[x + 2] & _SET_NORMAL:
+                        self.mode = _MODE_NORMAL
+                    if schedule[x + 3] != _KEEP_TARGET:
+                        self.humidity = schedule[x + 3]
+
     def _sensor_not_responding(self):
         """Handle sensor stale event."""
         _LOGGER.debug(
@@ -83,6 +158,7 @@ class Humidifier(Switch):
             int(ticks_diff(ticks_ms(), self._sensor_last_updated) / 1000),
         )
         _LOGGER.warning("Sensor is stalled, call the emergency stop")
+        trace.record(EV_STALE, self._number)
         self._update_humidity("Stalled")
 
     def _update_humidity(self, humidity):
@@ -90,6 +166,8 @@ class Humidifier(Switch):
         try:
             self._cur_humidity = float(humidity)
             self._sensor_last_updated = ticks_ms()
+            if self._pid is not None and self._target_humidity is not None:
+                self._pid.update(self._target_humidity, self._cur_humidity)
         except ValueError as ex:
             _LOGGER.warning("{}: {}: {}".format(type(ex).__name__, ex, humidity))
             self._cur_humidity = None
@@ -124,6 +202,8 @@ class Humidifier(Switch):
             )
 
         if not self._active.state or not self._state:
+            if self._pid is not None:
+                self._pid.reset()
             if force:
                 self._switch.state = False
             return
@@ -137,7 +217,11 @@ class Humidifier(Switch):
             wet_tolerance = self._wet_tolerance
 
         too_dry = self._target_humidity - self._cur_humidity >= dry_tolerance
-        too_wet = self._cur_humidity - self._target_humidity >= wet_tolerance
+        if self._pid is None:
+            too_wet = self._cur_humidity - self._target_humidity >= wet_tolerance
+        else:
+            # Stop once the predicted demand runs out, before the mist overshoots
+            too_wet = self._pid.demand(self._target_humidity) <= 0
         if self._switch.state:
             if too_wet:
                 self._switch.state = False
@@ -161,6 +245,63 @@ class Humidifier(Switch):
         self._target_humidity = int(humidity)
         self._schedule_operate()
 
+    @property
+    def deficit(self):
+        """Return how far the humidity is below the target, None if unknown."""
+        if not self._active.state or None in (
+            self._cur_humidity,
+            self._target_humidity,
+        ):
+            return None
+        if self._pid is not None:
+            return self._pid.demand(self._target_humidity)
+        return self._target_humidity - self._cur_humidity
+
+    @property
+    def schedule(self):
+        """Return the schedule as (weekday mask, minute, target, mode) entries."""
+        schedule = self._schedule
+        entries = []
+        for x in range(0, len(schedule), 4):
+            flags = schedule[x + 2]
+            entries.append(
+                (
+                    schedule[x],
+                    schedule[x + 1] | (flags & 0x07) << 8,
+                    None if schedule[x + 3] == _KEEP_TARGET else schedule[x + 3],
+                    (
+                        _MODE_AWAY
+                        if flags & _SET_AWAY
+                        else _MODE_NORMAL if flags & _SET_NORMAL else None
+                    ),
+                )
+            )
+        return entries
+
+    @schedule.setter
+    def schedule(self, entries):
+        """Replace the schedule, None target or mode keeps the current one."""
+        if len(entries) > _MAX_SCHEDULE:
+            raise ValueError("Too many schedule entries")
+        schedule = bytearray(4 * len(entries))
+        for x, (weekdays, minute, target, mode) in enumerate(entries):
+            if (
+                not 0 <= weekdays <= 0x7F
+                or not 0 <= minute < 1440
+                or not (target is None or 0 <= target <= 100)
+                or mode not in (None, _MODE_NORMAL, _MODE_AWAY)
+            ):
+                raise ValueError("Invalid schedule entry {}".format(x))
+            schedule[4 * x] = weekdays
+            schedule[4 * x + 1] = minute & 0xFF
+            schedule[4 * x + 2] = minute >> 8 | (
+                _SET_AWAY
+                if mode == _MODE_AWAY
+                else _SET_NORMAL if mode == _MODE_NORMAL else 0
+            )
+            schedule[4 * x + 3] = _KEEP_TARGET if target is None else int(target)
+        self._schedule = schedule
+
     @property
     def mode(self):
         """Return the current mode."""
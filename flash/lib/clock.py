@@ -0,0 +1,46 @@
+"""Wall clock kept from the uptime sync."""
+
+from time import ticks_add, ticks_diff, ticks_ms
+
+from micropython import const
+
+_REBASE_MS = const(3600000)  # Well within the ticks period
+
+
+class Clock:
+    """Unix time counted from the last sync, None until synced."""
+
+    def __init__(self):
+        """Init the class."""
+        self._time = None
+        self._ticks = None
+        self.utc_offset = 0  # Minutes east of UTC
+
+    def set(self, timestamp):
+        """Set the current Unix time in seconds."""
+        self._time = int(timestamp)
+        self._ticks = ticks_ms()
+
+    def time(self):
+        """Return the current Unix time in seconds or None."""
+        if self._time is None:
+            return None
+        elapsed = ticks_diff(ticks_ms(), self._ticks) // 1000
+        if elapsed * 1000 >= _REBASE_MS:
+            # Move the reference forward before the ticks wrap around
+            self._time += elapsed
+            self._ticks = ticks_add(self._ticks, elapsed * 1000)
+            elapsed = 0
+        return self._time + elapsed
+
+    def local_minute(self):
+        """Return the local weekday (Monday is 0) and the minute of the day."""
+        now = self.time()
+        if now is None:
+            return None
+        now += self.utc_offset * 60
+        # 1970-01-01 was a Thursday
+        return (now // 86400 + 3) % 7, now % 86400 // 60
+
+
+clock = Clock()
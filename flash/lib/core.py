@@ -6,12 +6,19 @@ from json import dumps as json_dumps, loads as json_loads
 from time import ticks_diff, ticks_ms
 
 from lib import logging
+from lib.clock import clock
+from lib.crashlog import crash_log
 from lib.mainloop import main_loop
+from lib.trace import trace
 from machine import reset_cause, soft_reset, unique_id
+from micropython import const
 from xbee import ADDR_COORDINATOR, atcmd, receive, transmit
 
 _LOGGER = logging.getLogger(__name__)
 
+_RESP_CACHE_SIZE = const(4)
+_RAMP_STEP = const(100)
+
 
 class Sensor:
     """Base class."""
@@ -81,6 +88,11 @@ class Sensor:
         self._triggers.remove(callback)
         collect()
 
+    @property
+    def stale(self):
+        """Return True if the state is outdated."""
+        return False
+
     @property
     def state(self):
         """Get cached state."""
@@ -96,13 +108,20 @@ class Sensor:
         if self._type is not None:
             value = self._type(value)
         self._set(value)
+        self._store(value)
+
+    def _store(self, value):
+        """Store the value written and run the triggers if it has changed."""
         if value != self._state or self._state is None:
             self._state = value
             self._run_triggers(value)
 
     def update(self, auto=False):
         """Get updated state."""
-        value = self._get()
+        self._update_state(self._get(), auto)
+
+    def _update_state(self, value, auto=False):
+        """Store the new value and run the triggers if needed."""
         if self._type is not None:
             value = self._type(value)
         self._state = value
@@ -133,6 +152,94 @@ class Switch(Sensor):
     _type = bool
 
 
+class Number(Sensor):
+    """Numeric entity that can ramp to a target."""
+
+    def __init__(self, *args, **kwargs):
+        """Init the class."""
+        self._ramp = None
+        self._ramp_value = None
+        self._ramp_target = None
+        self._ramp_step = None
+        self._ramp_callback = None
+        super().__init__(*args, **kwargs)
+
+    def __del__(self):
+        """Cancel callbacks."""
+        self.stop_ramp()
+        super().__del__()
+
+    @property
+    def ramping(self):
+        """Return True if the ramp is in progress."""
+        return self._ramp is not None
+
+    def ramp(self, target, rate, callback=None):
+        """Move the state to the target by rate units per second."""
+        self.stop_ramp()
+        if not rate or self.state is None:
+            self.state = target
+            if callback is not None:
+                callback()
+            return
+        self._ramp_value = self._state
+        self._ramp_target = target
+        self._ramp_step = abs(rate) * _RAMP_STEP / 1000
+        self._ramp_callback = callback
+        self._ramp = main_loop.schedule_task(
+            lambda: self._ramp_update(), period=_RAMP_STEP
+        )
+
+    def stop_ramp(self):
+        """Stop the ramp at the current value."""
+        main_loop.remove_task(self._ramp)
+        self._ramp = None
+        self._ramp_callback = None
+
+    def _ramp_update(self):
+        """Step towards the ramp target."""
+        if self._state != int(self._ramp_value):
+            _LOGGER.debug("Ramp interrupted by a new value")
+            self.stop_ramp()
+            return
+        if abs(self._ramp_target - self._ramp_value) <= self._ramp_step:
+            self._ramp_value = self._ramp_target
+        elif self._ramp_target > self._ramp_value:
+            self._ramp_value += self._ramp_step
+        else:
+            self._ramp_value -= self._ramp_step
+        value = int(self._ramp_value)
+        self._set(value)
+        self._store(value)
+        if self._ramp_value == self._ramp_target:
+            callback = self._ramp_callback
+            self.stop_ramp()
+            if callback is not None:
+                callback()
+
+
+class SwitchBank:
+    """Group of switches updated together."""
+
+    def __init__(self, switches):
+        """Init the class."""
+        self._switches = switches
+
+    def __getitem__(self, number):
+        """Return the switch."""
+        return self._switches[number]
+
+    def __len__(self):
+        """Return the number of switches."""
+        return len(self._switches)
+
+    def set(self, states):
+        """Update the switches, None keeps the switch as is."""
+        for switch, state in zip(self._switches, states):
+            if state is not None:
+                switch.state = state
+
+
 class Commands:
     """Define application remote commands."""
 
@@ -145,6 +252,7 @@ class Commands:
             lambda: self._uptime_upd(), period=30000
         )
         self.nonce = 0
+        self._resp_cache = []
 
     def __del__(self):
         """Cancel callbacks."""
@@ -176,8 +284,17 @@ class Commands:
             data = json_loads(data["payload"])
             cmd = data["cmd"]
             args = data.get("args")
+            req_id = data.get("id")
             data = None
             collect()
+            if req_id is not None:
+                key = (sender_eui64, req_id, cmd)
+                response = self._cached_response(key)
+                if response is not None:
+                    _LOGGER.debug("Replaying response to {} {}".format(cmd, req_id))
+                    self._transmit(sender_eui64, response)
+                    response = None
+                    continue
             try:
                 method = "cmd_{}".format(cmd)
                 if hasattr(self, method):
@@ -210,13 +327,34 @@ class Commands:
 
             self.nonce += 1
             response["nonce"] = self.nonce
-
-            self._transmit(sender_eui64, json_dumps(response))
+            if req_id is not None:
+                response["id"] = req_id
+            response = json_dumps(response)
+            if req_id is not None:
+                self._cache_response(key, response)
+                key = None
+
+            self._transmit(sender_eui64, response)
             response = None
             sender_eui64 = None
             cmd = None
             collect()
 
+    def _cached_response(self, key):
+        """Return the cached response for a repeated request or None."""
+        for entry in self._resp_cache:
+            if entry[0] == key:
+                self._resp_cache.remove(entry)
+                self._resp_cache.append(entry)
+                return entry[1]
+        return None
+
+    def _cache_response(self, key, response):
+        """Remember the response to replay it on retries."""
+        if len(self._resp_cache) >= _RESP_CACHE_SIZE:
+            self._resp_cache.pop(0)
+        self._resp_cache.append((key, response))
+
     def _transmit(self, eui64, data, limit=3):
         """Retries sending data on full transfer buffer."""
         try:
@@ -251,11 +389,22 @@ class Commands:
             if self._uptime_cb is None:
                 return self._uptime
             return -self._uptime / 1000
+        if self._uptime_cb is not None:
+            clock.set(uptime + self._uptime // 1000)
+        else:
+            clock.set(clock.time() + uptime - self._uptime)
         self._uptime = uptime
         main_loop.remove_task(self._uptime_cb)
         self._uptime_cb = None
         return "OK"
 
+    def cmd_utc_offset(self, sender_eui64=None, offset=None):
+        """Get or set the local time offset from UTC in minutes."""
+        if offset is None:
+            return clock.utc_offset
+        clock.utc_offset = int(offset)
+        return "OK"
+
     def cmd_help(self, sender_eui64=None):
         """Return the list of available commands."""
         return [cmd[4:] for cmd in dir(self) if cmd.startswith("cmd_")]
@@ -275,6 +424,10 @@ class Commands:
             logging.getLogger().setTarget(target)
         return "OK"
 
+    def cmd_log_stats(self, sender_eui64=None):
+        """Return the numbers of the dropped, rate limited and repeated logs."""
+        return logging.getLogger().stats()
+
     def cmd_soft_reset(self, sender_eui64=None):
         """Schedule soft reset."""
         main_loop.schedule_task(soft_reset)
@@ -284,6 +437,18 @@ class Commands:
         """Return the reset cause."""
         return reset_cause()
 
+    def cmd_crashlog(self, sender_eui64=None, offset=0):
+        """Return a chunk of the crash log as hex string."""
+        if not offset:
+            crash_log.flush()
+        size, data = crash_log.read(offset)
+        return {"size": size, "data": hexlify(data).decode()}
+
+    def cmd_trace(self, sender_eui64=None, offset=0):
+        """Return a chunk of the event trace as hex string."""
+        size, data = trace.read(offset)
+        return {"size": size, "data": hexlify(data).decode(), "age": trace.age()}
+
     def cmd_unique_id(self, sender_eui64=None):
         """Return the unique identifier for the processor."""
         return hexlify(unique_id()).decode()
@@ -0,0 +1,46 @@
+"""Integer counters persisted on the device filesystem."""
+
+from array import array
+
+
+class Counters:
+    """Fixed set of unsigned 32-bit counters saved to a file."""
+
+    def __init__(self, names, path=None):
+        """Init the class."""
+        self.names = names
+        self.path = path
+        self._values = array("I", bytes(4 * len(names)))
+        self.load()
+
+    def __getitem__(self, index):
+        """Return the counter value."""
+        return self._values[index]
+
+    def add(self, index, value=1):
+        """Increase the counter, wrapping around on overflow."""
+        self._values[index] = (self._values[index] + value) & 0xFFFFFFFF
+
+    def as_dict(self):
+        """Return the counters by name."""
+        return dict(zip(self.names, self._values))
+
+    def load(self):
+        """Read the saved counters, missing ones start from zero."""
+        if self.path is None:
+            return
+        try:
+            with open(self.path, "rb") as f:
+                f.readinto(self._values)
+        except OSError:
+            pass
+
+    def save(self):
+        """Write the counters to the file."""
+        if self.path is None:
+            return
+        try:
+            with open(self.path, "wb") as f:
+                f.write(self._values)
+        except OSError:
+            pass
@@ -0,0 +1,152 @@
+"""Persistent event log on the device filesystem to diagnose resets."""
+
+from gc import collect, mem_alloc, mem_free
+from json import dumps as json_dumps
+from struct import pack
+from time import ticks_ms
+
+import uos
+from lib.mainloop import main_loop
+from micropython import const
+
+EVENT_LOG = const(1)
+EVENT_RESET = const(2)
+EVENT_STATS = const(3)
+
+PATH = "crash.log"
+
+_MAX_SIZE = const(1024)
+_MAX_PENDING = const(256)
+_MAX_PAYLOAD = const(255)
+_FLUSH_DELAY = const(5000)
+_STATS_PERIOD = const(300000)
+_STATS_COUNT = const(4)
+_CHUNK = const(64)
+
+
+class CrashLog:
+    """Append-only event log capped at two files of _MAX_SIZE bytes."""
+
+    def __init__(self, path=PATH):
+        """Init the class."""
+        self.path = path
+        self._pending = []
+        self._pending_size = 0
+        self._stats = []
+        self._flush_task = None
+        self._stats_task = None
+
+    def start(self, reset_cause):
+        """Record the reset and start taking the loop stats snapshots."""
+        self.record(EVENT_RESET, reset_cause)
+        self._schedule_flush()
+        if self._stats_task is None:
+            self._stats_task = main_loop.schedule_task(
+                lambda: self.snapshot(), next_run=_STATS_PERIOD, period=_STATS_PERIOD
+            )
+
+    def stop(self):
+        """Cancel the scheduled tasks and write the pending records."""
+        main_loop.remove_task(self._stats_task)
+        self._stats_task = None
+        self.flush()
+
+    @staticmethod
+    def _pack(event, arg, payload=b""):
+        """Serialize the record."""
+        payload = payload[:_MAX_PAYLOAD]
+        return pack("<BBIB", event, arg, ticks_ms() // 1000, len(payload)) + payload
+
+    def record(self, event, arg, payload=b""):
+        """Add the record to be written with the next batch."""
+        record = self._pack(event, arg, payload)
+        self._pending.append(record)
+        self._pending_size += len(record)
+        if self._pending_size >= _MAX_PENDING:
+            self.flush()
+
+    def log(self, record):
+        """Record the log record, shortening its text to fit in the payload."""
+        payload = json_dumps(record[1:]).encode()
+        if len(payload) > _MAX_PAYLOAD:
+            # Cut the text rather than the encoded record to keep it valid JSON
+            if len(record) == 2:
+                msg = str(record[1])
+            else:
+                msg = "Log message {}: {}".format(record[1], record[2])
+            excess = len(json_dumps((msg,)).encode()) - _MAX_PAYLOAD
+            if excess > 0:
+                msg = msg[: len(msg) - excess]
+            payload = json_dumps((msg,)).encode()
+        self.record(EVENT_LOG, record[0], payload)
+        self._schedule_flush()
+
+    def snapshot(self):
+        """Keep the last loop stats, written together with the next batch."""
+        self._stats.append(
+            self._pack(
+                EVENT_STATS,
+                min(main_loop.task_count, 0xFF),
+                pack("<II", mem_free(), mem_alloc()),
+            )
+        )
+        if len(self._stats) > _STATS_COUNT:
+            self._stats.pop(0)
+        elif len(self._stats) == _STATS_COUNT:
+            self.flush()
+
+    def _schedule_flush(self):
+        """Write the pending records after a delay to batch them."""
+        if self._flush_task is None:
+            self._flush_task = main_loop.schedule_task(
+                lambda: self.flush(), next_run=_FLUSH_DELAY
+            )
+
+    def flush(self):
+        """Write the pending records and the stats snapshots to the file."""
+        main_loop.remove_task(self._flush_task)
+        self._flush_task = None
+        if not self._pending and not self._stats:
+            return
+        try:
+            with open(self.path, "ab") as f:
+                for record in self._stats:
+                    f.write(record)
+                for record in self._pending:
+                    f.write(record)
+                size = f.tell()
+        except OSError:
+            return  # Keep the records for the next attempt
+        self._pending.clear()
+        self._pending_size = 0
+        self._stats.clear()
+        collect()
+        if size >= _MAX_SIZE:
+            try:
+                uos.remove(self.path + ".1")
+            except OSError:
+                pass
+            try:
+                uos.rename(self.path, self.path + ".1")
+            except OSError:
+                pass
+
+    def read(self, offset, size=_CHUNK):
+        """Return the total size and a chunk of the log, older file first."""
+        data = b""
+        total = 0
+        for path in (self.path + ".1", self.path):
+            try:
+                with open(path, "rb") as f:
+                    f.seek(0, 2)
+                    length = f.tell()
+                    if len(data) < size and offset < total + length:
+                        f.seek(max(offset - total, 0))
+                        data += f.read(size - len(data))
+                    total += length
+            except OSError:
+                pass
+        return total, data
+
+
+crash_log = CrashLog()
@@ -1,6 +1,7 @@
 """Micropython logging implementation for xbee sending logs remotely."""
 
 from json import dumps as json_dumps
+from time import ticks_diff, ticks_ms
 
 from micropython import const
 from xbee import ADDR_COORDINATOR, transmit
@@ -11,6 +12,13 @@ WARNING = const(30)
 ERROR = const(40)
 CRITICAL = const(50)
 
+_BUFFER_SIZE = const(16)
+_FLUSH_DELAY = const(200)
+_MAX_FRAME = const(200)
+_RATE_BURST = const(5)
+_RATE_PERIOD = const(1000)
+_MAX_SOURCES = const(8)
+
 
 class Logger:
     """XBee remote logger."""
@@ -20,6 +28,18 @@ class Logger:
         self._target = ADDR_COORDINATOR
         self._level = DEBUG
         self.nonce = 0
+        self._buffer = [None] * _BUFFER_SIZE
+        self._head = 0
+        self._count = 0
+        self._lost = 0
+        self._limited = 0
+        self._last = None
+        self._repeated = 0
+        self._buckets = {}
+        self.dropped = 0
+        self.limited = 0
+        self.repeated = 0
+        self._flush_task = None
 
     def setTarget(self, target=ADDR_COORDINATOR):
         """Update target device eui64."""
@@ -35,22 +55,165 @@ class Logger:
 
     def makeRecord(self, level, msg, *args, **kwargs):
         """Format the record."""
+        if isinstance(msg, int):
+            # Catalogued message, formatted on the receiving side
+            return (
+                level,
+                msg,
+                [
+                    (
+                        arg
+                        if arg is None or isinstance(arg, (int, float, str))
+                        else str(arg)
+                    )
+                    for arg in args
+                ],
+            )
         if args:
             msg = msg % args
-        self.nonce += 1
-        return json_dumps({"log": {"sev": level, "msg": msg}, "nonce": self.nonce})
+        return (level, msg)
+
+    def stats(self):
+        """Return the counters of the records not sent."""
+        return {
+            "dropped": self.dropped,
+            "limited": self.limited,
+            "repeated": self.repeated,
+        }
+
+    def _allow(self, source):
+        """Take a token from the bucket of the message source."""
+        now = ticks_ms()
+        bucket = self._buckets.get(source)
+        if bucket is None:
+            if len(self._buckets) >= _MAX_SOURCES:
+                self._buckets.pop(next(iter(self._buckets)))
+            bucket = self._buckets[source] = [_RATE_BURST, now]
+        else:
+            tokens = ticks_diff(now, bucket[1]) // _RATE_PERIOD
+            if tokens:
+                bucket[0] = min(_RATE_BURST, bucket[0] + tokens)
+                bucket[1] = now
+        if not bucket[0]:
+            return False
+        bucket[0] -= 1
+        return True
+
+    def _append(self, record):
+        """Add the record to the buffer, overwriting the oldest one if full."""
+        if self._count == _BUFFER_SIZE:
+            self._head = (self._head + 1) % _BUFFER_SIZE
+            self._count -= 1
+            self._lost += 1
+            self.dropped += 1
+        self._buffer[(self._head + self._count) % _BUFFER_SIZE] = record
+        self._count += 1
+
+    def _append_repeated(self):
+        """Add the summary of the collapsed repeated records."""
+        if self._repeated:
+            self._append(
+                (
+                    self._last[0],
+                    "Last message repeated {} times".format(self._repeated),
+                )
+            )
+            self._repeated = 0
+            self._last = None
 
     def log(self, level, msg, *args, **kwargs):
         """Write logs."""
-        if self._level <= level:
+        if self._level > level:
+            return
+
+        record = self.makeRecord(level, msg, *args, **kwargs)
+        if record == self._last:
+            self._repeated += 1
+            self.repeated += 1
+            if self._flush_task is None:
+                self._schedule_flush()
+            return
+
+        if not self._allow(msg):
+            self._limited += 1
+            self.limited += 1
+            if self._flush_task is None:
+                self._schedule_flush()
+            return
+
+        self._append_repeated()
+        self._last = record
+        self._append(record)
+
+        if level >= ERROR:
+            self._persist(record)
+            if self.flush():
+                return
+        if self._flush_task is None:
+            self._schedule_flush()
+
+    def _persist(self, record):
+        """Keep the record in the crash log on the filesystem."""
+        from lib.crashlog import crash_log
+
+        crash_log.log(record)
+
+    def _schedule_flush(self):
+        """Flush the buffer later from the main loop."""
+        from lib.mainloop import main_loop
+
+        self._flush_task = main_loop.schedule_task(
+            lambda: self._scheduled_flush(), next_run=_FLUSH_DELAY
+        )
+
+    def _scheduled_flush(self):
+        """Flush the buffer and retry later on failure."""
+        self._flush_task = None
+        if not self.flush():
+            self._schedule_flush()
+
+    def flush(self):
+        """Send the buffered records, several per frame."""
+        self._append_repeated()
+        while self._count or self._lost or self._limited:
+            records = []
+            if self._lost:
+                records.append((WARNING, "{} log records lost".format(self._lost)))
+            if self._limited:
+                records.append(
+                    (WARNING, "{} log records rate limited".format(self._limited))
+                )
+            size = 0
+            n = 0
+            while n < self._count:
+                record = self._buffer[(self._head + n) % _BUFFER_SIZE]
+                if len(record) == 2:
+                    size += len(record[1]) + 8
+                else:
+                    for arg in record[2]:
+                        size += len(arg) if isinstance(arg, str) else 8
+                    size += 12
+                if records and size > _MAX_FRAME:
+                    break
+                records.append(record)
+                n += 1
+            self.nonce += 1
             try:
                 transmit(
                     self._target,
-                    self.makeRecord(level, msg, *args, **kwargs),
+                    json_dumps({"log": records, "nonce": self.nonce}),
                     tx_options=0x1,  # Disable retries and route repair
                 )
             except Exception:
-                pass
+                return False  # Keep the records for the next attempt
+            records = None
+            self._lost = 0
+            self._limited = 0
+            for _ in range(n):
+                self._buffer[self._head] = None
+                self._head = (self._head + 1) % _BUFFER_SIZE
+            self._count -= n
+        return True
 
     def debug(self, msg, *args, **kwargs):
         """Write debug logs."""
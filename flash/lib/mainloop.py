@@ -15,6 +15,10 @@ class Task:
         """Init the class."""
         self._callback = callback
         self._period = period
+        self.arm(next_run)
+
+    def arm(self, next_run=None):
+        """Set the time of the next execution."""
         if next_run is None:
             self._next_run = ticks_ms()
         else:
@@ -22,6 +26,8 @@ class Task:
 
     def run(self):
         """Execute the task and return the next scheduled time."""
+        if not self._period:
+            self._next_run = None  # Unless the callback arms the task again
         try:
             collect()
             self._callback()
@@ -37,15 +43,12 @@ class Task:
             collect()
             return self._next_run
 
-        self._callback = None
         collect()
-        return None
+        return self._next_run
 
     @property
     def next_run(self):
         """Return the time of the next scheduled execution or None if completed."""
-        if self._callback is None:
-            return None
         return self._next_run
 
 
@@ -69,6 +72,14 @@ class Loop:
         collect()
         return task
 
+    def rearm(self, task, next_run=None):
+        """Schedule the existing task to run again."""
+        task.arm(next_run)
+        if task not in self._tasks:
+            self._tasks.append(task)
+        self._task_scheduled = True
+        return task
+
     def remove_task(self, task):
         """Remove task if scheduled."""
         if task is not None and task in self._tasks:
@@ -171,6 +182,11 @@ class Loop:
 
         return next_time
 
+    @property
+    def task_count(self):
+        """Return the number of scheduled tasks."""
+        return len(self._tasks)
+
     def stop(self):
         """Stop the loop after current iteration."""
         self._stop = True
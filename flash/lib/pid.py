@@ -0,0 +1,63 @@
+"""PID controller with anti-windup."""
+
+from time import ticks_diff, ticks_ms
+
+
+class PID:
+    """
+    PID controller producing a demand level between 0 and output_max.
+
+    The derivative acts on the measurement, so it predicts the rise that
+    continues after the output drops instead of kicking on setpoint changes.
+    The integral only accumulates while the output is not saturated.
+    """
+
+    def __init__(self, kp, ki=0, kd=0, output_max=100):
+        """Init the class."""
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.output_max = output_max
+        self._value = None
+        self._time = None
+        self._derivative = 0
+        self._integral = 0
+
+    def reset(self):
+        """Clear the integral."""
+        self._integral = 0
+
+    def demand(self, setpoint):
+        """Return the demand for the last measurement."""
+        if self._value is None:
+            return 0
+        output = (
+            self.kp * (setpoint - self._value)
+            + self.ki * self._integral
+            - self.kd * self._derivative
+        )
+        return min(max(output, 0), self.output_max)
+
+    def update(self, setpoint, value):
+        """Take the new measurement and return the demand."""
+        now = ticks_ms()
+        dt = 0
+        if self._value is not None:
+            dt = max(ticks_diff(now, self._time) / 1000, 0)
+            if dt:
+                self._derivative = (value - self._value) / dt
+        self._value = value
+        self._time = now
+
+        demand = self.demand(setpoint)
+        error = setpoint - value
+        # Anti-windup: do not push the integral further into saturation
+        if (
+            dt
+            and self.ki
+            and (demand < self.output_max or error < 0)
+            and (demand > 0 or error > 0)
+        ):
+            self._integral += error * dt
+            demand = self.demand(setpoint)
+        return demand
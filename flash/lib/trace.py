@@ -0,0 +1,69 @@
+"""Fixed-size binary trace of the recent events."""
+
+from time import ticks_diff, ticks_ms
+
+from micropython import const
+
+EV_STATE = const(1)  # Duty cycle state
+EV_PUMP = const(2)  # Pump off/on
+EV_BLOCKED = const(3)  # Pump start blocked
+EV_REQUEST = const(4)  # Duty cycle start/stop scheduled
+EV_ZONE = const(5)  # Zone number << 1 | on
+EV_VALVES = const(6)  # Valve number + 1 opened, 0 when all closed
+EV_DROP_VALVE = const(7)  # Pressure drop valve closed/open
+EV_HUMIDIFIER = const(8)  # Humidifier number << 1 | on
+EV_STALE = const(9)  # Humidifier number with a stalled sensor
+EV_SCHEDULE = const(10)  # Humidifier number with a schedule entry applied
+
+_SIZE = const(64)
+_RECORD = const(4)
+
+
+class Trace:
+    """Ring buffer of (time delta, event, arg) records, 4 bytes each."""
+
+    def __init__(self, size=_SIZE):
+        """Init the class."""
+        self._buffer = bytearray(size * _RECORD)
+        self._pos = 0
+        self._full = False
+        self._last = ticks_ms()
+
+    def record(self, event, arg=0):
+        """Add the record, overwriting the oldest one when full."""
+        now = ticks_ms()
+        delta = ticks_diff(now, self._last)
+        self._last = now
+        if delta < 0:
+            delta = 0
+        elif delta > 0x7FFF:
+            # Longer delays are kept in seconds
+            delta = 0x8000 | min(delta // 1000, 0x7FFF)
+        buffer = self._buffer
+        pos = self._pos
+        buffer[pos] = delta & 0xFF
+        buffer[pos + 1] = delta >> 8
+        buffer[pos + 2] = event
+        buffer[pos + 3] = arg & 0xFF
+        pos += _RECORD
+        if pos >= len(buffer):
+            pos = 0
+            self._full = True
+        self._pos = pos
+
+    def age(self):
+        """Return the time since the last record in ms."""
+        return ticks_diff(ticks_ms(), self._last)
+
+    def read(self, offset, size=64):
+        """Return the total size and a chunk of the trace, oldest record first."""
+        buffer = self._buffer
+        total = len(buffer) if self._full else self._pos
+        start = self._pos if self._full else 0
+        data = bytearray()
+        for x in range(offset, min(offset + size, total)):
+            data.append(buffer[(start + x) % len(buffer)])
+        return total, bytes(data)
+
+
+trace = Trace()
@@ -1,6 +1,8 @@
 """Interface to the XBee pins with as core.Sensor classes."""
 
-from lib.core import Sensor
+from array import array
+
+from lib.core import Number, Sensor
 from machine import ADC, PWM, Pin
 
 
@@ -41,8 +43,8 @@ class DigitalInput(Sensor):
         return self._pin.value()
 
 
-class AnalogOutput(Sensor):
-    """PWM output."""
+class AnalogOutput(Number):
+    """PWM output with ramps."""
 
     _cache = True
 
@@ -61,17 +63,55 @@ class AnalogOutput(Sensor):
 
 
 class AnalogInput(Sensor):
-    """ADC Input."""
+    """ADC Input, optionally oversampled and decimated."""
 
     _readonly = True
     _period = 500
     _lowpass = 1000000
 
-    def __init__(self, gpio, *args, **kwargs):
+    def __init__(self, gpio, *args, samples=1, median=False, decimation=1, **kwargs):
         """Init the class."""
         self._pin = ADC(gpio)
+        self._samples = array("H", bytes(2 * samples))
+        self._median = median
+        self._decimation = decimation
+        self._total = 0
+        self._count = 0
+        self.variance = 0
         super().__init__(*args, **kwargs)
 
+    def update(self, auto=False):
+        """Read a burst, report the mean of every decimation bursts."""
+        self._total += self._get()
+        self._count += 1
+        if auto and self._count < self._decimation:
+            return
+        value = (self._total + self._count // 2) // self._count
+        self._total = 0
+        self._count = 0
+        self._update_state(value, auto)
+
     def _get(self):
-        """Get pin state."""
-        return self._pin.read()
+        """Read a burst of samples and return their mean or median."""
+        samples = self._samples
+        n = len(samples)
+        if n == 1:
+            return self._pin.read()
+        total = 0
+        square = 0
+        for x in range(n):
+            value = self._pin.read()
+            samples[x] = value
+            total += value
+            square += value * value
+        self.variance = (square - total * total / n) / (n - 1)
+        if not self._median:
+            return (total + n // 2) // n
+        for x in range(1, n):
+            value = samples[x]
+            y = x - 1
+            while y >= 0 and samples[y] > value:
+                samples[y + 1] = samples[y]
+                y -= 1
+            samples[y + 1] = value
+        return samples[n // 2]
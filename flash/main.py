@@ -15,6 +15,7 @@ except ImportError:
 
 from __init__ import main_loop
 from lib import logging
+from lib.crashlog import crash_log
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -25,3 +26,4 @@ except BaseException as e:
     raise
 finally:
     _LOGGER.error("Mainloop exited")
+    crash_log.stop()
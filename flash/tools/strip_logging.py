@@ -0,0 +1,287 @@
+"""Transform logger calls in the firmware sources.
+
+This runs on the build host with CPython before mpy-cross. Calls below the
+given level are removed, and with a catalog the message strings are replaced
+with numeric ids that the custom component expands back to text. The
+transformed calls are padded with empty lines so that line numbers in
+tracebacks still match the original sources.
+"""
+
+import argparse
+import ast
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+LEVELS = {
+    "debug": 10,
+    "info": 20,
+    "warning": 30,
+    "error": 40,
+    "critical": 50,
+}
+
+LOGGER_NAME = "_LOGGER"
+CATALOG_NAME = "LOG_CATALOG"
+
+
+def _parse_level(level):
+    """Convert level name or number to number."""
+    if level.isdigit():
+        return int(level)
+    return LEVELS[level.lower()]
+
+
+def _is_stripped_call(node, level):
+    """Check if the statement is a logger call below the level."""
+    return (
+        isinstance(node, ast.Expr)
+        and isinstance(node.value, ast.Call)
+        and isinstance(node.value.func, ast.Attribute)
+        and isinstance(node.value.func.value, ast.Name)
+        and node.value.func.value.id == LOGGER_NAME
+        and LEVELS.get(node.value.func.attr, level) < level
+    )
+
+
+def strip(source, level):
+    """Return the source without the logger calls and the number of calls removed."""
+    lines = source.splitlines(keepends=True)
+    removed = 0
+    for node in ast.walk(ast.parse(source)):
+        if not _is_stripped_call(node, level):
+            continue
+        first = lines[node.lineno - 1]
+        last = lines[node.end_lineno - 1]
+        if first[: node.col_offset].strip() or last[node.end_col_offset :].strip():
+            continue  # Not alone on its lines, leave it as is
+        lines[node.lineno - 1] = first[: node.col_offset] + "pass\n"
+        for number in range(node.lineno, node.end_lineno):
+            lines[number] = "\n"
+        removed += 1
+    return "".join(lines), removed
+
+
+def _replace(lines, node, text):
+    """Replace the source of the node keeping the line numbers."""
+    first = lines[node.lineno - 1]
+    last = lines[node.end_lineno - 1]
+    lines[node.lineno - 1] = (
+        first[: node.col_offset] + text + last[node.end_col_offset :]
+    )
+    for number in range(node.lineno, node.end_lineno):
+        lines[number] = "\n"
+
+
+def _message(node):
+    """Return the {}-style format string and the args of a logger call or None."""
+    if (
+        not isinstance(node, ast.Call)
+        or not isinstance(node.func, ast.Attribute)
+        or not isinstance(node.func.value, ast.Name)
+        or node.func.value.id != LOGGER_NAME
+        or node.func.attr not in LEVELS
+        or node.keywords
+        or not node.args
+        or any(isinstance(arg, ast.Starred) for arg in node.args)
+    ):
+        return None
+
+    msg = node.args[0]
+    if isinstance(msg, ast.Constant) and isinstance(msg.value, str):
+        if len(node.args) == 1:
+            return msg.value.replace("{", "{{").replace("}", "}}"), []
+        # Only plain %s placeholders can be converted to the format syntax
+        if re.search("%[^s%]", msg.value.replace("%%", "")):
+            return None
+        fmt = msg.value.replace("{", "{{").replace("}", "}}")
+        fmt = re.sub("%(.)", lambda m: "{}" if m.group(1) == "s" else "%", fmt)
+        return fmt, node.args[1:]
+
+    if (
+        len(node.args) == 1
+        and isinstance(msg, ast.Call)
+        and isinstance(msg.func, ast.Attribute)
+        and msg.func.attr == "format"
+        and isinstance(msg.func.value, ast.Constant)
+        and isinstance(msg.func.value.value, str)
+        and not msg.keywords
+        and not any(isinstance(arg, ast.Starred) for arg in msg.args)
+    ):
+        return msg.func.value.value, msg.args
+
+    return None
+
+
+def messages(source):
+    """Return the format strings of the logger calls in the source."""
+    result = []
+    for node in sorted(
+        (node for node in ast.walk(ast.parse(source)) if hasattr(node, "lineno")),
+        key=lambda node: (node.lineno, node.col_offset),
+    ):
+        message = _message(node)
+        if message is not None and message[0] not in result:
+            result.append(message[0])
+    return result
+
+
+def load_catalog(path):
+    """Read the catalog module, return a dict of format strings to ids."""
+    try:
+        with open(path) as f:
+            tree = ast.parse(f.read())
+    except FileNotFoundError:
+        return {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and node.targets[0].id == CATALOG_NAME:
+            return {fmt: msg_id for msg_id, fmt in ast.literal_eval(node.value).items()}
+    return {}
+
+
+def update_catalog(path, files):
+    """Add new messages from the files to the catalog, keeping existing ids."""
+    catalog = load_catalog(path)
+    next_id = max(catalog.values(), default=0) + 1
+    for name in files:
+        with open(name) as f:
+            for fmt in messages(f.read()):
+                if fmt not in catalog:
+                    catalog[fmt] = next_id
+                    next_id += 1
+
+    with open(path, "w") as f:
+        f.write(
+            '"""Log message catalog generated by flash/tools/strip_logging.py."""\n'
+            "\n"
+            "# Do not edit or renumber, the ids are used by the deployed firmware\n"
+            f"{CATALOG_NAME} = {{\n"
+        )
+        for fmt, msg_id in sorted(catalog.items(), key=lambda x: x[1]):
+            f.write(f"    {msg_id}: {json.dumps(fmt)},\n")
+        f.write("}\n")
+    return catalog
+
+
+def apply_catalog(source, catalog):
+    """Replace the catalogued messages with their ids."""
+    lines = source.splitlines(keepends=True)
+    replacements = []
+    for node in ast.walk(ast.parse(source)):
+        message = _message(node)
+        if message is None or message[0] not in catalog:
+            continue
+        args = [str(catalog[message[0]])] + [ast.unparse(arg) for arg in message[1]]
+        replacements.append(
+            (node, "{}.{}({})".format(LOGGER_NAME, node.func.attr, ", ".join(args)))
+        )
+    # Replace from the end so that the offsets of earlier nodes stay valid
+    for node, text in sorted(
+        replacements, key=lambda x: (x[0].lineno, x[0].col_offset), reverse=True
+    ):
+        _replace(lines, node, text)
+    return "".join(lines), len(replacements)
+
+
+def _mpy_size(mpy_cross, source, name):
+    """Compile the source and return the size of the result."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        src = os.path.join(tmpdir, "module.py")
+        out = os.path.join(tmpdir, "module.mpy")
+        with open(src, "w") as f:
+            f.write(source)
+        subprocess.run(
+            [*mpy_cross.split(), "-s", name, "-o", out, src],
+            check=True,
+        )
+        return os.path.getsize(out)
+
+
+def report(files, level, mpy_cross):
+    """Print the size savings per module."""
+    print(
+        "{:<24} {:>6} {:>10} {:>10} {:>8} {:>10}".format(
+            "module", "calls", "mpy", "stripped", "saved", "str bytes"
+        )
+    )
+    total = [0, 0, 0]
+    for name in files:
+        with open(name) as f:
+            source = f.read()
+        stripped, removed = strip(source, level)
+        # String constants of the removed calls are not loaded into the heap
+        literals = sum(
+            len(node.value)
+            for node in ast.walk(ast.parse(source))
+            if isinstance(node, ast.Constant) and isinstance(node.value, str)
+        ) - sum(
+            len(node.value)
+            for node in ast.walk(ast.parse(stripped))
+            if isinstance(node, ast.Constant) and isinstance(node.value, str)
+        )
+        size = _mpy_size(mpy_cross, source, name)
+        new_size = _mpy_size(mpy_cross, stripped, name)
+        total[0] += size
+        total[1] += new_size
+        total[2] += literals
+        print(
+            "{:<24} {:>6} {:>10} {:>10} {:>8} {:>10}".format(
+                name, removed, size, new_size, size - new_size, literals
+            )
+        )
+    print(
+        "{:<24} {:>6} {:>10} {:>10} {:>8} {:>10}".format(
+            "total", "", total[0], total[1], total[0] - total[1], total[2]
+        )
+    )
+
+
+def main(argv=None):
+    """Run the transform from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--level", default="0", help="lowest level to keep (default: keep all)"
+    )
+    parser.add_argument(
+        "--report",
+        action="store_true",
+        help="print the size savings per module instead of the sources",
+    )
+    parser.add_argument(
+        "--mpy-cross", default="mpy-cross", help="mpy-cross command for --report"
+    )
+    parser.add_argument(
+        "--catalog", help="replace the messages found in this catalog with ids"
+    )
+    parser.add_argument(
+        "--update-catalog",
+        action="store_true",
+        help="add the messages from the files to the catalog instead",
+    )
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args(argv)
+    level = _parse_level(args.level)
+
+    if args.update_catalog:
+        update_catalog(args.catalog, args.files)
+        return 0
+
+    if args.report:
+        report(args.files, level, args.mpy_cross)
+        return 0
+
+    catalog = load_catalog(args.catalog) if args.catalog else None
+    for name in args.files:
+        with open(name) as f:
+            source = strip(f.read(), level)[0]
+        if catalog:
+            source = apply_catalog(source, catalog)[0]
+        sys.stdout.write(source)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,23 @@
 """Interface to tosr0x relays with as core.Sensor classes."""
 
+from time import ticks_diff, ticks_ms
+
+from config import zone_count  # Set before config imports this module
 from lib import logging
-from lib.core import Sensor
+from lib.core import Sensor, SwitchBank
+from lib.mainloop import main_loop
+from micropython import const
 from tosr0x import Tosr0x
 
+_LOGGER = logging.getLogger(__name__)
+
+_STALE_PERIODS = const(3)
+
 try:
-    _tosr = Tosr0x()
+    _tosr = Tosr0x(zone_count + 1)
 except Exception as e:
     Tosr0x.tosr0x_reset()
-    logging.getLogger(__name__).error("{}: {}".format(type(e).__name__, e))
+    _LOGGER.error("{}: {}".format(type(e).__name__, e))
     raise e
 
 
@@ -16,34 +25,125 @@ class TosrSwitch(Sensor):
     """TOSR0X relay."""
 
     _type = bool
-    _period = 5000
 
     def __init__(self, switch_number, *args, **kwargs):
         """Init the class."""
         self._switch_number = switch_number
         super().__init__(*args, **kwargs)
 
-    def _get(self):
-        """Get relay state."""
-        _tosr.update()
-        return _tosr.get_relay_state(self._switch_number)
+    def update(self, auto=False):
+        """Request the relay state, the triggers run once it is received."""
+        _tosr.update_async(lambda ok: self._updated(ok, auto))
+
+    def _updated(self, ok, auto):
+        """Process the relay state."""
+        if ok:
+            self._update_state(_tosr.get_relay_state(self._switch_number), auto)
 
     def _set(self, value):
         """Set relay state."""
-        _tosr.set_relay_state(self._switch_number, value)
+        _tosr.set_relay_state_async(
+            self._switch_number, value, lambda ok: self._set_done(ok)
+        )
+
+    def _set_done(self, ok):
+        """Read the actual state back if the relay was not switched."""
+        if not ok:
+            _LOGGER.error("Failed to update relay state")
+            self.update()
 
 
 class TosrTemp(Sensor):
-    """TOSR0X-T temperature sensor."""
+    """TOSR0X-T temperature sensor with the last good reading cached."""
 
     _readonly = True
     _period = 30000
     _lowpass = 1875
 
-    def _get(self):
-        """Get the temperature."""
-        return _tosr.temperature
+    def __init__(self, *args, **kwargs):
+        """Init the class."""
+        self._pending = False
+        self._time = None
+        super().__init__(*args, **kwargs)
+
+    def update(self, auto=False):
+        """Request the temperature, the triggers run once it is received."""
+        if self._pending:
+            return
+        self._pending = True
+        _tosr.temperature_async(lambda value: self._updated(value, auto))
+
+    def _updated(self, value, auto):
+        """Process the temperature."""
+        self._pending = False
+        if value is None:
+            _LOGGER.error("Failed to get temperature")
+        else:
+            self._time = ticks_ms()
+            self._update_state(value, auto)
+
+    @property
+    def age(self):
+        """Return the time since the last good reading in ms or None."""
+        if self._time is None:
+            return None
+        return ticks_diff(ticks_ms(), self._time)
+
+    @property
+    def stale(self):
+        """Return True if several readings in a row have failed."""
+        age = self.age
+        return age is None or age > _STALE_PERIODS * (self._period or 0)
+
+
+class TosrRelayBank(SwitchBank):
+    """TOSR0X relays polled and switched together with single commands."""
+
+    _period = 5000
+
+    def __init__(self, switches):
+        """Init the class."""
+        super().__init__(switches)
+        _tosr.status_callback = lambda states: self._status(states)
+        self._updates = main_loop.schedule_task(
+            lambda: self.poll(), period=self._period
+        )
+
+    def __del__(self):
+        """Cancel callbacks."""
+        main_loop.remove_task(self._updates)
+        _tosr.status_callback = None
+
+    def poll(self):
+        """Read the relay states unless a recent status is already known."""
+        age = _tosr.status_age()
+        if age is None or age >= self._period:
+            _tosr.update_async(force=True)
+
+    def _status(self, states):
+        """Pass every status read to the switches."""
+        for switch in self._switches:
+            switch._update_state(
+                bool(states & (1 << (switch._switch_number - 1))), auto=True
+            )
+
+    def set(self, states):
+        """Update the relays, None keeps the relay as is."""
+        mask = 0
+        for switch, state in zip(self._switches, states):
+            if state is not None:
+                switch._store(bool(state))
+            if switch.state:
+                mask |= 1 << (switch._switch_number - 1)
+        _tosr.set_relays_async(mask, lambda ok: self._set_done(ok))
+
+    def _set_done(self, ok):
+        """Read the actual states back if the relays were not switched."""
+        if not ok:
+            _LOGGER.error("Failed to update relay state")
+            _tosr.update_async(force=True)
 
 
-tosr_switch = [TosrSwitch(x + 1) for x in range(4)]
+tosr_switch = [TosrSwitch(x + 1) for x in range(zone_count + 1)]
 tosr_temp = TosrTemp()
+valve_bank = TosrRelayBank(tosr_switch)
@@ -3,8 +3,36 @@
 from sys import stdin, stdout
 from time import sleep_ms, ticks_diff, ticks_ms
 
+from lib.mainloop import main_loop
+from micropython import const
 from xbee import atcmd
 
+_POLL_PERIOD = const(10)
+_TIMEOUT = const(100)
+_RETRY = const(10)
+_UPDATE_PERIOD = const(300)
+_BUFFER_SIZE = const(8)
+_MAX_RELAYS = const(8)
+_RELAY_ON = "efghijkl"
+_RELAY_OFF = "opqrstuv"
+
+# Responses are read in place to avoid allocating on every chunk
+_buffer = bytearray(_BUFFER_SIZE)
+_view = memoryview(_buffer)
+
+
+def _readinto(view):
+    """Read the available serial data into the view, return the number of bytes."""
+    stream = stdin.buffer
+    if hasattr(stream, "readinto"):
+        return stream.readinto(view) or 0
+    data = stream.read()
+    if data is None:
+        return 0
+    n = min(len(data), len(view))
+    view[:n] = data[:n]
+    return n
+
 
 class Tosr0x:
     """Class implementing tosr protocol."""
@@ -12,8 +40,18 @@ class Tosr0x:
     _states = 0
     _lastupdate = None
 
-    def __init__(self):
+    def __init__(self, relays=4):
         """Init the class."""
+        if not 0 < relays <= _MAX_RELAYS:
+            raise ValueError("Invalid relay count {}".format(relays))
+        self._relays = relays
+        self._mask = (1 << relays) - 1
+        self._queue = []
+        self._request = None
+        self._task = None
+        self._update_callbacks = None
+        self._writes = 0
+        self.status_callback = None
         Tosr0x.tosr0x_reset()
 
     def tosr0x_reset():
@@ -21,82 +59,242 @@ class Tosr0x:
         atcmd("AP", 4)
         sleep_ms(200)
         stdout.buffer.write("n")
-        stdin.buffer.read()
+        _readinto(_view)
 
     def _read(cmd=None, n=1, timeout=100, retry=1):
         """
-        Read serial data, returns less data on timeout.
+        Send the command and wait for the response, blocking.
 
-        May return more than requested if there is more data in read buffer.
+        Only used to detect the board before the main loop starts. Returns less data
+        on timeout, up to the buffer size if more data is available.
         """
         for _ in range(retry):
             if cmd is not None:
-                stdin.buffer.read()
+                _readinto(_view)
                 stdout.buffer.write(cmd)
-            data = b""
+            pos = 0
             now = ticks_ms()
-            while len(data) < n and ticks_diff(ticks_ms(), now) <= timeout:
-                r = stdin.buffer.read()
-                if r is not None:
-                    data += r
-            if len(data) == n:
+            while pos < n and ticks_diff(ticks_ms(), now) <= timeout:
+                pos += _readinto(_view[pos:])
+            if pos == n:
                 break
-        return data
+        return bytes(_view[:pos])
 
-    def set_relay_state(self, switch_number, state):
-        """Update relay state."""
-        state = bool(state)
-        current_state = not state
-        iteration = 0
-        while current_state != state:
-            if iteration >= 10:
-                raise RuntimeError("Failed to update relay state")
-            iteration = iteration + 1
-            stdout.buffer.write(
-                ("defghijkl" if state else "nopqrstuv")[
-                    switch_number : switch_number + 1
-                ]
-            )
-            self._lastupdate = None
-            self.update()
-            if switch_number:
-                current_state = self.get_relay_state(switch_number)
-            elif state:
-                current_state = (
-                    self.get_relay_state(1)
-                    & self.get_relay_state(2)
-                    & self.get_relay_state(3)
-                    & self.get_relay_state(4)
-                )
-            else:
-                current_state = self.get_relay_state(0)
+    def status_age(self):
+        """Return the time since the last status read in ms or None."""
+        if self._lastupdate is None:
+            return None
+        return ticks_diff(ticks_ms(), self._lastupdate)
 
     def get_relay_state(self, switch_number):
         """Get cached relay state."""
         return (
             bool(self._states & (2 ** (switch_number - 1)))
             if switch_number
-            else bool(self._states & 0xF)
+            else bool(self._states & self._mask)
         )
 
-    def update(self):
-        """Update the switch states, ratelimited."""
-        if self._lastupdate is None or ticks_diff(ticks_ms(), self._lastupdate) >= 300:
-            data = Tosr0x._read("[", 1, retry=10)
-            if len(data) != 1:
-                raise RuntimeError("Failed to get relay state: {}".format(data))
-            self._states = int.from_bytes(data, "big")
+    def request(self, cmd, n, callback, retry=_RETRY, timeout=_TIMEOUT):
+        """
+        Queue the command without blocking the main loop.
+
+        The callback receives the response or None if it is not received after all
+        retries.
+        """
+        self._queue.append([cmd, n, callback, retry, timeout, None, None])
+        if self._task is None:
+            self._task = main_loop.schedule_task(lambda: self._poll())
+
+    def _poll(self):
+        """Advance the current request, called from the main loop."""
+        # The requests queued by the callbacks are picked up by this loop
+        try:
+            self._advance()
+        finally:
+            if self._request is None and not self._queue:
+                self._task = None
+            else:
+                main_loop.rearm(self._task, _POLL_PERIOD)
+
+    def _advance(self):
+        """Send the queued commands until one waits for its response."""
+        while True:
+            request = self._request
+            if request is None:
+                if not self._queue:
+                    return
+                request = self._request = self._queue.pop(0)
+                request[3] -= 1
+                _readinto(_view)
+                stdout.buffer.write(request[0])
+                request[5] = 0
+                request[6] = ticks_ms()
+
+            if request[5] < request[1]:
+                request[5] += _readinto(_view[request[5] :])
+            if request[5] < request[1] and (
+                ticks_diff(ticks_ms(), request[6]) <= request[4]
+            ):
+                return  # Wait for more data
+
+            self._request = None
+            if request[5] == request[1]:
+                # The callback must not keep the buffer
+                request[2](_view[: request[1]])
+            elif request[3] > 0:
+                self._queue.insert(0, request)
+            else:
+                request[2](None)
+
+    def update_async(self, callback=None, force=False):
+        """
+        Update the switch states without blocking, ratelimited.
+
+        The callback receives True on success or False on failure.
+        """
+        if (
+            not force
+            and self._lastupdate is not None
+            and ticks_diff(ticks_ms(), self._lastupdate) < _UPDATE_PERIOD
+        ):
+            if callback is not None:
+                callback(True)
+            return
+
+        if not force and self._update_callbacks is not None:
+            # Share the pending status read
+            if callback is not None:
+                self._update_callbacks.append(callback)
+            return
+
+        callbacks = [] if callback is None else [callback]
+        if not force:
+            self._update_callbacks = callbacks
+        self._read_status(callbacks)
+
+    def _read_status(self, callbacks):
+        """Queue a status read tagged with the relay writes queued so far."""
+        writes = self._writes
+        self.request("[", 1, lambda data: self._update_done(data, callbacks, writes))
+
+    def _update_done(self, data, callbacks, writes):
+        """Store the switch states and notify the callbacks."""
+        if data is not None and writes != self._writes:
+            # Queued before the latest relay write, the states may be outdated
+            if callbacks:
+                self._read_status(callbacks)
+            return
+        if data is not None:
+            self._states = data[0]
             self._lastupdate = ticks_ms()
+            if self.status_callback is not None:
+                self.status_callback(self._states)
+        if callbacks is self._update_callbacks:
+            self._update_callbacks = None
+        for callback in callbacks:
+            callback(data is not None)
 
-    @property
-    def temperature(self):
-        """Read TOSR0-T temperature."""
-        data = Tosr0x._read("a", 2, retry=10)
-        if len(data) != 2:
-            raise RuntimeError("Failed to get temperature: {}".format(data))
+    def set_relay_state_async(self, switch_number, state, callback=None, retry=_RETRY):
+        """
+        Update relay state without blocking.
+
+        The callback receives True when the state is confirmed or False on failure.
+        """
+        state = bool(state)
+        self._write(
+            ("d" + _RELAY_ON if state else "n" + _RELAY_OFF)[
+                switch_number : switch_number + 1
+            ],
+            lambda _: self.update_async(
+                lambda ok: self._set_relay_state_done(
+                    ok, switch_number, state, callback, retry - 1
+                ),
+                force=True,
+            ),
+        )
+
+    def _write(self, cmd, callback):
+        """Queue a relay command, the status reads queued before it are ignored."""
+        self._writes += 1
+        self._update_callbacks = None
+        self.request(cmd, 0, callback)
+
+    def _set_relay_state_done(self, ok, switch_number, state, callback, retry):
+        """Verify the relay state and retry if not updated."""
+        if ok:
+            if switch_number:
+                current_state = self.get_relay_state(switch_number)
+            elif state:
+                current_state = self._states & self._mask == self._mask
+            else:
+                current_state = self.get_relay_state(0)
+            ok = current_state == state
+        if ok or retry <= 0:
+            if callback is not None:
+                callback(ok)
+            return
+        self.set_relay_state_async(switch_number, state, callback, retry)
+
+    def _relay_commands(self, mask):
+        """
+        Return the shortest command string to switch the relays to the mask.
+
+        The relays of the board beyond the relay count are kept off.
+        """
+        current = self._states
+        single = ""
+        all_on = "d"
+        all_off = "n"
+        for n in range(_MAX_RELAYS):
+            bit = 1 << n
+            if (current ^ mask) & bit:
+                single += (_RELAY_ON if mask & bit else _RELAY_OFF)[n]
+            if mask & bit:
+                all_off += _RELAY_ON[n]
+            else:
+                all_on += _RELAY_OFF[n]
+        return min(single, all_on, all_off, key=len)
+
+    def set_relays_async(self, mask, callback=None, retry=_RETRY):
+        """
+        Switch all relays to the bitmask with one status read to verify.
+
+        The callback receives True when the states are confirmed or False on failure.
+        """
+        cmd = self._relay_commands(mask & self._mask)
+        if cmd:
+            self._write(cmd, lambda _: self._verify_relays(mask, callback, retry))
+        else:
+            self._verify_relays(mask, callback, retry)
+
+    def _verify_relays(self, mask, callback, retry):
+        """Read the relay states back."""
+        self.update_async(
+            lambda ok: self._set_relays_done(ok, mask, callback, retry - 1),
+            force=True,
+        )
+
+    def _set_relays_done(self, ok, mask, callback, retry):
+        """Verify the relay states and retry if not updated."""
+        ok = ok and self._states & self._mask == mask & self._mask
+        if ok or retry <= 0:
+            if callback is not None:
+                callback(ok)
+            return
+        self.set_relays_async(mask, callback, retry)
+
+    def temperature_async(self, callback):
+        """Read TOSR0-T temperature without blocking, None on failure."""
+        self.request(
+            "a",
+            2,
+            lambda data: callback(None if data is None else Tosr0x._temperature(data)),
+        )
 
-        temp = int.from_bytes(data, "big")
-        return (temp / 16 - 4096) if temp > 32767 else (temp / 16)
+    def _temperature(data):
+        """Convert the raw temperature reading."""
+        temp = data[0] << 8 | data[1]
+        return (temp - 0x10000 if temp & 0x8000 else temp) / 16
 
 
 def tosr0x_version():
@@ -1,7 +1,17 @@
 """Tests for xbee_humidifier."""
 
+import gc as real_gc  # noqa: F401
 import sys
+import tempfile
 
 sys.path = ["tests/modules", "flash"] + sys.path
 sys.modules["time"] = __import__("mock_time")
 sys.modules["gc"] = __import__("mock_gc")
+
+import dutycycle  # noqa: E402
+from lib import crashlog  # noqa: E402
+
+# Keep the crash log and the counters written by the tests out of the working tree
+_tmpdir = tempfile.mkdtemp()
+crashlog.crash_log.path = _tmpdir + "/crash.log"
+dutycycle.COUNTERS_PATH = _tmpdir + "/counters.bin"
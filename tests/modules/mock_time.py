@@ -10,7 +10,7 @@ def _time_pass(t):
 
 
 sleep_ms = MagicMock(side_effect=_time_pass)
-sleep = MagicMock(side_effect=lambda x: _time_pass(x * 1000))
+sleep = MagicMock(side_effect=lambda x: _time_pass(int(x * 1000)))
 
 
 def ticks_add(ticks, delta):
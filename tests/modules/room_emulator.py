@@ -0,0 +1,28 @@
+"""Room humidity model to run the humidifier controllers against."""
+
+
+class RoomEmulator:
+    """
+    Room humidified by a high-pressure mist system.
+
+    The mist output follows the pump with the time constant `lag` seconds, so
+    the room keeps humidifying after the pump stops. With the pump on, the
+    humidity rises by up to `rate` percent per second, and it leaks towards
+    `ambient` with the time constant `leak` seconds.
+    """
+
+    def __init__(self, humidity=40.0, ambient=30.0, rate=0.01, lag=600, leak=7200):
+        """Init the class."""
+        self.humidity = humidity
+        self.ambient = ambient
+        self.rate = rate
+        self.lag = lag
+        self.leak = leak
+        self.mist = 0.0
+        self.pump = False
+
+    def step(self, seconds):
+        """Advance the model by the number of seconds."""
+        for _ in range(seconds):
+            self.mist += (self.rate * self.pump - self.mist) / self.lag
+            self.humidity += self.mist - (self.humidity - self.ambient) / self.leak
@@ -8,11 +8,24 @@ mock_temperature = PropertyMock(return_value=0)
 type(mock_tosr).temperature = mock_temperature
 mock_temperature.return_value = 42
 mock_tosr.get_relay_state.return_value = True
+mock_tosr.status_age.return_value = None
+mock_tosr.update_async.side_effect = lambda callback=None, force=False: (
+    callback is not None and callback(True)
+)
+mock_tosr.set_relay_state_async.side_effect = (
+    lambda switch_number, state, callback=None: callback is not None and callback(True)
+)
+mock_tosr.set_relays_async.side_effect = (
+    lambda mask, callback=None: callback is not None and callback(True)
+)
+mock_tosr.temperature_async.side_effect = lambda callback: callback(
+    mock_tosr.temperature
+)
 
 tosr0x_version = MagicMock()
 tosr0x_version.return_value = None
 
 
-def Tosr0x():
+def Tosr0x(relays=4):
     """Fake Tosr0x class constructor returning MagickMock instead."""
     return mock_tosr
@@ -0,0 +1,124 @@
+"""TOSR04-T board emulator to run the driver against the byte-level protocol."""
+
+from random import Random
+from time import sleep_ms, ticks_diff, ticks_ms
+
+_RELAY_ON = "defgh"
+_RELAY_OFF = "nopqr"
+
+
+class Tosr0xEmulator:
+    """
+    Stand-in for both stdin and stdout connected to a TOSR04-T board.
+
+    Responses arrive after `delay` ms, every response byte is lost with the
+    probability `loss`, relays change state `switch_delay` ms after the command,
+    and the temperature changes by `drift` degrees per second. Every read of the
+    UART takes `read_cost` ms.
+    """
+
+    def __init__(
+        self,
+        delay=0,
+        loss=0.0,
+        switch_delay=0,
+        temperature=25.0,
+        drift=0.0,
+        read_cost=1,
+        version=0x0F,
+        seed=0,
+    ):
+        """Init the class."""
+        self.buffer = self
+        self.delay = delay
+        self.loss = loss
+        self.switch_delay = switch_delay
+        self.temperature = temperature
+        self.drift = drift
+        self.read_cost = read_cost
+        self.version = version
+        self._random = Random(seed)
+        self._start = ticks_ms()
+        self._relays = 0
+        self._relay_changes = []
+        self._outgoing = []
+        self.commands = 0
+        self.bytes_sent = 0
+        self.bytes_lost = 0
+
+    @property
+    def relays(self):
+        """Return the relay bitmask."""
+        now = ticks_ms()
+        while self._relay_changes and ticks_diff(now, self._relay_changes[0][0]) >= 0:
+            self._relays = self._relay_changes.pop(0)[1](self._relays)
+        return self._relays
+
+    def current_temperature(self):
+        """Return the temperature at the current time."""
+        return (
+            self.temperature + self.drift * ticks_diff(ticks_ms(), self._start) / 1000
+        )
+
+    def _send(self, data):
+        """Queue the response bytes."""
+        ready = ticks_ms() + self.delay
+        for byte in data:
+            if self._random.random() < self.loss:
+                self.bytes_lost += 1
+                continue
+            self._outgoing.append((ready, byte))
+
+    def _switch(self, change):
+        """Change the relays after the switch delay."""
+        self._relay_changes.append((ticks_ms() + self.switch_delay, change))
+
+    def write(self, data):
+        """Process the commands."""
+        for cmd in data:
+            self.commands += 1
+            if cmd in _RELAY_ON:
+                n = _RELAY_ON.index(cmd)
+                self._switch(
+                    (lambda n: lambda r: r | (0xF if n == 0 else 1 << (n - 1)))(n)
+                )
+            elif cmd in _RELAY_OFF:
+                n = _RELAY_OFF.index(cmd)
+                self._switch(
+                    (lambda n: lambda r: r & ~(0xF if n == 0 else 1 << (n - 1)))(n)
+                )
+            elif cmd == "[":
+                self._send(bytes([self.relays]))
+            elif cmd == "a":
+                temp = round(self.current_temperature() * 16) & 0xFFFF
+                self._send(temp.to_bytes(2, "big"))
+            elif cmd == "Z":
+                self._send(bytes([0x0F, self.version]))
+
+    def _take(self, limit):
+        """Return the bytes that have arrived."""
+        sleep_ms(self.read_cost)
+        now = ticks_ms()
+        n = 0
+        while (
+            n < len(self._outgoing)
+            and n < limit
+            and ticks_diff(now, self._outgoing[n][0]) >= 0
+        ):
+            n += 1
+        data = bytes(byte for _, byte in self._outgoing[:n])
+        del self._outgoing[:n]
+        self.bytes_sent += n
+        return data
+
+    def read(self):
+        """Return the available bytes or None."""
+        return self._take(len(self._outgoing)) or None
+
+    def readinto(self, view):
+        """Fill the view with the available bytes."""
+        data = self._take(len(view))
+        if not data:
+            return None
+        view[: len(data)] = data
+        return len(data)
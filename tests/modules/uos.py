@@ -6,6 +6,7 @@ chdir = MagicMock()
 getcwd = MagicMock()
 compile = MagicMock()  # noqa: PBP113
 remove = MagicMock()
+rename = MagicMock()
 sync = MagicMock()
 bundle = MagicMock()
 listdir = MagicMock()
@@ -22,7 +22,7 @@ def test_bundle_compile():
     assert "main.mpy" not in bundle._bundle_list
     assert all(x[-4:] == ".mpy" for x in bundle._bundle_list)
     assert len(bundle._bundle_list) > 0
-    assert len(bundle._bundle_list) <= 10
+    assert len(bundle._bundle_list) <= 16
     assert len(bundle._bundle_list) == len(set(bundle._bundle_list))
 
     mock_listdir.return_value = ["test.py"]
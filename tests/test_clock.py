@@ -0,0 +1,32 @@
+"""Test clock lib."""
+
+from time import sleep as mock_sleep, ticks_ms as mock_ticks_ms
+
+from lib.clock import Clock
+
+
+def test_clock():
+    """Test the wall clock."""
+    ticks = mock_ticks_ms.return_value
+    clock = Clock()
+    assert clock.time() is None
+    assert clock.local_minute() is None
+
+    # 2023-11-14 22:13:20 UTC, a Tuesday
+    clock.set(1700000000)
+    assert clock.local_minute() == (1, 22 * 60 + 13)
+    mock_sleep(1.5)
+    assert clock.time() == 1700000001
+
+    # The reference moves forward every hour
+    mock_sleep(7200)
+    assert clock.time() == 1700007201
+    assert clock._time == 1700007201
+    mock_sleep(0.5)
+    assert clock.time() == 1700007202
+    mock_ticks_ms.return_value = ticks
+
+    # Local time is three hours ahead, it is Wednesday already
+    clock.set(1700000000)
+    clock.utc_offset = 180
+    assert clock.local_minute() == (2, 73)
@@ -3,12 +3,13 @@
 import logging
 from json import loads as json_loads
 from time import sleep as mock_sleep
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 import commands
 import config
 import pytest
 from humidifier import Humidifier
+from lib.clock import clock
 from lib.core import Sensor, Switch
 from lib.mainloop import main_loop
 from machine import reset_cause as mock_reset_cause, soft_reset as mock_soft_reset
@@ -46,6 +47,8 @@ def test_commands():
     ]
 
     pump_block = Switch()
+    duty_cycle = MagicMock()
+    duty_cycle.state = "idle"
 
     cmnds = commands.HumidifierCommands(
         humidifier=humidifier,
@@ -53,6 +56,7 @@ def test_commands():
         available=humidifier_available,
         zone=humidifier_zone,
         pump_block=pump_block,
+        duty_cycle=duty_cycle,
     )
 
     mock_receive.reset_mock()
@@ -128,27 +132,36 @@ def test_commands():
         "aux_led",
         "available",
         "bind",
+        "crashlog",
         "cur_hum",
+        "cycle_state",
         "fan",
         "help",
         "hum",
+        "log_stats",
         "logger",
         "mode",
         "pressure_in",
+        "pressure_in_variance",
         "pump",
         "pump_block",
         "pump_speed",
+        "pump_stats",
         "pump_temp",
         "reset_cause",
         "sav_hum",
+        "schedule",
         "soft_reset",
         "target_hum",
         "test",
+        "trace",
         "unbind",
         "unique_id",
         "uptime",
+        "utc_offset",
         "valve",
         "zone",
+        "zones",
     ]
 
     mock_atcmd.reset_mock()
@@ -193,6 +206,10 @@ def test_commands():
     config.pressure_in.state = 8.9
     assert mock_transmit.call_count == 0
     assert command("pressure_in") == 8.9
+    assert command("pressure_in_variance") is None
+    config.pressure_in.variance = 2.5
+    assert command("pressure_in_variance") == 2.5
+    del config.pressure_in.variance
 
     assert command("bind") == "OK"
     humidifier_sensor[0].state = 51.2
@@ -261,11 +278,16 @@ def test_commands():
     assert mock_transmit.call_count == 0
 
     assert command("pump_temp") == 34.8
+    with patch.object(type(config.pump_temp), "stale", True):
+        assert command("pump_temp") is None
 
     config.pump_speed.state = 314
     assert command("pump_speed") == 314
     assert command("pump_speed", 234) == "OK"
     assert config.pump_speed.state == 234
+    assert command("pump_speed", '{"state": 254, "rate": 100}') == "OK"
+    assert config.pump_speed.ramping
+    config.pump_speed.stop_ramp()
 
     config.fan.state = False
     assert not command("fan")
@@ -277,6 +299,11 @@ def test_commands():
     assert command("aux_led", "true") == "OK"
     assert config.aux_led.state
 
+    assert command("cycle_state") == "idle"
+    duty_cycle.stats.return_value = {"pump_starts": 3}
+    assert command("pump_stats") == {"pump_starts": 3}
+    assert command("zones") == {"zones": 3, "valves": 4, "drop_valve": 3}
+
     assert not command("pump_block")
     pump_block.state = True
     assert command("pump_block")
@@ -330,6 +357,13 @@ def test_commands():
         assert mock_getLogger.mock_calls[0][1] == ()
         assert mock_getLogger.mock_calls[1][0] == "().setTarget"
         assert mock_getLogger.mock_calls[1][1] == (b"\x00\x00\x00\x00\x00\x00\x00\x00",)
+        mock_getLogger.reset_mock()
+        mock_getLogger.return_value.stats.return_value = {
+            "dropped": 1,
+            "limited": 2,
+            "repeated": 3,
+        }
+        assert command("log_stats") == {"dropped": 1, "limited": 2, "repeated": 3}
 
     assert not config.pump.state
     assert command("pump", "true") == "OK"
@@ -357,6 +391,25 @@ def test_commands():
     assert command("uptime") == 1700000000
     mock_sleep(2)
     assert command("uptime") == 1700000000
+    assert clock.time() == 1700000000 + 10
+
+    assert command("utc_offset") == 0
+    assert command("utc_offset", 180) == "OK"
+    assert clock.utc_offset == 180
+    assert command("utc_offset", 0) == "OK"
+
+    assert command("schedule", 1) == []
+    assert (
+        command("schedule", '[1, [[31, 420, 55, "normal"], [96, 60, null, "away"]]]')
+        == "OK"
+    )
+    assert command("schedule", 1) == [
+        [31, 420, 55, "normal"],
+        [96, 60, None, "away"],
+    ]
+    with pytest.raises(RuntimeError, match="Invalid schedule entry 0"):
+        command("schedule", '[1, [[31, 1440, 55, "normal"]]]')
+    assert command("schedule", "[1, []]") == "OK"
 
     with pytest.raises(RuntimeError) as excinfo:
         command("valve")
@@ -398,3 +451,68 @@ def test_commands():
     mock_schedule_task.assert_called_once()
 
     mock_transmit.side_effect = None
+
+
+def test_command_retry():
+    """Test that a repeated request id replays the response without re-execution."""
+
+    cmnds = commands.HumidifierCommands(
+        humidifier=[],
+        sensor=[],
+        available=[Switch() for x in range(3)],
+        zone=[Switch() for x in range(3)],
+        pump_block=Switch(),
+    )
+
+    def command(payload, sender=b"\x00\x13\xa2\x00A\xa0n`"):
+        mock_transmit.reset_mock()
+        mock_receive.reset_mock()
+        mock_receive.return_value = {
+            "broadcast": False,
+            "dest_ep": 232,
+            "sender_eui64": sender,
+            "payload": payload,
+            "sender_nwk": 0,
+            "source_ep": 232,
+            "profile": 49413,
+            "cluster": 17,
+        }
+        cmnds.update()
+        assert mock_transmit.call_count == 1
+        return mock_transmit.call_args[0][1]
+
+    config.fan.state = False
+    with patch.object(cmnds, "cmd_fan", wraps=cmnds.cmd_fan) as mock_cmd_fan:
+        resp = command('{"cmd": "fan", "args": true, "id": 17}')
+        assert json_loads(resp)["fan_resp"] == "OK"
+        assert json_loads(resp)["id"] == 17
+        assert mock_cmd_fan.call_count == 1
+        nonce = cmnds.nonce
+
+        # Retry with the same id is not executed again
+        config.fan.state = False
+        assert command('{"cmd": "fan", "args": true, "id": 17}') == resp
+        assert mock_cmd_fan.call_count == 1
+        assert not config.fan.state
+        assert cmnds.nonce == nonce
+
+        # Same id from another host is a different request
+        resp = command('{"cmd": "fan", "args": true, "id": 17}', b"\x01" * 8)
+        assert json_loads(resp)["id"] == 17
+        assert mock_cmd_fan.call_count == 2
+        assert config.fan.state
+
+        # Requests without id are always executed
+        command('{"cmd": "fan"}')
+        command('{"cmd": "fan"}')
+        assert mock_cmd_fan.call_count == 4
+        assert "id" not in json_loads(mock_transmit.call_args[0][1])
+
+    # Only the most recent responses are kept
+    for x in range(4):
+        command('{"cmd": "test", "args": ' + str(x) + ', "id": ' + str(x) + "}")
+    assert cmnds.nonce == nonce + 7
+    command('{"cmd": "test", "args": 3, "id": 3}')
+    assert cmnds.nonce == nonce + 7
+    command('{"cmd": "fan", "args": true, "id": 17}')
+    assert cmnds.nonce == nonce + 8
@@ -1,9 +1,11 @@
 """Test core lib."""
 
+from time import sleep_ms
 from unittest import mock
 
 import pytest
 from lib import core
+from lib.mainloop import main_loop
 
 
 def test_subscription(caplog):
@@ -74,3 +76,58 @@ def test_virtual_sensor():
     sensor.state = 123
     assert sensor.state == 123
     callback.assert_called_once_with(123)
+
+
+def test_switch_bank():
+    """Test SwitchBank class."""
+    switches = [core.Switch(False) for x in range(3)]
+    callback = mock.MagicMock()
+    switches[1].subscribe(callback)
+    bank = core.SwitchBank(switches)
+    assert len(bank) == 3
+    assert bank[2] is switches[2]
+
+    bank.set([True, None, True])
+    assert [switch.state for switch in switches] == [True, False, True]
+    assert callback.call_count == 0
+
+    bank.set([False, True])
+    assert [switch.state for switch in switches] == [False, True, True]
+    callback.assert_called_once_with(True)
+
+
+def test_number_ramp():
+    """Test Number class ramps."""
+    main_loop.reset()
+    number = core.Number(0)
+    callback = mock.MagicMock()
+    number.subscribe(callback)
+    done = mock.MagicMock()
+
+    number.ramp(25, 100, done)
+    assert number.ramping
+    assert number.state == 0
+    for value in (10, 20, 25):
+        sleep_ms(100)
+        main_loop.run_once()
+        assert number.state == value
+    assert callback.call_args_list == [mock.call(10), mock.call(20), mock.call(25)]
+    done.assert_called_once_with()
+    assert not number.ramping
+
+    # A new value stops the ramp
+    number.ramp(0, 50)
+    sleep_ms(100)
+    main_loop.run_once()
+    assert number.state == 20
+    number.state = 100
+    sleep_ms(100)
+    main_loop.run_once()
+    assert number.state == 100
+    assert not number.ramping
+
+    # Without the rate the value is set at once
+    done.reset_mock()
+    number.ramp(7, 0, done)
+    assert number.state == 7
+    done.assert_called_once_with()
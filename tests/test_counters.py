@@ -0,0 +1,35 @@
+"""Test counters lib."""
+
+import os
+import tempfile
+
+from lib.counters import Counters
+
+
+def test_counters():
+    """Test the persisted counters."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "counters.bin")
+        counters = Counters(("a", "b"), path)
+        assert counters.as_dict() == {"a": 0, "b": 0}
+
+        counters.add(0)
+        counters.add(1, 5)
+        counters.add(1, 0xFFFFFFFF)
+        assert counters[0] == 1
+        assert counters[1] == 4
+
+        # The counters are restored from the file
+        counters.save()
+        assert os.path.getsize(path) == 8
+        assert Counters(("a", "b"), path).as_dict() == {"a": 1, "b": 4}
+
+        # New counters start from zero
+        assert Counters(("a", "b", "c"), path).as_dict() == {"a": 1, "b": 4, "c": 0}
+
+    # Without the path the counters are not persisted
+    counters = Counters(("a",))
+    counters.add(0)
+    counters.save()
+    counters.load()
+    assert counters[0] == 1
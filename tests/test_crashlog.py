@@ -0,0 +1,89 @@
+"""Test crashlog lib."""
+
+import json
+import os
+import struct
+import tempfile
+from time import sleep_ms, ticks_ms as mock_ticks_ms
+from unittest import mock
+
+from lib import crashlog
+from lib.mainloop import main_loop
+
+
+def parse(data):
+    """Split the log into records."""
+    records = []
+    while data:
+        event, arg, time, length = struct.unpack("<BBIB", data[:7])
+        records.append((event, arg, time, data[7 : 7 + length]))
+        data = data[7 + length :]
+    return records
+
+
+def test_crashlog():
+    """Test the crash log."""
+    with (
+        tempfile.TemporaryDirectory() as tmpdir,
+        mock.patch.object(crashlog, "uos", os),
+    ):
+        path = os.path.join(tmpdir, "crash.log")
+        log = crashlog.CrashLog(path)
+        assert log.read(0) == (0, b"")
+
+        mock_ticks_ms.return_value = 5000
+        log.start(5)
+        assert not os.path.exists(path)
+
+        # The records are written in a batch after a delay
+        log.log((40, "Test error"))
+        log.log((40, 3, [1]))
+        sleep_ms(5000)
+        main_loop.run_once()
+        with open(path, "rb") as f:
+            assert parse(f.read()) == [
+                (crashlog.EVENT_RESET, 5, 5, b""),
+                (crashlog.EVENT_LOG, 40, 5, b'["Test error"]'),
+                (crashlog.EVENT_LOG, 40, 5, b"[3, [1]]"),
+            ]
+
+        # The stats are written once collected
+        for _ in range(4):
+            log.snapshot()
+        size, data = log.read(0, 1024)
+        assert size == len(data)
+        records = parse(data)
+        assert len(records) == 7
+        assert records[-1][0] == crashlog.EVENT_STATS
+        assert struct.unpack("<II", records[-1][3]) == (12000, 20000)
+
+        # The chunks are read in sequence
+        assert log.read(0)[1] + log.read(64)[1] == data
+
+        # The file is rotated when full
+        for x in range(100):
+            log.log((40, "Error {}".format(x)))
+        log.flush()
+        assert os.path.exists(path + ".1")
+        size, data = log.read(0, 4096)
+        assert size == len(data)
+        assert size < 2048 + 256
+        assert parse(data)[-1][3] == b'["Error 99"]'
+
+        # Long records are shortened and stay valid JSON
+        log.log((40, '"' * 200))
+        log.log((40, 3, ["x" * 300]))
+        log.flush()
+        records = parse(log.read(0, 4096)[1])[-2:]
+        assert all(len(record[3]) <= 255 for record in records)
+        assert set(json.loads(records[0][3])[0]) == {'"'}
+        assert json.loads(records[1][3])[0].startswith("Log message 3: ['xxx")
+
+        # Records are kept on write errors
+        log.log((50, "Critical"))
+        with mock.patch("builtins.open", side_effect=OSError):
+            log.flush()
+        log.flush()
+        assert parse(log.read(0, 4096)[1])[-1][3] == b'["Critical"]'
+
+        log.stop()
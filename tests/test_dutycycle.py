@@ -1,12 +1,26 @@
 """Test duty cycle."""
 
+import tempfile
 from time import sleep as mock_sleep
 
 import dutycycle
+import pytest
 from humidifier import Humidifier
-from lib.core import Sensor, Switch
+from lib import trace
+from lib.core import Number, Sensor, Switch
+from lib.counters import Counters
 from lib.mainloop import main_loop
 
+from tests import real_gc
+
+
+@pytest.fixture(autouse=True)
+def finalize():
+    """Finalize the duty cycles of the test before the next one starts."""
+    yield
+    main_loop.reset()
+    real_gc.collect()
+
 
 def test_dutycycle():
     """Test DutyCycle class."""
@@ -65,6 +79,7 @@ def test_dutycycle():
     assert pressure_drop_time == duty_cycle._pressure_drop_time_ms / 1000
 
     # Check initial state
+    assert duty_cycle.state == "idle"
     assert not pump.state
     assert not tosr_switch[0].state
     assert not tosr_switch[1].state
@@ -85,6 +100,7 @@ def test_dutycycle():
     main_loop.run_once()
 
     # Check that the duty cycle is started
+    assert duty_cycle.state == "pumping"
     assert pump.state
     assert tosr_switch[0].state
     assert not tosr_switch[1].state
@@ -105,6 +121,7 @@ def test_dutycycle():
     main_loop.run_once()
 
     # Check that duty cycle has stopped, but the pressure drop valve isn't open yet
+    assert duty_cycle.state == "pressure_drop_wait"
     assert not pump.state
     assert tosr_switch[0].state
     assert not tosr_switch[1].state
@@ -115,6 +132,7 @@ def test_dutycycle():
     main_loop.run_once()
 
     # Check that the pressure drop valve has opened
+    assert duty_cycle.state == "draining"
     assert not pump.state
     assert tosr_switch[0].state
     assert not tosr_switch[1].state
@@ -125,6 +143,7 @@ def test_dutycycle():
     main_loop.run_once()
 
     # Check that the pressure drop has finished
+    assert duty_cycle.state == "cooldown"
     assert not pump.state
     assert not tosr_switch[0].state
     assert not tosr_switch[1].state
@@ -362,3 +381,584 @@ def test_dutycycle():
     assert not tosr_switch[1].state
     assert not tosr_switch[2].state
     assert not tosr_switch[3].state
+
+
+def test_dutycycle_soft_start():
+    """Test the pump speed ramps on start and stop."""
+    main_loop.reset()
+    valves = [Switch() for x in range(4)]
+    zones = [Switch() for x in range(3)]
+    humidifiers = [Switch() for x in range(3)]
+    pump = Switch()
+    pump_block = Switch()
+    pump_speed = Number(300)
+
+    duty_cycle = dutycycle.DutyCycle(
+        pump,
+        humidifiers,
+        zones,
+        valves,
+        pump_block,
+        60,
+        5,
+        55,
+        120,
+        pump_speed=pump_speed,
+        ramp_rate=1000,
+    )
+
+    zones[0].state = True
+    main_loop.run_once()
+
+    # The pump starts slowly and speeds up
+    assert pump.state
+    assert pump_speed.state == 0
+    assert pump_speed.ramping
+    mock_sleep(0.1)
+    main_loop.run_once()
+    assert pump_speed.state == 100
+    for _ in range(2):
+        mock_sleep(0.1)
+        main_loop.run_once()
+    assert pump_speed.state == 300
+    assert not pump_speed.ramping
+
+    # The pump slows down before stopping and the speed is restored
+    duty_cycle.stop_cycle()
+    assert pump.state
+    for _ in range(2):
+        mock_sleep(0.1)
+        main_loop.run_once()
+    assert pump.state
+    assert pump_speed.state == 100
+    mock_sleep(0.1)
+    main_loop.run_once()
+    assert not pump.state
+    assert pump_speed.state == 300
+
+    # A reversed stop keeps the run timeout
+    duty_cycle.start_cycle()
+    for _ in range(3):
+        mock_sleep(0.1)
+        main_loop.run_once()
+    duty_cycle.stop_cycle()
+    mock_sleep(0.1)
+    main_loop.run_once()
+    duty_cycle.start_cycle()
+    for _ in range(2):
+        mock_sleep(0.1)
+        main_loop.run_once()
+    assert pump_speed.state == 300
+    assert not pump_speed.ramping
+    mock_sleep(60)
+    main_loop.run_once()
+    assert pump.state
+    assert pump_speed.ramping
+
+    # The stop started by the timeout is not reversed
+    duty_cycle.start_cycle()
+    for _ in range(3):
+        mock_sleep(0.1)
+        main_loop.run_once()
+    assert not pump.state
+    assert pump_speed.state == 300
+
+    # The pump block stops the pump at once
+    for _ in range(2):
+        mock_sleep(60)
+        main_loop.run_once()
+    duty_cycle.start_cycle()
+    assert pump.state
+    pump_block.state = True
+    main_loop.run_once()
+    assert not pump.state
+    assert not pump_speed.ramping
+    assert pump_speed.state == 300
+
+    del duty_cycle
+    main_loop.reset()
+
+
+def test_dutycycle_exit():
+    """Test the pump stops at once when the main loop exits."""
+    main_loop.reset()
+    valves = [Switch() for x in range(4)]
+    zones = [Switch() for x in range(3)]
+    pump = Switch()
+    pump_speed = Number(300)
+
+    duty_cycle = dutycycle.DutyCycle(
+        pump,
+        [Switch() for x in range(3)],
+        zones,
+        valves,
+        Switch(),
+        60,
+        5,
+        55,
+        120,
+        pump_speed=pump_speed,
+        ramp_rate=1000,
+    )
+
+    zones[0].state = True
+    main_loop.run_once()
+    for _ in range(3):
+        mock_sleep(0.1)
+        main_loop.run_once()
+    assert pump.state
+    assert pump_speed.state == 300
+
+    def _exit():
+        raise SystemExit
+
+    main_loop.schedule_task(_exit)
+    with pytest.raises(SystemExit):
+        main_loop.run()
+    assert not pump.state
+    assert not pump_speed.ramping
+    assert pump_speed.state == 300
+
+    del duty_cycle
+    main_loop.reset()
+
+
+def test_dutycycle_demand():
+    """Test the pump runs sized by the humidity deficit."""
+    main_loop.reset()
+    valves = [Switch() for x in range(4)]
+    zones = [Switch() for x in range(3)]
+    sensors = [Sensor(40), Sensor(48), Sensor(55)]
+    humidifiers = [
+        Humidifier(
+            switch=zones[x],
+            sensor=sensors[x],
+            available_sensor=Switch(),
+            target_humidity=50,
+            dry_tolerance=3,
+            wet_tolerance=0,
+        )
+        for x in range(3)
+    ]
+    pump = Switch()
+    pump_block = Switch()
+
+    duty_cycle = dutycycle.DutyCycle(
+        pump,
+        humidifiers,
+        zones,
+        valves,
+        pump_block,
+        7 * 60,
+        5,
+        55,
+        120,
+        demand_run_time=30,
+    )
+
+    for humidifier in humidifiers:
+        humidifier.state = True
+    main_loop.run_once()
+    main_loop.run_once()
+    main_loop.run_once()
+
+    # Only the dry zones are open
+    assert [humidifier.deficit for humidifier in humidifiers] == [10, 2, -5]
+    assert pump.state
+    assert [valve.state for valve in valves] == [True, True, False, False]
+
+    # The zone close to the target completes after the minimum run
+    mock_sleep(60)
+    main_loop.run_once()
+    assert pump.state
+    assert [valve.state for valve in valves] == [True, False, False, False]
+
+    # The other zone runs for 30 seconds per percent of the deficit
+    mock_sleep(239)
+    main_loop.run_once()
+    assert pump.state
+    mock_sleep(1)
+    main_loop.run_once()
+    assert not pump.state
+    assert duty_cycle.state == "pressure_drop_wait"
+
+    mock_sleep(5)
+    main_loop.run_once()
+    mock_sleep(55)
+    main_loop.run_once()
+    mock_sleep(120)
+    main_loop.run_once()
+
+    # A zone that reaches the target drops out early
+    assert pump.state
+    assert [valve.state for valve in valves] == [True, True, False, False]
+    sensors[1].state = 50
+    main_loop.run_once()
+    assert not zones[1].state
+    assert pump.state
+    assert [valve.state for valve in valves] == [True, False, False, False]
+
+    # The run stops when no zone is left
+    sensors[0].state = 50
+    main_loop.run_once()
+    main_loop.run_once()
+    assert not pump.state
+
+    for delay in (5, 55, 120):
+        mock_sleep(delay)
+        main_loop.run_once()
+    assert duty_cycle.state == "idle"
+
+    # The run stops when the last running zone turns off before a completed one
+    sensors[0].state = 40
+    sensors[1].state = 46
+    main_loop.run_once()
+    main_loop.run_once()
+    main_loop.run_once()
+    assert pump.state
+    assert [valve.state for valve in valves] == [True, True, False, False]
+    mock_sleep(120)
+    main_loop.run_once()
+    assert zones[1].state
+    assert [valve.state for valve in valves] == [True, False, False, False]
+    sensors[0].state = 50
+    main_loop.run_once()
+    assert not zones[0].state
+    assert not pump.state
+    assert duty_cycle.state == "pressure_drop_wait"
+
+    del duty_cycle
+    main_loop.reset()
+
+
+def test_dutycycle_valve_slots():
+    """Test the valve slots weighted by the humidity deficit."""
+    main_loop.reset()
+    valves = [Switch() for x in range(4)]
+    zones = [Switch() for x in range(3)]
+    sensors = [Sensor(44), Sensor(48), Sensor(55)]
+    humidifiers = [
+        Humidifier(
+            switch=zones[x],
+            sensor=sensors[x],
+            available_sensor=Switch(),
+            target_humidity=50,
+            dry_tolerance=3,
+            wet_tolerance=0,
+        )
+        for x in range(3)
+    ]
+    pump = Switch()
+    pump_block = Switch()
+
+    duty_cycle = dutycycle.DutyCycle(
+        pump,
+        humidifiers,
+        zones,
+        valves,
+        pump_block,
+        80,
+        5,
+        55,
+        120,
+        valve_slot_time=1,
+    )
+    assert duty_cycle._slot_ms == 10000
+
+    switched = []
+    subscribers = [
+        valve.subscribe((lambda n: lambda x: switched.append((n, x)))(number))
+        for number, valve in enumerate(valves)
+    ]
+    for humidifier in humidifiers:
+        humidifier.state = True
+    main_loop.run_once()
+    main_loop.run_once()
+    main_loop.run_once()
+
+    # Only the valve of the first slot is switched at the pump start
+    assert switched == [(0, True)]
+    for valve, subscriber in zip(valves, subscribers):
+        valve.unsubscribe(subscriber)
+
+    # One zone is open at a time, in proportion to its deficit
+    slots = [0, 0, 0]
+    for _ in range(8):
+        assert pump.state
+        assert [valve.state for valve in valves].count(True) == 1
+        slots[[valve.state for valve in valves].index(True)] += 1
+        mock_sleep(10)
+        main_loop.run_once()
+    assert slots == [6, 2, 0]
+    assert not pump.state
+
+    # A zone reaching the target hands the slot over after the minimum slot time
+    for delay in (5, 55, 120):
+        mock_sleep(delay)
+        main_loop.run_once()
+    assert pump.state
+    assert valves[0].state
+    mock_sleep(4)
+    sensors[0].state = 50
+    main_loop.run_once()
+    assert not zones[0].state
+    assert [valve.state for valve in valves] == [True, False, False, False]
+    mock_sleep(6)
+    main_loop.run_once()
+    assert [valve.state for valve in valves] == [False, True, False, False]
+
+    del duty_cycle
+    main_loop.reset()
+
+
+def test_dutycycle_counters():
+    """Test the pump and valve counters."""
+    main_loop.reset()
+    valves = [Switch() for x in range(4)]
+    zones = [Switch() for x in range(3)]
+    pump = Switch()
+    pump_block = Switch()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = tmpdir + "/counters.bin"
+        duty_cycle = dutycycle.DutyCycle(
+            pump,
+            [Switch() for x in range(3)],
+            zones,
+            valves,
+            pump_block,
+            60,
+            5,
+            55,
+            120,
+            counters_path=path,
+        )
+
+        zones[1].state = True
+        main_loop.run_once()
+        assert pump.state
+        for delay in (30, 30, 5, 55):
+            mock_sleep(delay)
+            main_loop.run_once()
+        assert duty_cycle.state == "cooldown"
+
+        pump_block.state = True
+        duty_cycle.start_cycle()
+
+        assert duty_cycle.stats() == {
+            "pump_time": 60,
+            "pump_starts": 1,
+            "pump_timeouts": 1,
+            "blocked_starts": 1,
+            "drop_time": 55,
+            "valve_0_time": 0,
+            "valve_1_time": 120,
+            "valve_2_time": 0,
+            "valve_3_time": 55,
+        }
+
+        # The counters are saved on exit and restored on start
+        main_loop.remove_atexit(duty_cycle._atexit)
+        duty_cycle._exit()
+        assert Counters(dutycycle.COUNTERS, path)[1] == 1
+
+    del duty_cycle
+    main_loop.reset()
+
+
+def test_dutycycle_pressure_drop():
+    """Test the pressure drop ending on low pressure."""
+    main_loop.reset()
+    valves = [Switch() for x in range(4)]
+    zones = [Switch() for x in range(3)]
+    pump = Switch()
+    pressure = Sensor(2000)
+
+    duty_cycle = dutycycle.DutyCycle(
+        pump,
+        [Switch() for x in range(3)],
+        zones,
+        valves,
+        Switch(),
+        60,
+        5,
+        55,
+        120,
+        pressure=pressure,
+        drop_pressure=700,
+    )
+
+    zones[0].state = True
+    main_loop.run_once()
+    for delay in (60, 5):
+        mock_sleep(delay)
+        main_loop.run_once()
+    assert duty_cycle.state == "draining"
+    assert valves[3].state
+
+    # The drop valve stays open while the pressure is high
+    mock_sleep(10)
+    main_loop.run_once()
+    assert valves[3].state
+
+    # The drop ends once the pressure is low
+    pressure.state = 650
+    mock_sleep(0.5)
+    main_loop.run_once()
+    assert duty_cycle.state == "cooldown"
+    assert not any(valve.state for valve in valves)
+
+    # The next cycle starts after the idle time from the end of the drop
+    mock_sleep(119.5)
+    main_loop.run_once()
+    assert not pump.state
+    mock_sleep(0.5)
+    main_loop.run_once()
+    assert pump.state
+
+    # The fixed drop time is the upper bound
+    pressure.state = 2000
+    for delay in (60, 5, 54.5):
+        mock_sleep(delay)
+        main_loop.run_once()
+    assert valves[3].state
+    mock_sleep(0.5)
+    main_loop.run_once()
+    assert duty_cycle.state == "cooldown"
+    assert not valves[3].state
+
+    del duty_cycle
+    main_loop.reset()
+
+
+def test_dutycycle_zone_count():
+    """Test more zones with the pressure drop valve first."""
+    main_loop.reset()
+    valves = [Switch() for x in range(6)]
+    zones = [Switch() for x in range(5)]
+    pump = Switch()
+    pump_block = Switch()
+
+    # Every zone needs its valve besides the pressure drop valve
+    for valve_count, drop_valve in ((5, None), (6, 6), (6, -1)):
+        with pytest.raises(ValueError):
+            dutycycle.DutyCycle(
+                pump,
+                [Switch() for x in range(5)],
+                zones,
+                [Switch() for x in range(valve_count)],
+                pump_block,
+                60,
+                5,
+                55,
+                120,
+                drop_valve=drop_valve,
+            )
+
+    duty_cycle = dutycycle.DutyCycle(
+        pump,
+        [Switch() for x in range(5)],
+        zones,
+        valves,
+        pump_block,
+        60,
+        5,
+        55,
+        120,
+        drop_valve=0,
+    )
+
+    zones[1].state = True
+    zones[4].state = True
+    main_loop.run_once()
+    assert pump.state
+    assert [valve.state for valve in valves] == [False, False, True, False, False, True]
+
+    # The trace records the numbers of the opened valves
+    total, data = trace.trace.read(0)
+    total, data = trace.trace.read(total - 32, 32)
+    assert [
+        data[x + 3] for x in range(0, len(data), 4) if data[x + 2] == trace.EV_VALVES
+    ] == [3, 6]
+
+    for delay in (60, 5):
+        mock_sleep(delay)
+        main_loop.run_once()
+    assert duty_cycle.state == "draining"
+    assert valves[0].state
+
+    mock_sleep(55)
+    main_loop.run_once()
+    assert duty_cycle.state == "cooldown"
+    assert not any(valve.state for valve in valves)
+    assert duty_cycle.stats()["valve_0_time"] == 55
+    assert duty_cycle.stats()["valve_5_time"] == 120
+
+    del duty_cycle
+    main_loop.reset()
+
+    # Zones join and leave a demand run through their own valves
+    valves = [Switch() for x in range(6)]
+    zones = [Switch() for x in range(5)]
+    sensors = [Sensor(40) for x in range(5)]
+    humidifiers = [
+        Humidifier(
+            switch=zones[x],
+            sensor=sensors[x],
+            available_sensor=Switch(),
+            target_humidity=50,
+            dry_tolerance=3,
+            wet_tolerance=0,
+        )
+        for x in range(5)
+    ]
+    pump = Switch()
+
+    duty_cycle = dutycycle.DutyCycle(
+        pump,
+        humidifiers,
+        zones,
+        valves,
+        Switch(),
+        7 * 60,
+        5,
+        55,
+        120,
+        demand_run_time=30,
+        drop_valve=0,
+    )
+
+    humidifiers[2].state = True
+    main_loop.run_once()
+    main_loop.run_once()
+    assert pump.state
+    assert [valve.state for valve in valves] == [
+        False,
+        False,
+        False,
+        True,
+        False,
+        False,
+    ]
+
+    humidifiers[0].state = True
+    main_loop.run_once()
+    assert pump.state
+    assert duty_cycle.state == "pumping"
+    assert [valve.state for valve in valves] == [False, True, False, True, False, False]
+
+    sensors[0].state = 50
+    main_loop.run_once()
+    assert not zones[0].state
+    assert pump.state
+    assert [valve.state for valve in valves] == [
+        False,
+        False,
+        False,
+        True,
+        False,
+        False,
+    ]
+
+    del duty_cycle
+    main_loop.reset()
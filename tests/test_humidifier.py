@@ -5,6 +5,7 @@ from unittest.mock import MagicMock
 
 import pytest
 from humidifier import _MODE_AWAY as MODE_AWAY, _MODE_NORMAL as MODE_NORMAL, Humidifier
+from lib.clock import clock
 from lib.core import Sensor, Switch
 from lib.mainloop import main_loop
 
@@ -442,6 +443,13 @@ def test_sensor_stale_duration(caplog):
 
     assert not humidifier_switch.state
 
+    # The sensor updates do not schedule any tasks
+    tasks = list(main_loop._tasks)
+    for humidity in (24, 23):
+        _setup_sensor(humidity)
+        main_loop.run_once()
+    assert main_loop._tasks == tasks
+
     humidifier.humidity = 32
     main_loop.run_once()
 
@@ -481,3 +489,106 @@ def test_sensor_stale_duration(caplog):
     # Not turning on by itself
     assert not humidifier.state
     assert not humidifier_switch.state
+
+
+def test_pid_controller():
+    """Test the humidifier stops on the predicted demand."""
+    _setup_sensor(40)
+    humidifier = Humidifier(
+        switch=humidifier_switch,
+        sensor=humidifier_sensor,
+        available_sensor=Switch(),
+        target_humidity=50,
+        dry_tolerance=3,
+        pid=(1, 0, 300),
+    )
+    humidifier.state = True
+    main_loop.run_once()
+    assert humidifier_switch.state
+    assert humidifier.deficit == 10
+
+    # Rising by 1% a minute, the humidity is predicted to reach the target
+    for humidity in (41, 42, 43, 44):
+        mock_sleep(60)
+        _setup_sensor(humidity)
+        main_loop.run_once()
+        assert humidifier_switch.state
+        assert humidifier.deficit == 50 - humidity - 5
+    mock_sleep(60)
+    _setup_sensor(45)
+    main_loop.run_once()
+    assert not humidifier_switch.state
+    assert humidifier.deficit == 0
+
+    # Switched on again by the tolerance, not by the falling humidity
+    mock_sleep(60)
+    _setup_sensor(48)
+    main_loop.run_once()
+    mock_sleep(600)
+    _setup_sensor(47.5)
+    main_loop.run_once()
+    assert not humidifier_switch.state
+    mock_sleep(600)
+    _setup_sensor(47)
+    main_loop.run_once()
+    assert humidifier_switch.state
+
+    humidifier.state = False
+    main_loop.run_once()
+
+
+def test_schedule():
+    """Test the schedule entries applied on time."""
+    humidifier = Humidifier(
+        switch=humidifier_switch,
+        sensor=humidifier_sensor,
+        available_sensor=Switch(),
+        target_humidity=40,
+        away_humidity=30,
+    )
+    humidifier.schedule = [
+        (0b0000010, 23 * 60, 55, None),
+        (0b1111111, 23 * 60 + 5, None, "away"),
+        (0b0000001, 23 * 60, 60, "normal"),
+    ]
+    assert humidifier.schedule[1] == (0x7F, 23 * 60 + 5, None, "away")
+    with pytest.raises(ValueError):
+        humidifier.schedule = [(1, 0, 50, None)] * 17
+    for entry in (
+        (1, 1440, 50, None),
+        (1, 0, 255, None),
+        (1, 0, -1, None),
+        (0x80, 0, 50, None),
+        (1, 0, 50, "eco"),
+    ):
+        with pytest.raises(ValueError):
+            humidifier.schedule = [entry]
+    assert humidifier.schedule[1] == (0x7F, 23 * 60 + 5, None, "away")
+
+    # Tuesday, 22:50 UTC
+    clock.utc_offset = 0
+    clock.set(1700002200)
+    for _ in range(9):
+        mock_sleep(60)
+        main_loop.run_once()
+    assert humidifier.humidity == 40
+
+    mock_sleep(60)
+    main_loop.run_once()
+    assert humidifier.humidity == 55
+    assert humidifier.mode == "normal"
+
+    for _ in range(5):
+        mock_sleep(60)
+        main_loop.run_once()
+    assert humidifier.mode == "away"
+    assert humidifier.humidity == 30
+
+    # Setting the clock back does not replay the entries
+    clock.set(1700002200)
+    for _ in range(2):
+        mock_sleep(60)
+        main_loop.run_once()
+    humidifier.schedule = []
+    humidifier.mode = "normal"
+    assert humidifier.humidity == 55
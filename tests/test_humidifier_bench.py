@@ -0,0 +1,80 @@
+"""Benchmark the humidifier controllers against the room model.
+
+Run with `pytest -s tests/test_humidifier_bench.py` to see the results.
+"""
+
+from time import sleep as mock_sleep
+
+import pytest
+from humidifier import Humidifier
+from lib.core import Sensor, Switch
+from lib.mainloop import main_loop
+from room_emulator import RoomEmulator
+
+TARGET = 50
+
+
+def simulate(room, pid=None, hours=12, period=60):
+    """Run the humidifier on the room, return the overshoot and the pump starts."""
+    main_loop.reset()
+    zone = Switch()
+    sensor = Sensor()
+    humidifier = Humidifier(
+        switch=zone,
+        sensor=sensor,
+        available_sensor=Switch(),
+        target_humidity=TARGET,
+        dry_tolerance=3,
+        wet_tolerance=0,
+        pid=pid,
+    )
+    starts = []
+
+    def pump(value):
+        room.pump = value
+        if value:
+            starts.append(value)
+
+    zone.subscribe(pump)
+    humidifier.state = True
+
+    overshoot = 0
+    for _ in range(hours * 3600 // period):
+        sensor.state = round(room.humidity, 1)
+        main_loop.run_once()
+        room.step(period)
+        mock_sleep(period)
+        overshoot = max(overshoot, room.humidity - TARGET)
+
+    humidifier.state = False
+    main_loop.run_once()
+    return {"overshoot": overshoot, "starts": len(starts)}
+
+
+def report(name, results):
+    """Print a benchmark result."""
+    print(
+        "{:<36} {}".format(
+            name,
+            " ".join("{}={:.3g}".format(key, value) for key, value in results.items()),
+        )
+    )
+
+
+@pytest.mark.parametrize("lag", [300, 600, 900])
+def test_bench_overshoot(lag):
+    """Compare the overshoot of the bang-bang and the PID controllers."""
+    bang_bang = simulate(RoomEmulator(lag=lag))
+    pid = simulate(RoomEmulator(lag=lag), pid=(1, 0, 300))
+    report("bang-bang, lag {} s".format(lag), bang_bang)
+    report("pid, lag {} s".format(lag), pid)
+    assert pid["overshoot"] < bang_bang["overshoot"]
+    assert pid["starts"] <= bang_bang["starts"] * 1.5
+
+
+def test_bench_proportional_only():
+    """Test the PID controller without the integral and derivative terms."""
+    bang_bang = simulate(RoomEmulator())
+    proportional = simulate(RoomEmulator(), pid=(1, 0, 0))
+    report("proportional", proportional)
+    assert proportional == bang_bang
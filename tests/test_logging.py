@@ -1,7 +1,9 @@
 """Test logging lib."""
 
 from json import loads as json_loads
+from time import sleep_ms
 
+from lib.mainloop import main_loop
 from xbee import transmit as mock_transmit
 
 from flash.lib import logging
@@ -15,58 +17,58 @@ def test_logging():
 
     mock_transmit.reset_mock()
     logger.debug("Test debug message, %s", 123)
+    logger.info("Test info message, %s", "123")
+    logger.warning("Test warning message, %s", (123,))
+    assert mock_transmit.call_count == 0
+
+    # Records are sent in one frame by the main loop
+    sleep_ms(200)
+    main_loop.run_once()
     assert mock_transmit.call_count == 1
     assert mock_transmit.call_args[0][0] == b"\x00\x00\x00\x00\x00\x00\x00\x00"
     assert json_loads(mock_transmit.call_args[0][1]) == {
-        "log": {"sev": 10, "msg": "Test debug message, 123"},
+        "log": [
+            [10, "Test debug message, 123"],
+            [20, "Test info message, 123"],
+            [30, "Test warning message, (123,)"],
+        ],
         "nonce": 1,
     }
 
+    # Errors are sent immediately together with the pending records
     mock_transmit.reset_mock()
-    logger.info("Test info message, %s", "123")
+    logger.info("Test info message")
+    logger.error("Test error message, %s", {1: 23})
     assert mock_transmit.call_count == 1
-    assert mock_transmit.call_args[0][0] == b"\x00\x00\x00\x00\x00\x00\x00\x00"
     assert json_loads(mock_transmit.call_args[0][1]) == {
-        "log": {"sev": 20, "msg": "Test info message, 123"},
+        "log": [[20, "Test info message"], [40, "Test error message, {1: 23}"]],
         "nonce": 2,
     }
 
     mock_transmit.reset_mock()
-    logger.warning("Test warning message, %s", (123,))
+    logger.critical("Test critical message, %s, %s", True, False)
     assert mock_transmit.call_count == 1
-    assert mock_transmit.call_args[0][0] == b"\x00\x00\x00\x00\x00\x00\x00\x00"
     assert json_loads(mock_transmit.call_args[0][1]) == {
-        "log": {"sev": 30, "msg": "Test warning message, (123,)"},
+        "log": [[50, "Test critical message, True, False"]],
         "nonce": 3,
     }
 
-    mock_transmit.reset_mock()
-    logger.error("Test error message, %s", {1: 23})
-    assert mock_transmit.call_count == 1
-    assert mock_transmit.call_args[0][0] == b"\x00\x00\x00\x00\x00\x00\x00\x00"
-    assert json_loads(mock_transmit.call_args[0][1]) == {
-        "log": {"sev": 40, "msg": "Test error message, {1: 23}"},
-        "nonce": 4,
-    }
-
-    mock_transmit.reset_mock()
-    logger.critical("Test critical message, %s, %s", True, False)
+    sleep_ms(200)
+    main_loop.run_once()
     assert mock_transmit.call_count == 1
-    assert mock_transmit.call_args[0][0] == b"\x00\x00\x00\x00\x00\x00\x00\x00"
-    assert json_loads(mock_transmit.call_args[0][1]) == {
-        "log": {"sev": 50, "msg": "Test critical message, True, False"},
-        "nonce": 5,
-    }
 
     mock_transmit.reset_mock()
     logger.setTarget(b"\x01\x23\x45\x67\x89\xab\xcd\xef")
     logger.debug("Test debug message, %s", [1, 2, 3])
+    sleep_ms(200)
+    main_loop.run_once()
     assert mock_transmit.call_count == 1
     assert mock_transmit.call_args[0][0] == b"\x01\x23\x45\x67\x89\xab\xcd\xef"
     assert json_loads(mock_transmit.call_args[0][1]) == {
-        "log": {"sev": 10, "msg": "Test debug message, [1, 2, 3]"},
-        "nonce": 6,
+        "log": [[10, "Test debug message, [1, 2, 3]"]],
+        "nonce": 4,
     }
+    logger.setTarget()
 
     logger2 = logging.getLogger("tests")
     assert logger2 == logger
@@ -76,8 +78,159 @@ def test_logging():
     logger.setLevel(logging.INFO)
     assert logger.getEffectiveLevel() == logging.INFO
     logger.debug("Test debug message")
+    sleep_ms(200)
+    main_loop.run_once()
     assert mock_transmit.call_count == 0
+    logger.setLevel(logging.DEBUG)
 
     mock_transmit.side_effect = OSError("EAGAIN")
     logger.info("This message does not raise exception")
+    logger.error("This message is kept on transmit error")
+    assert mock_transmit.call_count == 1
+    sleep_ms(200)
+    main_loop.run_once()
+    assert mock_transmit.call_count == 2
+    mock_transmit.side_effect = None
+
+    # The records are retried later
+    mock_transmit.reset_mock()
+    sleep_ms(200)
+    main_loop.run_once()
+    assert mock_transmit.call_count == 1
+    assert json_loads(mock_transmit.call_args[0][1])["log"] == [
+        [20, "This message does not raise exception"],
+        [40, "This message is kept on transmit error"],
+    ]
+
+    # A failed error flush is retried without further records
+    mock_transmit.reset_mock()
+    mock_transmit.side_effect = OSError("EAGAIN")
+    logger.error("This error is retried")
+    assert mock_transmit.call_count == 1
     mock_transmit.side_effect = None
+    sleep_ms(200)
+    main_loop.run_once()
+    assert mock_transmit.call_count == 2
+    assert json_loads(mock_transmit.call_args[0][1])["log"] == [
+        [40, "This error is retried"]
+    ]
+
+
+def test_logging_overflow():
+    """Test that lost records are reported."""
+    logger = logging.Logger()
+
+    mock_transmit.reset_mock()
+    for x in range(20):
+        logger.debug("Message {}".format(x))
+    assert logger.dropped == 4
+
+    sleep_ms(200)
+    main_loop.run_once()
+    records = [
+        record
+        for call in mock_transmit.call_args_list
+        for record in json_loads(call[0][1])["log"]
+    ]
+    assert records[0] == [30, "4 log records lost"]
+    assert records[1:] == [[10, "Message {}".format(x)] for x in range(4, 20)]
+
+    # Long records are split across several frames
+    assert mock_transmit.call_count > 1
+    for call in mock_transmit.call_args_list:
+        assert len(call[0][1]) < 300
+
+    mock_transmit.reset_mock()
+    logger.error("Error")
+    assert json_loads(mock_transmit.call_args[0][1])["log"] == [[40, "Error"]]
+    assert logger.dropped == 4
+
+
+def test_logging_catalog():
+    """Test sending catalogued message ids."""
+    logger = logging.Logger()
+
+    mock_transmit.reset_mock()
+    logger.info(3, 1)
+    logger.error(39, ValueError, ValueError("Test"))
+    assert json_loads(mock_transmit.call_args[0][1])["log"] == [
+        [20, 3, [1]],
+        [40, 39, ["<class 'ValueError'>", "Test"]],
+    ]
+
+
+def test_logging_rate_limit():
+    """Test rate limiting and repeat suppression."""
+    logger = logging.Logger()
+
+    mock_transmit.reset_mock()
+    for x in range(5):
+        logger.error("Exception on transmit: %s", x)
+    assert mock_transmit.call_count == 5
+
+    # The source has run out of tokens
+    logger.error("Exception on transmit: %s", 5)
+    logger.error("Exception on transmit: %s", 6)
+    assert mock_transmit.call_count == 5
+    assert logger.limited == 2
+
+    # Other sources are not affected
+    logger.error("Other error")
+    assert mock_transmit.call_count == 6
+    assert json_loads(mock_transmit.call_args[0][1])["log"] == [
+        [30, "2 log records rate limited"],
+        [40, "Other error"],
+    ]
+
+    # Tokens are refilled over time
+    sleep_ms(1000)
+    logger.error("Exception on transmit: %s", 7)
+    assert json_loads(mock_transmit.call_args[0][1])["log"] == [
+        [40, "Exception on transmit: 7"]
+    ]
+
+    # Identical records are collapsed
+    mock_transmit.reset_mock()
+    for _ in range(10):
+        logger.error("callback error")
+    assert mock_transmit.call_count == 1
+    assert logger.repeated == 9
+    assert logger.limited == 2
+
+    sleep_ms(200)
+    main_loop.run_once()
+    assert mock_transmit.call_count == 2
+    assert json_loads(mock_transmit.call_args[0][1])["log"] == [
+        [40, "Last message repeated 9 times"]
+    ]
+
+    # The record is sent again once its repeats have been reported
+    mock_transmit.reset_mock()
+    logger.error("callback error")
+    assert mock_transmit.call_count == 1
+    assert json_loads(mock_transmit.call_args[0][1])["log"] == [[40, "callback error"]]
+    logger.error("callback error")
+    logger.warning("Another message")
+    sleep_ms(200)
+    main_loop.run_once()
+    assert json_loads(mock_transmit.call_args[0][1])["log"] == [
+        [40, "Last message repeated 1 times"],
+        [30, "Another message"],
+    ]
+
+    assert logger.stats() == {"dropped": 0, "limited": 2, "repeated": 10}
+
+    # The rate limited count is reported without further records
+    mock_transmit.reset_mock()
+    for x in range(6):
+        logger.warning("Pump pressure: %s", x)
+    sleep_ms(200)
+    main_loop.run_once()
+    mock_transmit.reset_mock()
+    logger.warning("Pump pressure: %s", 6)
+    sleep_ms(200)
+    main_loop.run_once()
+    assert mock_transmit.call_count == 1
+    assert json_loads(mock_transmit.call_args[0][1])["log"] == [
+        [30, "1 log records rate limited"]
+    ]
@@ -168,6 +168,32 @@ def test_loop():
     assert callback.call_count == 1
 
 
+def test_rearm():
+    """Test re-arming a task."""
+    mock_ticks_ms.return_value = 1000
+    loop = mainloop.Loop()
+    callback = mock.MagicMock()
+    task = mainloop.Task(callback)
+
+    # The task is scheduled once
+    assert loop.rearm(task, 100) is task
+    assert loop.rearm(task, 200) is task
+    assert loop.task_count == 1
+    assert loop.next_run == 1200
+    mock_ticks_ms.return_value = 1200
+    assert loop.run_once() is None
+    callback.assert_called_once_with()
+    assert loop.task_count == 0
+
+    # The task can arm itself from the callback
+    callback.reset_mock()
+    callback.side_effect = lambda: loop.rearm(task, 50)
+    loop.rearm(task)
+    assert loop.run_once() == 1250
+    callback.assert_called_once_with()
+    assert loop.task_count == 1
+
+
 def test_systemexit():
     """Test SystemExit exception handling."""
     callback = mock.MagicMock(side_effect=SystemExit)
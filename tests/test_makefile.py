@@ -4,6 +4,14 @@ import os
 import tempfile
 
 import mpy_cross
+from tools.strip_logging import (
+    apply_catalog,
+    load_catalog,
+    main as strip_logging_main,
+    messages,
+    strip,
+    update_catalog,
+)
 
 _mpy_cross_path = os.path.dirname(mpy_cross.mpy_cross)
 if _mpy_cross_path not in os.environ["PATH"]:
@@ -17,3 +25,143 @@ def test_make():
         os.system(f"cp -r flash/* {tmpdir}")
         assert os.system(f"make -C {tmpdir}") == 0
         assert os.system(f"make -C {tmpdir} clean") == 0
+
+
+def test_make_strip_logging():
+    """Test compilation with debug logging removed."""
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.system(f"cp -r flash/* {tmpdir}")
+        assert os.system(f"make -C {tmpdir} dutycycle.mpy") == 0
+        size = os.path.getsize(f"{tmpdir}/dutycycle.mpy")
+        assert os.system(f"make -C {tmpdir} clean") == 0
+        assert os.system(f"make -C {tmpdir} LOG_LEVEL=info") == 0
+        assert os.path.getsize(f"{tmpdir}/dutycycle.mpy") < size
+        assert os.path.exists(f"{tmpdir}/lib/core.mpy")
+        assert not any(name.endswith(".stripped.py") for name in os.listdir(tmpdir))
+        assert os.system(f"make -C {tmpdir} log-report") == 0
+        assert os.system(f"make -C {tmpdir} clean") == 0
+
+
+def test_make_log_catalog():
+    """Test compilation with catalogued log messages."""
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.system(f"cp -r flash/* {tmpdir}")
+        catalog = f"{tmpdir}/log_catalog.py"
+        assert os.system(f"make -C {tmpdir} log-catalog LOG_CATALOG={catalog}") == 0
+        assert "Closing all valves" in load_catalog(catalog)
+        assert os.system(f"make -C {tmpdir} CATALOG=1 LOG_CATALOG={catalog}") == 0
+        assert os.path.exists(f"{tmpdir}/lib/core.mpy")
+        assert os.system(f"make -C {tmpdir} clean") == 0
+
+
+def test_log_catalog_up_to_date():
+    """Test that the catalog of the custom component has all firmware messages."""
+    catalog = load_catalog("custom_components/xbee_humidifier/log_catalog.py")
+    for root in ("flash", "flash/lib"):
+        for name in os.listdir(root):
+            if name.endswith(".py"):
+                with open(os.path.join(root, name)) as f:
+                    for fmt in messages(f.read()):
+                        assert fmt in catalog, f"Run make log-catalog for: {fmt}"
+
+
+def test_strip_logging(capsys):
+    """Test removing the logger calls from the source."""
+    source = (
+        "def f(x):\n"
+        "    if x:\n"
+        '        _LOGGER.debug("x is {}".format(\n'
+        "            x\n"
+        "        ))\n"
+        "    else:\n"
+        '        _LOGGER.info("no x")\n'
+        '    _LOGGER.error("error")\n'
+        '    y = 1; _LOGGER.debug("inline")\n'
+        '    logger.debug("other logger")\n'
+        "    return x\n"
+    )
+
+    stripped, removed = strip(source, 20)
+    assert removed == 1
+    assert stripped == (
+        "def f(x):\n"
+        "    if x:\n"
+        "        pass\n"
+        "\n"
+        "\n"
+        "    else:\n"
+        '        _LOGGER.info("no x")\n'
+        '    _LOGGER.error("error")\n'
+        '    y = 1; _LOGGER.debug("inline")\n'
+        '    logger.debug("other logger")\n'
+        "    return x\n"
+    )
+
+    stripped, removed = strip(source, 40)
+    assert removed == 2
+    assert "_LOGGER.info" not in stripped
+    assert "_LOGGER.error" in stripped
+
+    with tempfile.NamedTemporaryFile("w", suffix=".py") as f:
+        f.write(source)
+        f.flush()
+        assert strip_logging_main(["--level", "30", f.name]) == 0
+    assert capsys.readouterr().out == strip(source, 30)[0]
+
+
+def test_log_catalog():
+    """Test replacing the log messages with catalog ids."""
+    source = (
+        "def f(x):\n"
+        '    _LOGGER.debug("x is {}, {}".format(\n'
+        "        x, x + 1\n"
+        "    ))\n"
+        '    main_loop.schedule_task(lambda: _LOGGER.info("Started {x}"))\n'
+        '    _LOGGER.warning("x is %s, 100%%", x)\n'
+        '    _LOGGER.warning("x is %d", x)\n'
+        '    _LOGGER.error("Not in catalog")\n'
+        "    return x\n"
+    )
+    assert messages(source) == [
+        "x is {}, {}",
+        "Started {{x}}",
+        "x is {}, 100%",
+        "Not in catalog",
+    ]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "log_catalog.py")
+        with open(path, "w") as f:
+            f.write('LOG_CATALOG = {\n    1: "Old message",\n}\n')
+        with open(os.path.join(tmpdir, "module.py"), "w") as f:
+            f.write(source)
+        update_catalog(path, [os.path.join(tmpdir, "module.py")])
+        catalog = load_catalog(path)
+        assert catalog == {
+            "Old message": 1,
+            "x is {}, {}": 2,
+            "Started {{x}}": 3,
+            "x is {}, 100%": 4,
+            "Not in catalog": 5,
+        }
+        namespace = {}
+        with open(path) as f:
+            exec(f.read(), namespace)  # noqa: S102
+        assert namespace["LOG_CATALOG"][3].format() == "Started {x}"
+
+    del catalog["Not in catalog"]
+    result, replaced = apply_catalog(source, catalog)
+    assert replaced == 3
+    assert result == (
+        "def f(x):\n"
+        "    _LOGGER.debug(2, x, x + 1)\n"
+        "\n"
+        "\n"
+        "    main_loop.schedule_task(lambda: _LOGGER.info(3))\n"
+        "    _LOGGER.warning(4, x)\n"
+        '    _LOGGER.warning("x is %d", x)\n'
+        '    _LOGGER.error("Not in catalog")\n'
+        "    return x\n"
+    )
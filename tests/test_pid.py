@@ -0,0 +1,35 @@
+"""Test pid lib."""
+
+from time import sleep as mock_sleep
+
+from lib.pid import PID
+
+
+def test_pid():
+    """Test the PID controller."""
+    pid = PID(2, 0.01, 100, output_max=20)
+    assert pid.demand(50) == 0
+
+    assert pid.update(50, 45) == 10
+    assert pid.demand(47) == 4
+
+    # The rise predicts the humidity to come
+    mock_sleep(100)
+    # P = 2 * 3, I = 0.01 * 3 * 100, D = -100 * 2 / 100
+    assert pid.update(50, 47) == 7
+    assert pid.demand(60) == 20
+
+    # The integral does not wind up while saturated
+    integral = pid._integral
+    mock_sleep(100)
+    assert pid.update(80, 47) == 20
+    assert pid._integral == integral
+
+    # Nor below zero
+    mock_sleep(100)
+    assert pid.update(40, 47) == 0
+    assert pid._integral == integral
+
+    pid.reset()
+    assert pid.demand(47) == 0
+    assert pid.demand(48) == 2
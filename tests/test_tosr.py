@@ -6,7 +6,7 @@ from unittest.mock import MagicMock, patch
 
 import pytest
 from lib.mainloop import main_loop
-from tosr import TosrSwitch, TosrTemp, tosr_switch, tosr_temp
+from tosr import TosrSwitch, TosrTemp, tosr_switch, tosr_temp, valve_bank
 from tosr0x import mock_temperature, mock_tosr
 
 
@@ -34,36 +34,51 @@ def test_tosr_switch():
     tosr_switch[0].update()
     assert not tosr_switch[0].state
 
+    # The switches are not polled separately
     mock_tosr.get_relay_state.reset_mock()
-    mock_tosr.update.reset_mock()
+    mock_tosr.update_async.reset_mock()
     tosr_switch_2 = TosrSwitch(2)
     assert mock_tosr.get_relay_state.call_count == 1
-    assert mock_tosr.update.call_count == 1
+    assert mock_tosr.update_async.call_count == 1
     sleep_ms(30000)
     main_loop.run_once()
-    assert mock_tosr.get_relay_state.call_count == 2
+    assert mock_tosr.get_relay_state.call_count == 1
+    assert mock_tosr.update_async.call_count == 1
     assert not tosr_switch_2.state
-    assert mock_tosr.get_relay_state.call_count == 2
-    assert mock_tosr.update.call_count == 2
 
-    mock_tosr.get_relay_state.reset_mock()
-    mock_tosr.update.reset_mock()
+
+def test_tosr_relay_bank_poll():
+    """Test the shared relay status poll."""
+    for switch in tosr_switch:
+        switch.state = False
     callback = MagicMock()
-    tosr_switch_2.subscribe(callback)
-    sleep_ms(30000)
-    main_loop.run_once()
-    assert mock_tosr.update.call_count == 1
-    assert mock_tosr.get_relay_state.call_count == 1
-    assert callback.call_count == 0
+    tosr_switch[1].subscribe(callback)
 
+    # One status read for all relays
     mock_tosr.get_relay_state.reset_mock()
-    mock_tosr.update.reset_mock()
-    mock_tosr.get_relay_state.return_value = True
-    sleep_ms(30000)
-    main_loop.run_once()
-    assert mock_tosr.update.call_count == 1
-    assert mock_tosr.get_relay_state.call_count == 1
+    mock_tosr.update_async.reset_mock()
+    valve_bank.poll()
+    mock_tosr.update_async.assert_called_once_with(force=True)
+
+    # Every status read is passed to the switches
+    mock_tosr.status_callback(0b0010)
+    assert [switch.state for switch in tosr_switch] == [False, True, False, False]
     callback.assert_called_once_with(True)
+    mock_tosr.status_callback(0b0010)
+    callback.assert_called_once_with(True)
+    assert mock_tosr.get_relay_state.call_count == 0
+
+    # A recent status read, e.g. after a relay update, is reused
+    mock_tosr.update_async.reset_mock()
+    mock_tosr.status_age.return_value = 1000
+    valve_bank.poll()
+    assert mock_tosr.update_async.call_count == 0
+    mock_tosr.status_age.return_value = 5000
+    valve_bank.poll()
+    assert mock_tosr.update_async.call_count == 1
+    mock_tosr.status_age.return_value = None
+
+    tosr_switch[1].unsubscribe(callback)
 
 
 def test_tosr_temp():
@@ -123,3 +138,94 @@ def test_tosr_temp():
     # Test that manual override is disabled
     sensor.state = 20
     assert sensor.state == 15.0625
+
+
+def test_tosr_failures(caplog):
+    """Test failed relay and temperature requests."""
+    mock_tosr.update_async.reset_mock()
+    with patch.object(
+        mock_tosr,
+        "set_relay_state_async",
+        side_effect=lambda switch_number, state, callback: callback(False),
+    ):
+        tosr_switch[1].state = True
+    assert "Failed to update relay state" in caplog.text
+    assert mock_tosr.update_async.call_count == 1
+
+    with patch.object(
+        mock_tosr, "temperature_async", side_effect=lambda callback: callback(None)
+    ):
+        tosr_temp.update()
+    assert "Failed to get temperature" in caplog.text
+    assert tosr_temp.state == 42
+
+
+def test_tosr_relay_bank(caplog):
+    """Test TosrRelayBank class."""
+    tosr_switch[0].state = False
+    tosr_switch[1].state = False
+    tosr_switch[2].state = False
+    callback = MagicMock()
+    tosr_switch[1].subscribe(callback)
+    mock_tosr.set_relays_async.reset_mock()
+    valve_bank.set([True, True, None, False])
+    assert mock_tosr.set_relays_async.call_count == 1
+    assert mock_tosr.set_relays_async.call_args[0][0] == 0b0011
+    assert tosr_switch[0].state
+    assert tosr_switch[1].state
+    assert not tosr_switch[3].state
+    callback.assert_called_once_with(True)
+    tosr_switch[1].unsubscribe(callback)
+
+    mock_tosr.update_async.reset_mock()
+    with patch.object(
+        mock_tosr,
+        "set_relays_async",
+        side_effect=lambda mask, callback: callback(False),
+    ):
+        valve_bank.set([False] * 4)
+    assert "Failed to update relay state" in caplog.text
+    mock_tosr.update_async.assert_called_once_with(force=True)
+
+
+def test_tosr_temp_cache():
+    """Test the cached reading and the staleness flag."""
+    callbacks = []
+    with patch.object(
+        mock_tosr,
+        "temperature_async",
+        side_effect=lambda callback: callbacks.append(callback),
+    ):
+        sensor = TosrTemp(period=1000)
+        assert sensor.state is None
+        assert sensor.age is None
+        assert sensor.stale
+
+        # No new request while one is pending
+        sensor.update()
+        assert len(callbacks) == 1
+
+        callbacks.pop()(21.5)
+        assert sensor.state == 21.5
+        assert sensor.age == 0
+        assert not sensor.stale
+
+        # Reading the state does not touch the UART
+        assert sensor.state == 21.5
+        assert not callbacks
+
+        sleep_ms(2000)
+        sensor.update()
+        callbacks.pop()(None)
+        assert sensor.state == 21.5
+        assert sensor.age == 2000
+        assert not sensor.stale
+
+        sleep_ms(1001)
+        assert sensor.stale
+        assert sensor.state == 21.5
+
+        sensor.update()
+        callbacks.pop()(22)
+        assert not sensor.stale
+        assert sensor.state == 22
@@ -1,9 +1,11 @@
 """Test tosr0x lib."""
 
 from time import sleep_ms
-from unittest.mock import patch
+from unittest.mock import MagicMock, call, patch
 
 import pytest
+from lib.mainloop import main_loop
+from tosr0x_emulator import Tosr0xEmulator
 
 from flash import tosr0x
 
@@ -12,6 +14,7 @@ from flash import tosr0x
 @patch("flash.tosr0x.stdin.buffer.read")
 def test_tosr0x(mock_stdin, mock_stdout):
     """Test Tosr0x class."""
+    mock_stdin.return_value = None
     tosr = tosr0x.Tosr0x()
     mock_stdout.assert_called_once_with("n")
     mock_stdin.assert_called_once_with()
@@ -22,165 +25,56 @@ def test_tosr0x(mock_stdin, mock_stdout):
     assert not tosr.get_relay_state(3)
     assert not tosr.get_relay_state(4)
 
-    mock_stdin.reset_mock()
-    mock_stdout.reset_mock()
-    mock_stdin.return_value = b"\x01"
-    tosr.set_relay_state(1, True)
-    assert mock_stdin.call_count == 2
-    assert mock_stdout.call_count == 2
-    assert mock_stdout.call_args_list[0][0][0] == "e"
-    assert mock_stdout.call_args_list[1][0][0] == "["
-
-    mock_stdout.reset_mock()
-    mock_stdin.reset_mock()
-    mock_stdin.return_value = b"\x02"
-    tosr.set_relay_state(2, True)
-    assert mock_stdin.call_count == 2
-    assert mock_stdout.call_count == 2
-    assert mock_stdout.call_args_list[0][0][0] == "f"
-    assert mock_stdout.call_args_list[1][0][0] == "["
-
-    mock_stdout.reset_mock()
-    mock_stdin.reset_mock()
-    mock_stdin.return_value = b"\x04"
-    tosr.set_relay_state(3, True)
-    assert mock_stdin.call_count == 2
-    assert mock_stdout.call_count == 2
-    assert mock_stdout.call_args_list[0][0][0] == "g"
-    assert mock_stdout.call_args_list[1][0][0] == "["
-
-    mock_stdout.reset_mock()
-    mock_stdin.reset_mock()
-    mock_stdin.return_value = b"\x08"
-    tosr.set_relay_state(4, True)
-    assert mock_stdin.call_count == 2
-    assert mock_stdout.call_count == 2
-    assert mock_stdout.call_args_list[0][0][0] == "h"
-    assert mock_stdout.call_args_list[1][0][0] == "["
-
-    mock_stdout.reset_mock()
-    mock_stdin.reset_mock()
-    mock_stdin.return_value = b"\x0f"
-    tosr.set_relay_state(0, True)
-    assert mock_stdin.call_count == 2
-    assert mock_stdout.call_count == 2
-    assert mock_stdout.call_args_list[0][0][0] == "d"
-    assert mock_stdout.call_args_list[1][0][0] == "["
-
-    mock_stdout.reset_mock()
-    mock_stdin.reset_mock()
-    mock_stdin.return_value = b"\x00"
-    tosr.set_relay_state(0, False)
-    assert mock_stdin.call_count == 2
-    assert mock_stdout.call_count == 2
-    assert mock_stdout.call_args_list[0][0][0] == "n"
-    assert mock_stdout.call_args_list[1][0][0] == "["
-
-    mock_stdout.reset_mock()
-    mock_stdin.reset_mock()
-    mock_stdin.return_value = b"\x00"
-    tosr.set_relay_state(1, False)
-    assert mock_stdin.call_count == 2
-    assert mock_stdout.call_count == 2
-    assert mock_stdout.call_args_list[0][0][0] == "o"
-    assert mock_stdout.call_args_list[1][0][0] == "["
-
-    mock_stdout.reset_mock()
-    mock_stdin.reset_mock()
-    mock_stdin.return_value = b"\x00"
-    tosr.set_relay_state(2, False)
-    assert mock_stdin.call_count == 2
-    assert mock_stdout.call_count == 2
-    assert mock_stdout.call_args_list[0][0][0] == "p"
-    assert mock_stdout.call_args_list[1][0][0] == "["
-
-    mock_stdout.reset_mock()
-    mock_stdin.reset_mock()
-    mock_stdin.return_value = b"\x00"
-    tosr.set_relay_state(3, False)
-    assert mock_stdin.call_count == 2
-    assert mock_stdout.call_count == 2
-    assert mock_stdout.call_args_list[0][0][0] == "q"
-    assert mock_stdout.call_args_list[1][0][0] == "["
-
-    mock_stdout.reset_mock()
-    mock_stdin.reset_mock()
-    mock_stdin.return_value = b"\x00"
-    tosr.set_relay_state(4, False)
-    assert mock_stdin.call_count == 2
-    assert mock_stdout.call_count == 2
-    assert mock_stdout.call_args_list[0][0][0] == "r"
-    assert mock_stdout.call_args_list[1][0][0] == "["
-
-    mock_stdout.reset_mock()
-    mock_stdin.reset_mock()
-    mock_stdin.return_value = b"\x00"
-    with pytest.raises(RuntimeError) as excinfo:
-        tosr.set_relay_state(1, True)
-    assert str(excinfo.value) == "Failed to update relay state"
-    assert mock_stdin.call_count == 20
-    assert mock_stdout.call_count == 20
-    assert mock_stdout.call_args_list[0][0][0] == "e"
-    assert mock_stdout.call_args_list[1][0][0] == "["
+    main_loop.reset()
+    callback = MagicMock()
+    for switch_number, state, status, cmd in (
+        (1, True, b"\x01", "e"),
+        (2, True, b"\x02", "f"),
+        (3, True, b"\x04", "g"),
+        (4, True, b"\x08", "h"),
+        (0, True, b"\x0f", "d"),
+        (0, False, b"\x00", "n"),
+        (1, False, b"\x00", "o"),
+        (2, False, b"\x00", "p"),
+        (3, False, b"\x00", "q"),
+        (4, False, b"\x00", "r"),
+    ):
+        mock_stdout.reset_mock()
+        callback.reset_mock()
+        mock_stdin.return_value = status
+        tosr.set_relay_state_async(switch_number, state, callback)
+        main_loop.run_once()
+        callback.assert_called_once_with(True)
+        assert mock_stdout.call_args_list == [call(cmd), call("[")]
 
+    # The status reads are rate limited
     mock_stdout.reset_mock()
-    mock_stdin.reset_mock()
     mock_stdin.return_value = b"\x0f"
     sleep_ms(1000)
-    tosr.update()
+    tosr.update_async()
+    main_loop.run_once()
     assert tosr.get_relay_state(0)
     assert tosr.get_relay_state(1)
     assert tosr.get_relay_state(2)
     assert tosr.get_relay_state(3)
     assert tosr.get_relay_state(4)
     sleep_ms(100)
-    tosr.update()
-    assert mock_stdin.call_count == 2
-    assert mock_stdout.call_count == 1
-    assert mock_stdout.call_args_list[0][0][0] == "["
+    tosr.update_async()
+    main_loop.run_once()
+    assert mock_stdout.call_args_list == [call("[")]
     sleep_ms(200)
-    tosr.update()
-    assert mock_stdin.call_count == 4
+    tosr.update_async()
+    main_loop.run_once()
     assert mock_stdout.call_count == 2
 
-    mock_stdout.reset_mock()
-    mock_stdin.reset_mock()
-    mock_stdin.return_value = b"\x01\x02"
-    sleep_ms(300)
-    with pytest.raises(RuntimeError) as excinfo:
-        tosr.update()
-    assert str(excinfo.value) == "Failed to get relay state: b'\\x01\\x02'"
-    assert mock_stdin.call_count == 20
-    assert mock_stdout.call_count == 10
-    for x in range(10):
-        assert mock_stdout.call_args_list[x][0][0] == "["
-
-    mock_stdout.reset_mock()
-    mock_stdin.reset_mock()
-    mock_stdin.return_value = b"\x01\x23"
-    assert tosr.temperature == 18.1875
-    assert mock_stdin.call_count == 2
-    assert mock_stdout.call_count == 1
-    assert mock_stdout.call_args_list[0][0][0] == "a"
-
-    mock_stdout.reset_mock()
-    mock_stdin.reset_mock()
-    mock_stdin.return_value = b"\xff\xb0"
-    assert tosr.temperature == -5
-    assert mock_stdin.call_count == 2
-    assert mock_stdout.call_count == 1
-    assert mock_stdout.call_args_list[0][0][0] == "a"
-
-    mock_stdout.reset_mock()
-    mock_stdin.reset_mock()
-    mock_stdin.return_value = b"\x01\x02\x03"
-    with pytest.raises(RuntimeError) as excinfo:
-        tosr.temperature
-    assert str(excinfo.value) == "Failed to get temperature: b'\\x01\\x02\\x03'"
-    assert mock_stdin.call_count == 20
-    assert mock_stdout.call_count == 10
-    for x in range(10):
-        assert mock_stdout.call_args_list[x][0][0] == "a"
+    for data, temperature in ((b"\x01\x23", 18.1875), (b"\xff\xb0", -5)):
+        mock_stdout.reset_mock()
+        callback.reset_mock()
+        mock_stdin.return_value = data
+        tosr.temperature_async(callback)
+        main_loop.run_once()
+        callback.assert_called_once_with(temperature)
+        assert mock_stdout.call_args_list == [call("a")]
 
 
 @patch("flash.tosr0x.stdout.buffer.write")
@@ -220,3 +114,244 @@ def test_tosr0x_version(mock_stdin, mock_stdout):
         assert mock_stdout.call_args_list[x][0][0] == "Z"
     assert mock_stdin.call_count == 31
     assert sleep_ms.call_count == 11
+
+
+@patch("flash.tosr0x.stdout.buffer.write")
+@patch("flash.tosr0x.stdin.buffer.read")
+def test_tosr0x_async(mock_stdin, mock_stdout):
+    """Test non-blocking Tosr0x requests."""
+    mock_stdin.return_value = None
+    tosr = tosr0x.Tosr0x()
+    main_loop.reset()
+
+    # The response is collected across several loop iterations
+    mock_stdout.reset_mock()
+    mock_stdin.side_effect = [None, None, b"\x01", None, b"\x23"]
+    callback = MagicMock()
+    tosr.temperature_async(callback)
+    assert mock_stdout.call_count == 0
+    for _ in range(3):
+        sleep_ms(10)
+        main_loop.run_once()
+    assert mock_stdout.call_args_list == [call("a")]
+    assert callback.call_count == 0
+    sleep_ms(10)
+    main_loop.run_once()
+    callback.assert_called_once_with(18.1875)
+    assert main_loop.task_count == 0
+
+    # The command is retried on timeout
+    mock_stdout.reset_mock()
+    mock_stdin.side_effect = None
+    mock_stdin.return_value = None
+    callback.reset_mock()
+    tosr.temperature_async(callback)
+    for _ in range(50):
+        sleep_ms(50)
+        main_loop.run_once()
+    callback.assert_called_once_with(None)
+    assert mock_stdout.call_count == 10
+    assert main_loop.task_count == 0
+
+    # Concurrent status reads are shared
+    mock_stdout.reset_mock()
+    mock_stdin.return_value = b"\x05"
+    callback.reset_mock()
+    sleep_ms(1000)
+    tosr.update_async(callback)
+    tosr.update_async(callback)
+    main_loop.run_once()
+    assert callback.call_args_list == [call(True), call(True)]
+    assert mock_stdout.call_args_list == [call("[")]
+    assert tosr.get_relay_state(1)
+    assert not tosr.get_relay_state(2)
+    assert tosr.get_relay_state(3)
+
+    # The relay state is verified with a fresh status read
+    mock_stdout.reset_mock()
+    mock_stdin.return_value = None
+    mock_stdin.side_effect = [None, None, None, b"\x05", None, None, None, b"\x07"]
+    callback.reset_mock()
+    tosr.set_relay_state_async(2, True, callback)
+    for _ in range(10):
+        sleep_ms(10)
+        main_loop.run_once()
+        # The requests queued by the callbacks share the poll task
+        assert main_loop.task_count <= 1
+    callback.assert_called_once_with(True)
+    assert mock_stdout.call_args_list == [call("f"), call("["), call("f"), call("[")]
+    assert tosr.get_relay_state(2)
+
+    mock_stdout.reset_mock()
+    mock_stdin.side_effect = None
+    mock_stdin.return_value = b"\x07"
+    callback.reset_mock()
+    tosr.set_relay_state_async(0, True, callback)
+    for _ in range(50):
+        sleep_ms(10)
+        main_loop.run_once()
+    callback.assert_called_once_with(False)
+    assert mock_stdout.call_count == 20
+    assert main_loop.task_count == 0
+
+
+@patch("flash.tosr0x.stdout.buffer.write")
+@patch("flash.tosr0x.stdin.buffer.read")
+def test_tosr0x_relay_mask(mock_stdin, mock_stdout):
+    """Test bulk relay updates."""
+    mock_stdin.return_value = None
+    tosr = tosr0x.Tosr0x()
+    main_loop.reset()
+
+    tosr._states = 0b0000
+    assert tosr._relay_commands(0b1111) == "efgh"
+    assert tosr._relay_commands(0b0010) == "f"
+    assert tosr._relay_commands(0b0111) == "efg"
+    assert tosr._relay_commands(0b0011) == "ef"
+    assert tosr._relay_commands(0b0000) == ""
+    tosr._states = 0b1111
+    assert tosr._relay_commands(0b0000) == "n"
+    assert tosr._relay_commands(0b1101) == "p"
+    tosr._states = 0b1010
+    assert tosr._relay_commands(0b0101) == "neg"
+    assert tosr._relay_commands(0b0001) == "ne"
+    assert tosr._relay_commands(0b1110) == "g"
+
+    # The relays of the board beyond the relay count are switched off
+    tosr._states = 0b11110000
+    assert tosr._relay_commands(0b1111) == "dstuv"
+
+    # Up to eight relays
+    tosr8 = tosr0x.Tosr0x(8)
+    assert tosr8._relay_commands(0b11111111) == "d"
+    assert tosr8._relay_commands(0b01111111) == "dv"
+    assert tosr8._relay_commands(0b10000000) == "l"
+    tosr8._states = 0b11111111
+    assert tosr8.get_relay_state(8)
+    assert tosr8._relay_commands(0b00000000) == "n"
+    with pytest.raises(ValueError):
+        tosr0x.Tosr0x(9)
+
+    # One write and one status read
+    mock_stdout.reset_mock()
+    mock_stdin.return_value = b"\x05"
+    callback = MagicMock()
+    tosr.status_callback = MagicMock()
+    tosr.set_relays_async(0b0101, callback)
+    main_loop.run_once()
+    callback.assert_called_once_with(True)
+    assert mock_stdout.call_args_list == [call("neg"), call("[")]
+    tosr.status_callback.assert_called_once_with(0b0101)
+    assert tosr.status_age() == 0
+
+    # Already in the requested state, only verify
+    mock_stdout.reset_mock()
+    callback.reset_mock()
+    tosr.set_relays_async(0b0101, callback)
+    main_loop.run_once()
+    callback.assert_called_once_with(True)
+    assert mock_stdout.call_args_list == [call("[")]
+
+    # Retried until the states match
+    mock_stdout.reset_mock()
+    callback.reset_mock()
+    mock_stdin.return_value = b"\x00"
+    tosr.set_relays_async(0b1111, callback)
+    main_loop.run_once()
+    callback.assert_called_once_with(False)
+    retries = [call("efgh"), call("[")] * 9
+    assert mock_stdout.call_args_list == [call("fh"), call("[")] + retries
+
+
+class FakeSerial:
+    """UART stand-in counting the response chunks returned as new bytes objects."""
+
+    def __init__(self, responses):
+        """Init the class."""
+        self.buffer = self
+        self.responses = responses
+        self.pending = []
+        self.copies = 0
+
+    def write(self, cmd):
+        """Queue the response to the command."""
+        self.pending.extend(self.responses.get(cmd, ()))
+
+    def read(self):
+        """Return a new bytes object like the XBee stdin."""
+        if not self.pending:
+            return None
+        self.copies += 1
+        return self.pending.pop(0)
+
+
+class FakeSerialReadinto(FakeSerial):
+    """UART stand-in supporting readinto."""
+
+    def readinto(self, view):
+        """Fill the view in place."""
+        if not self.pending:
+            return None
+        chunk = self.pending.pop(0)
+        view[: len(chunk)] = chunk
+        return len(chunk)
+
+
+@pytest.mark.parametrize(
+    "serial_class, copies", [(FakeSerialReadinto, 0), (FakeSerial, 2)]
+)
+def test_tosr0x_readinto(serial_class, copies):
+    """Test that the responses are read in place when the UART supports readinto."""
+    serial = serial_class({"a": [b"\x01", b"\x23"], "[": [b"\x05"]})
+    with (
+        patch("flash.tosr0x.stdin", serial),
+        patch("flash.tosr0x.stdout", serial),
+    ):
+        tosr = tosr0x.Tosr0x()
+        main_loop.reset()
+
+        results = []
+        for _ in range(10):
+            serial.copies = 0
+            tosr.temperature_async(results.append)
+            for _ in range(3):
+                sleep_ms(10)
+                main_loop.run_once()
+            assert serial.copies == copies
+        assert results == [18.1875] * 10
+
+        serial.copies = 0
+        tosr.update_async(force=True)
+        main_loop.run_once()
+        assert tosr.get_relay_state(3)
+        assert serial.copies == copies // 2
+
+
+def test_tosr0x_stale_status():
+    """Test the status reads queued before a relay write are ignored."""
+    board = Tosr0xEmulator(delay=20)
+    with (
+        patch("flash.tosr0x.stdin", board),
+        patch("flash.tosr0x.stdout", board),
+    ):
+        tosr = tosr0x.Tosr0x()
+        main_loop.reset()
+        states = []
+        tosr.status_callback = states.append
+        updated = MagicMock()
+
+        # A poll is in flight when the relays are switched
+        tosr.update_async(force=True)
+        tosr.update_async(updated)
+        main_loop.run_once()
+        result = []
+        tosr.set_relays_async(0b1000, result.append)
+        for _ in range(20):
+            sleep_ms(10)
+            main_loop.run_once()
+
+    assert result == [True]
+    assert states == [0b1000, 0b1000]
+    updated.assert_called_once_with(True)
+    assert tosr.get_relay_state(4)
+    assert main_loop.task_count == 0
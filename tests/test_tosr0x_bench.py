@@ -0,0 +1,138 @@
+"""Benchmark the TOSR0x driver against the board emulator.
+
+Run with `pytest -s tests/test_tosr0x_bench.py` to see the results.
+"""
+
+from time import sleep_ms, ticks_diff, ticks_ms
+from unittest.mock import patch
+
+import pytest
+from lib.mainloop import main_loop
+from tosr0x_emulator import Tosr0xEmulator
+
+from flash import tosr0x
+
+
+def run_until(done, limit=60000):
+    """Run the main loop in simulated time, return the time it took."""
+    start = ticks_ms()
+    while not done() and ticks_diff(ticks_ms(), start) < limit:
+        next_time = main_loop.run_once()
+        if done():
+            break
+        if next_time is None:
+            sleep_ms(1)
+        else:
+            sleep_ms(max(ticks_diff(next_time, ticks_ms()), 1))
+    return ticks_diff(ticks_ms(), start)
+
+
+def bench_relay_set(board, count=50):
+    """Switch the relays repeatedly, return the success rate, latency and writes."""
+    with (
+        patch("flash.tosr0x.stdin", board),
+        patch("flash.tosr0x.stdout", board),
+    ):
+        tosr = tosr0x.Tosr0x()
+        main_loop.reset()
+        ok = 0
+        latency = []
+        commands = board.commands
+        for x in range(count):
+            result = []
+            tosr.set_relays_async((x * 5 + 3) & 0xF, result.append)
+            latency.append(run_until(lambda: result))
+            ok += result == [True]
+    return {
+        "success": ok / count,
+        "latency": sum(latency) / count,
+        "max latency": max(latency),
+        "commands": (board.commands - commands) / count,
+    }
+
+
+def bench_temperature(board, count=20):
+    """Read the temperature repeatedly, return the success rate and the error."""
+    with (
+        patch("flash.tosr0x.stdin", board),
+        patch("flash.tosr0x.stdout", board),
+    ):
+        tosr = tosr0x.Tosr0x()
+        main_loop.reset()
+        ok = 0
+        error = 0
+        latency = []
+        for _ in range(count):
+            result = []
+            tosr.temperature_async(result.append)
+            latency.append(run_until(lambda: result))
+            if result[0] is not None:
+                ok += 1
+                error = max(error, abs(result[0] - board.current_temperature()))
+            sleep_ms(1000)
+    return {
+        "success": ok / count,
+        "latency": sum(latency) / count,
+        "max error": error,
+    }
+
+
+def report(name, results):
+    """Print a benchmark result."""
+    print(
+        "{:<36} {}".format(
+            name,
+            " ".join("{}={:.3g}".format(key, value) for key, value in results.items()),
+        )
+    )
+
+
+@pytest.mark.parametrize("delay", [0, 20, 50, 90])
+def test_bench_relay_latency(delay):
+    """Measure the relay set latency against the response delay."""
+    results = bench_relay_set(Tosr0xEmulator(delay=delay))
+    report("relay set, delay {} ms".format(delay), results)
+    assert results["success"] == 1
+    assert results["max latency"] < delay + 100
+    assert results["commands"] <= 4
+
+
+@pytest.mark.parametrize("loss", [0.05, 0.2, 0.5])
+def test_bench_relay_loss(loss):
+    """Measure the retries of relay updates when the status bytes are lost."""
+    results = bench_relay_set(Tosr0xEmulator(delay=10, loss=loss, seed=1))
+    report("relay set, loss {:.0%}".format(loss), results)
+    assert results["success"] >= 0.9
+    # Every lost status byte costs a timeout and a retry
+    assert results["latency"] > 20
+
+
+def test_bench_relay_switch_delay():
+    """Measure the retries while the relays settle."""
+    results = bench_relay_set(Tosr0xEmulator(delay=5, switch_delay=30))
+    report("relay set, switch delay 30 ms", results)
+    assert results["success"] == 1
+    assert results["commands"] > 4
+
+
+@pytest.mark.parametrize("loss", [0, 0.2])
+def test_bench_temperature(loss):
+    """Measure the temperature reads with drift and loss."""
+    results = bench_temperature(
+        Tosr0xEmulator(delay=20, loss=loss, drift=0.05, temperature=-3, seed=2)
+    )
+    report("temperature, loss {:.0%}".format(loss), results)
+    assert results["success"] == 1
+    assert results["max error"] < 0.1
+
+
+def test_emulator_detection():
+    """Test the blocking board detection against the emulator."""
+    board = Tosr0xEmulator(delay=20)
+    board.write("f")
+    with (
+        patch("flash.tosr0x.stdin", board),
+        patch("flash.tosr0x.stdout", board),
+    ):
+        assert tosr0x.tosr0x_version() == 0x0F
+        assert board.relays == 0
@@ -0,0 +1,47 @@
+"""Test trace lib."""
+
+import struct
+from time import sleep_ms
+
+from lib import trace
+
+
+def parse(data):
+    """Split the trace into records."""
+    return [struct.unpack("<HBB", data[x : x + 4]) for x in range(0, len(data), 4)]
+
+
+def test_trace():
+    """Test the trace buffer."""
+    log = trace.Trace(4)
+    assert log.read(0) == (0, b"")
+
+    sleep_ms(100)
+    log.record(trace.EV_PUMP, 1)
+    sleep_ms(40000)
+    log.record(trace.EV_STATE, 2)
+    log.record(trace.EV_ZONE, 0x105)
+    total, data = log.read(0)
+    assert total == 12
+    assert parse(data) == [
+        (100, trace.EV_PUMP, 1),
+        (0x8000 | 40, trace.EV_STATE, 2),
+        (0, trace.EV_ZONE, 5),
+    ]
+
+    # The oldest records are overwritten
+    for x in range(3):
+        sleep_ms(10)
+        log.record(trace.EV_VALVES, x)
+    total, data = log.read(0)
+    assert total == 16
+    assert parse(data) == [
+        (0, trace.EV_ZONE, 5),
+        (10, trace.EV_VALVES, 0),
+        (10, trace.EV_VALVES, 1),
+        (10, trace.EV_VALVES, 2),
+    ]
+    assert log.read(0, 6)[1] + log.read(6, 6)[1] + log.read(12, 6)[1] == data
+
+    sleep_ms(30)
+    assert log.age() == 30
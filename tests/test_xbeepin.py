@@ -162,3 +162,61 @@ def test_analog_input():
     callback.assert_called_once_with(19)
     assert sensor.state == 19
     sensor._pin.read.assert_called_once_with()
+
+
+def test_analog_input_oversampling():
+    """Test AnalogInput burst oversampling."""
+    main_loop.reset()
+
+    sensor = xbeepin.AnalogInput("D0", samples=4)
+    sensor._pin.read.reset_mock()
+    sensor._pin.read.side_effect = [10, 12, 11, 15]
+    sensor.update()
+    assert sensor._pin.read.call_count == 4
+    assert sensor.state == 12
+    assert sensor.variance == 14 / 3
+    sensor._pin.read.side_effect = None
+    main_loop.reset()
+
+    # The median ignores a single spike
+    sensor = xbeepin.AnalogInput("D0", samples=5, median=True)
+    sensor._pin.read.reset_mock()
+    sensor._pin.read.side_effect = [100, 102, 4000, 99, 101]
+    sensor.update()
+    assert sensor._pin.read.call_count == 5
+    assert sensor.state == 101
+    assert sensor.variance > 1000000
+
+    # The samples are taken only once per period
+    callback = mock.MagicMock()
+    sensor.subscribe(callback)
+    sensor._pin.read.reset_mock()
+    sensor._pin.read.side_effect = None
+    sensor._pin.read.return_value = 101
+    main_loop.run_once()
+    assert sensor._pin.read.call_count == 0
+    sleep_ms(500)
+    main_loop.run_once()
+    assert sensor._pin.read.call_count == 5
+    assert sensor.variance == 0
+    assert callback.call_count == 0
+    sensor._pin.read.return_value = 0
+
+    # Decimated bursts are averaged and reported once every few periods
+    main_loop.reset()
+    sensor = xbeepin.AnalogInput("D0", samples=2, decimation=2, lowpass=0)
+    callback = mock.MagicMock()
+    sensor.subscribe(callback)
+    sensor._pin.read.reset_mock()
+    sensor._pin.read.side_effect = [10, 12, 20, 22]
+    sleep_ms(500)
+    main_loop.run_once()
+    assert sensor._pin.read.call_count == 2
+    assert callback.call_count == 0
+    sleep_ms(500)
+    main_loop.run_once()
+    assert sensor._pin.read.call_count == 4
+    callback.assert_called_once_with(16)
+    assert sensor.variance == 2
+    sensor._pin.read.side_effect = None
+    main_loop.reset()
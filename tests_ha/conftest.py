@@ -96,6 +96,7 @@ commands = {
     "atcmd": MagicMock(),
     "pump_temp": MagicMock(),
     "pressure_in": MagicMock(),
+    "pressure_in_variance": MagicMock(),
     "valve": MagicMock(side_effect=partial(_cmd_handler, "valve")),
     "pump": MagicMock(side_effect=partial(_cmd_handler, "pump")),
     "pump_block": MagicMock(side_effect=partial(_cmd_handler, "pump_block")),
@@ -105,6 +106,11 @@ commands = {
     "uptime": MagicMock(side_effect=partial(_cmd_handler, "uptime")),
     "reset_cause": MagicMock(),
     "zone": MagicMock(side_effect=partial(_cmd_handler, "zone")),
+    "crashlog": MagicMock(),
+    "pump_stats": MagicMock(),
+    "trace": MagicMock(),
+    "zones": MagicMock(),
+    "utc_offset": MagicMock(),
 }
 
 nonce = 1
@@ -132,6 +138,7 @@ def data_from_device_fixture(hass: HomeAssistant):
     commands["cur_hum"].return_value = None
     commands["pump_temp"].return_value = 31
     commands["pressure_in"].return_value = 3879
+    commands["pressure_in_variance"].return_value = 2.5
     commands["valve"].return_value = False
     commands["pump"].return_value = False
     commands["pump_block"].return_value = False
@@ -141,6 +148,21 @@ def data_from_device_fixture(hass: HomeAssistant):
     commands["uptime"].return_value = -10
     commands["reset_cause"].return_value = 6
     commands["zone"].return_value = False
+    commands["crashlog"].return_value = {"size": 0, "data": ""}
+    commands["trace"].return_value = {"size": 0, "data": "", "age": 0}
+    commands["zones"].return_value = {"zones": 3, "valves": 4, "drop_valve": 3}
+    commands["utc_offset"].return_value = "OK"
+    commands["pump_stats"].return_value = {
+        "pump_time": 3600,
+        "pump_starts": 12,
+        "pump_timeouts": 2,
+        "blocked_starts": 0,
+        "drop_time": 660,
+        "valve_0_time": 1800,
+        "valve_1_time": 2400,
+        "valve_2_time": 0,
+        "valve_3_time": 660,
+    }
 
     def data_from_device(hass, ieee, data):
         """Simulate receiving data from device."""
@@ -169,9 +191,10 @@ def data_from_device_fixture(hass: HomeAssistant):
             response = commands[cmd](data["args"])
         else:
             response = commands[cmd]()
-        data_from_device(
-            hass, call.data["ieee"], {cmd + "_resp": response, "nonce": nonce}
-        )
+        response = {cmd + "_resp": response, "nonce": nonce}
+        if "id" in data:
+            response["id"] = data["id"]
+        data_from_device(hass, call.data["ieee"], response)
 
     hass.services.async_register("zha", "issue_zigbee_cluster_command", log_call)
 
@@ -45,7 +45,8 @@ async def test_successful_config_flow(hass, data_from_device):
     )
 
     assert result["type"] == data_entry_flow.FlowResultType.FORM
-    assert result["step_id"] == "humidifier_0"
+    assert result["step_id"] == "humidifier"
+    assert result["description_placeholders"] == {"number": "1"}
 
     # Advance to step 3
     result = await hass.config_entries.flow.async_configure(
@@ -53,7 +54,8 @@ async def test_successful_config_flow(hass, data_from_device):
     )
 
     assert result["type"] == data_entry_flow.FlowResultType.FORM
-    assert result["step_id"] == "humidifier_1"
+    assert result["step_id"] == "humidifier"
+    assert result["description_placeholders"] == {"number": "2"}
 
     # Advance to step 4
     result = await hass.config_entries.flow.async_configure(
@@ -61,7 +63,8 @@ async def test_successful_config_flow(hass, data_from_device):
     )
 
     assert result["type"] == data_entry_flow.FlowResultType.FORM
-    assert result["step_id"] == "humidifier_2"
+    assert result["step_id"] == "humidifier"
+    assert result["description_placeholders"] == {"number": "3"}
 
     result = await hass.config_entries.flow.async_configure(
         result["flow_id"], user_input=MOCK_OPTIONS["humidifier_2"]
@@ -100,9 +103,10 @@ async def test_options_flow(hass, test_config_entry):
     # Initialize an options flow
     result = await hass.config_entries.options.async_init(test_config_entry.entry_id)
 
-    # Verify that the first options step is a humidifier_0 form
+    # Verify that the first options step is the first humidifier form
     assert result["type"] == data_entry_flow.FlowResultType.FORM
-    assert result["step_id"] == "humidifier_0"
+    assert result["step_id"] == "humidifier"
+    assert result["description_placeholders"] == {"number": "1"}
 
     # Enter some new data into the form
     result = await hass.config_entries.options.async_configure(
@@ -114,9 +118,10 @@ async def test_options_flow(hass, test_config_entry):
         },
     )
 
-    # Verify step humidifier_0 results
+    # Verify the first humidifier results
     assert result["type"] == data_entry_flow.FlowResultType.FORM
-    assert result["step_id"] == "humidifier_1"
+    assert result["step_id"] == "humidifier"
+    assert result["description_placeholders"] == {"number": "2"}
 
     result = await hass.config_entries.options.async_configure(
         result["flow_id"],
@@ -127,9 +132,10 @@ async def test_options_flow(hass, test_config_entry):
         },
     )
 
-    # Verify step humidifier_1 results
+    # Verify the second humidifier results
     assert result["type"] == data_entry_flow.FlowResultType.FORM
-    assert result["step_id"] == "humidifier_2"
+    assert result["step_id"] == "humidifier"
+    assert result["description_placeholders"] == {"number": "3"}
 
     result = await hass.config_entries.options.async_configure(
         result["flow_id"],
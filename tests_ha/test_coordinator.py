@@ -81,6 +81,106 @@ async def test_double_command(hass, data_from_device):
     ) == [False, False]
 
 
+async def test_out_of_order_responses(hass):
+    """Test that responses are matched to the requests by id."""
+
+    def data_from_device(hass, ieee, data):
+        """Simulate receiving data from device."""
+        hass.bus.async_fire(
+            "zha_event",
+            {
+                "device_ieee": ieee,
+                "unique_id": ieee + ":232:0x0008",
+                "device_id": "abcdef01234567899876543210fedcba",
+                "endpoint_id": 232,
+                "cluster_id": 8,
+                "command": "receive_data",
+                "args": {"data": json.dumps(data)},
+            },
+        )
+
+    requests = []
+
+    @callback
+    def respond(call):
+        requests.append(json.loads(call.data["params"]["data"]))
+        if len(requests) < 3:
+            return
+        # Reply in reverse order, including a stray response with an unknown id
+        data_from_device(
+            hass,
+            call.data["ieee"],
+            {"valve_resp": "stray", "id": requests[0]["id"] - 1},
+        )
+        for request in reversed(requests):
+            data_from_device(
+                hass,
+                call.data["ieee"],
+                {"valve_resp": request["args"], "id": request["id"]},
+            )
+
+    hass.services.async_register("zha", "issue_zigbee_cluster_command", respond)
+
+    client = XBeeHumidifierApiClient(hass, IEEE)
+
+    assert await asyncio.gather(
+        client.async_command("valve", 0),
+        client.async_command("valve", 1),
+        client.async_command("valve", 2),
+    ) == [0, 1, 2]
+    assert len({request["id"] for request in requests}) == 3
+    assert client._awaiting == {}
+
+    hass.services.async_remove("zha", "issue_zigbee_cluster_command")
+
+
+async def test_in_flight_window(hass):
+    """Test that the number of commands in flight is limited."""
+
+    def data_from_device(hass, ieee, data):
+        """Simulate receiving data from device."""
+        hass.bus.async_fire(
+            "zha_event",
+            {
+                "device_ieee": ieee,
+                "unique_id": ieee + ":232:0x0008",
+                "device_id": "abcdef01234567899876543210fedcba",
+                "endpoint_id": 232,
+                "cluster_id": 8,
+                "command": "receive_data",
+                "args": {"data": json.dumps(data)},
+            },
+        )
+
+    requests = []
+
+    @callback
+    def respond(call):
+        requests.append(json.loads(call.data["params"]["data"]))
+
+    hass.services.async_register("zha", "issue_zigbee_cluster_command", respond)
+
+    client = XBeeHumidifierApiClient(hass, IEEE, max_in_flight=2)
+
+    tasks = [
+        asyncio.create_task(client.async_command("valve", number))
+        for number in range(4)
+    ]
+    await asyncio.sleep(0.01)
+    assert len(requests) == 2
+
+    for request in requests.copy():
+        data_from_device(hass, IEEE, {"valve_resp": True, "id": request["id"]})
+    await asyncio.sleep(0.01)
+    assert len(requests) == 4
+
+    for request in requests[2:]:
+        data_from_device(hass, IEEE, {"valve_resp": False, "id": request["id"]})
+    assert await asyncio.gather(*tasks) == [True, True, False, False]
+
+    hass.services.async_remove("zha", "issue_zigbee_cluster_command")
+
+
 async def test_unexpected_command_response(hass):
     """Test receiving unexpected command response."""
 
@@ -177,6 +277,23 @@ async def test_timeout(cmd_mock, hass):
     assert cmd_mock.call_count == 7
 
 
+@patch("custom_components.xbee_humidifier.coordinator.XBeeHumidifierApiClient._cmd")
+async def test_retry_request_id(cmd_mock, hass):
+    """Test that retries reuse the request id."""
+
+    client = XBeeHumidifierApiClient(hass, IEEE)
+
+    cmd_mock.side_effect = [TimeoutError, TimeoutError, "OK", "OK"]
+
+    assert await client.async_command("valve", 0, True) == "OK"
+    assert cmd_mock.call_count == 3
+    ids = {json.loads(call[0][1])["id"] for call in cmd_mock.call_args_list}
+    assert len(ids) == 1
+
+    assert await client.async_command("valve", 0, True) == "OK"
+    assert json.loads(cmd_mock.call_args[0][1])["id"] not in ids
+
+
 @patch("custom_components.xbee_humidifier.coordinator.XBeeHumidifierApiClient._cmd")
 async def test_remote_buffer_full(cmd_mock, hass):
     """Test retry on remote buffer full."""
@@ -0,0 +1,69 @@
+"""Test xbee_humidifier diagnostics."""
+
+import struct
+
+from pytest_homeassistant_custom_component.components.diagnostics import (
+    get_diagnostics_for_config_entry,
+)
+
+from custom_components.xbee_humidifier.coordinator import decode_trace
+
+from .conftest import commands
+
+
+def test_decode_trace():
+    """Test the trace timeline."""
+    data = (
+        struct.pack("<HBB", 0, 4, 1)
+        + struct.pack("<HBB", 5, 1, 1)
+        + struct.pack("<HBB", 0, 2, 1)
+        + struct.pack("<HBB", 0x8000 | 120, 5, 5)
+        + struct.pack("<HBB", 1500, 6, 10)
+        + struct.pack("<HBB", 0, 6, 0)
+        + struct.pack("<HBB", 0, 10, 1)
+        + struct.pack("<HBB", 0, 99, 7)
+    )
+    assert decode_trace(data, 2000) == [
+        (123.505, "Duty cycle start requested"),
+        (123.5, "Duty cycle pumping"),
+        (123.5, "Pump on"),
+        (3.5, "Zone 2 on"),
+        (2.0, "Valve 9 opened"),
+        (2.0, "All valves closed"),
+        (2.0, "Humidifier 1 schedule applied"),
+        (2.0, "Event 99: 7"),
+    ]
+    assert decode_trace(b"", 0) == []
+
+
+async def test_diagnostics(hass, hass_client, data_from_device, test_config_entry):
+    """Test the diagnostics include the device trace."""
+    data = struct.pack("<HBB", 0, 8, 3) + struct.pack("<HBB", 200, 9, 1)
+
+    def trace(offset):
+        return {"size": len(data), "data": data[offset : offset + 4].hex(), "age": 50}
+
+    commands["trace"].side_effect = trace
+
+    diagnostics = await get_diagnostics_for_config_entry(
+        hass, hass_client, test_config_entry
+    )
+
+    assert commands["trace"].call_args_list[-1][0] == (4,)
+    assert diagnostics["trace"] == [
+        {"seconds_ago": 0.25, "event": "Humidifier 1 on"},
+        {"seconds_ago": 0.05, "event": "Humidifier 1 sensor not responding"},
+    ]
+    assert diagnostics["data"]["pump_temp"] == 31
+
+    # The diagnostics are returned without the trace of older firmware
+    commands["trace"].side_effect = RuntimeError("Unknown command")
+
+    diagnostics = await get_diagnostics_for_config_entry(
+        hass, hass_client, test_config_entry
+    )
+
+    assert diagnostics["trace"] is None
+    assert diagnostics["data"]["pump_temp"] == 31
+
+    commands["trace"].side_effect = None
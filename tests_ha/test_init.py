@@ -7,6 +7,7 @@ import pytest
 from homeassistant.components.humidifier import DOMAIN as HUMIDIFIER, SERVICE_SET_MODE
 from homeassistant.const import ATTR_ENTITY_ID, ATTR_MODE
 from homeassistant.core import State
+from homeassistant.util import dt as dt_util
 from pytest_homeassistant_custom_component.common import mock_restore_cache
 
 from .conftest import commands
@@ -24,7 +25,7 @@ def test_test(hass):
 async def test_init_default(hass, caplog, data_from_device, test_config_entry):
     """Test component initialization with no device or history data."""
 
-    assert len(commands) == 20
+    assert len(commands) == 26
     commands["bind"].assert_called_once_with()
     commands["unique_id"].assert_called_once_with()
     commands["atcmd"].assert_called_once_with("VL")
@@ -35,7 +36,12 @@ async def test_init_default(hass, caplog, data_from_device, test_config_entry):
     commands["fan"].assert_called_once_with()
     commands["aux_led"].assert_called_once_with()
     commands["pump_speed"].assert_called_once_with()
+    commands["pump_stats"].assert_called_once_with()
     commands["reset_cause"].assert_called_once_with()
+    commands["zones"].assert_called_once_with()
+    commands["utc_offset"].assert_called_once_with(
+        int(dt_util.now().utcoffset().total_seconds()) // 60
+    )
     assert commands["uptime"].call_count == 2
     assert commands["uptime"].call_args_list[0][0] == ()
     assert (
@@ -79,6 +85,24 @@ async def test_init_default(hass, caplog, data_from_device, test_config_entry):
     await hass.async_block_till_done()
     assert "Test log" in caplog.text
 
+    data_from_device(
+        hass, IEEE, {"log": [[20, "Test batch log 1"], [30, "Test batch log 2"]]}
+    )
+    await hass.async_block_till_done()
+    assert "Test batch log 1" in caplog.text
+    assert "Test batch log 2" in caplog.text
+
+    data_from_device(
+        hass,
+        IEEE,
+        {"log": [[10, 3, [1]], [10, 2, []], [20, 9999, [5, "x"]], [20, 3, []]]},
+    )
+    await hass.async_block_till_done()
+    assert "Humidifier 1 turned on, scheduling duty cycle start" in caplog.text
+    assert "Cancelling existing duty cycle schedule" in caplog.text
+    assert "Log message 9999: [5, 'x']" in caplog.text
+    assert "Log message 3: []" in caplog.text
+
     data_from_device(hass, IEEE, {"available_0": True})
     data_from_device(hass, IEEE, {"available_1": True})
     data_from_device(hass, IEEE, {"available_2": True})
@@ -113,7 +137,7 @@ def test_1():
 async def test_init_from_device(hass, data_from_device, test_1, test_config_entry):
     """Test component initialization from device data."""
 
-    assert len(commands) == 20
+    assert len(commands) == 26
     commands["bind"].assert_called_once_with()
     commands["uptime"].assert_called_once_with()
     assert commands["sav_hum"].call_count == 3
@@ -209,7 +233,7 @@ async def test_init_from_last_state(
 ):
     """Test component initialization from RestoreEntity last state."""
 
-    assert len(commands) == 20
+    assert len(commands) == 26
     commands["bind"].assert_called_once_with()
     commands["unique_id"].assert_called_once_with()
     commands["atcmd"].assert_called_once_with("VL")
@@ -353,7 +377,7 @@ async def test_init_from_history(hass, data_from_device, test_config_entry):
         await hass.async_block_till_done()
         assert mock_history.call_count == 3
 
-    assert len(commands) == 20
+    assert len(commands) == 26
     commands["bind"].assert_called_once_with()
     commands["unique_id"].assert_called_once_with()
     commands["atcmd"].assert_called_once_with("VL")
@@ -1,6 +1,7 @@
 """Test xbee_humidifier sensors."""
 
 import datetime as dt
+import struct
 
 import pytest
 
@@ -10,6 +11,10 @@ from .const import IEEE
 ENTITY1 = "sensor.xbee_humidifier_main_unit_pump_temperature"
 ENTITY2 = "sensor.xbee_humidifier_main_unit_pressure_in"
 ENTITY3 = "sensor.xbee_humidifier_main_unit_uptime"
+ENTITY4 = "sensor.xbee_humidifier_main_unit_pump_run_time"
+ENTITY5 = "sensor.xbee_humidifier_main_unit_pump_starts"
+ENTITY6 = "sensor.xbee_humidifier_2_valve_open_time"
+ENTITY7 = "sensor.xbee_humidifier_main_unit_pressure_drop_valve_open_time"
 
 
 def test_test(hass):
@@ -94,3 +99,88 @@ async def test_reset_cause(hass, data_from_device, test_config_entry):
     await hass.async_block_till_done()
 
     assert hass.states.get(ENTITY3).attributes.get("reset_cause") == "unknown cause 7"
+
+
+async def test_last_error(hass, caplog, data_from_device, test_config_entry):
+    """Test last error attribute from the device crash log."""
+    assert hass.states.get(ENTITY3).attributes.get("last_error") is None
+
+    log = (
+        struct.pack("<BBIB", 2, 6, 0, 0)
+        + struct.pack("<BBIB", 3, 12, 300, 8)
+        + struct.pack("<II", 1000, 31000)
+        + struct.pack("<BBIB", 1, 40, 310, 14)
+        + b'["Test error"]'
+        + struct.pack("<BBIB", 1, 40, 315, 9)
+        + b'["Cut err'
+        + struct.pack("<BBIB", 1, 50, 320, 8)
+        + b"[3, [1]]"
+        + struct.pack("<BBIB", 2, 5, 0, 0)
+    )
+
+    def crashlog(offset):
+        return {"size": len(log), "data": log[offset : offset + 16].hex()}
+
+    commands["crashlog"].side_effect = crashlog
+    commands["reset_cause"].return_value = 5
+
+    data_from_device(hass, IEEE, {"uptime": 0})
+    await hass.async_block_till_done()
+
+    assert commands["crashlog"].call_args_list[0][0] == (0,)
+    assert commands["crashlog"].call_args_list[-1][0] == (80,)
+    assert hass.states.get(ENTITY3).attributes.get("reset_cause") == "watchdog timer"
+    assert (
+        hass.states.get(ENTITY3).attributes.get("last_error")
+        == "Humidifier 1 turned on, scheduling duty cycle start"
+    )
+    assert "Before reset, at 300s: 12 tasks, 31000 bytes allocated" in caplog.text
+    assert "Before reset, at 310s: Test error" in caplog.text
+    assert 'Before reset, at 315s: ["Cut err' in caplog.text
+
+    commands["crashlog"].side_effect = None
+
+
+async def test_pump_stats(hass, data_from_device, test_config_entry):
+    """Test the pump counter sensors."""
+    assert hass.states.get(ENTITY4).state == "3600"
+    assert hass.states.get(ENTITY4).attributes.get("unit_of_measurement") == "s"
+    assert hass.states.get(ENTITY5).state == "12"
+    assert hass.states.get(ENTITY6).state == "2400"
+    assert hass.states.get(ENTITY7).state == "660"
+
+    commands["pump_stats"].return_value = {"pump_time": 3700, "pump_starts": 13}
+    data_from_device(hass, IEEE, {"uptime": 0})
+    await hass.async_block_till_done()
+
+    assert hass.states.get(ENTITY4).state == "3700"
+    assert hass.states.get(ENTITY5).state == "13"
+    assert hass.states.get(ENTITY6).state == "unknown"
+
+
+async def test_pressure_variance(hass, data_from_device, test_config_entry):
+    """Test the pressure sample variance attribute."""
+    assert hass.states.get(ENTITY2).attributes.get("adc_variance") == 2.5
+
+    # Older firmware without the command
+    commands["pressure_in_variance"].side_effect = RuntimeError("No such command")
+    data_from_device(hass, IEEE, {"uptime": 0})
+    await hass.async_block_till_done()
+
+    assert hass.states.get(ENTITY2).state[:4] == "7.00"
+    assert hass.states.get(ENTITY2).attributes.get("adc_variance") is None
+
+    commands["pressure_in_variance"].side_effect = None
+
+
+async def test_pump_stats_unknown_command(hass, data_from_device, test_config_entry):
+    """Test the firmware without the pump counters still refreshes."""
+    commands["pump_stats"].side_effect = RuntimeError("No such command")
+    data_from_device(hass, IEEE, {"uptime": 0})
+    await hass.async_block_till_done()
+
+    assert hass.states.get(ENTITY1).state == "31"
+    assert hass.states.get(ENTITY4).state == "unknown"
+    assert hass.states.get(ENTITY5).state == "unknown"
+
+    commands["pump_stats"].side_effect = None
@@ -9,9 +9,12 @@ from homeassistant.components.valve import (
     STATE_OPEN,
 )
 from homeassistant.const import ATTR_ENTITY_ID
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.xbee_humidifier.const import DOMAIN
 
 from .conftest import commands
-from .const import IEEE
+from .const import IEEE, MOCK_CONFIG, MOCK_OPTIONS
 
 ENT_VALVE1 = "valve.xbee_humidifier_1_valve"
 ENT_VALVE2 = "valve.xbee_humidifier_2_valve"
@@ -98,3 +101,48 @@ async def test_valve_remote_update(
     await hass.async_block_till_done()
 
     assert hass.states.get(entity).state == STATE_CLOSED
+
+
+async def test_valve_zones(hass, data_from_device):
+    """Test the valves follow the zones reported by the device."""
+    commands["zones"].return_value = {"zones": 4, "valves": 5, "drop_valve": 0}
+    config_entry = MockConfigEntry(
+        domain=DOMAIN, data=MOCK_CONFIG, options=MOCK_OPTIONS, entry_id="test"
+    )
+    await hass.config_entries.async_add(config_entry)
+    await hass.async_block_till_done()
+
+    coordinator = hass.data[DOMAIN][config_entry.entry_id]
+    assert [coordinator.valve_zone(number) for number in range(5)] == [
+        None,
+        0,
+        1,
+        2,
+        3,
+    ]
+    assert hass.states.get(ENT_VALVE4)
+    assert hass.states.get("valve.xbee_humidifier_4_valve")
+    assert hass.states.get("humidifier.xbee_humidifier_4_humidifier")
+    assert commands["valve"].call_args_list[-1][0] == (4,)
+
+    await hass.config_entries.async_remove(config_entry.entry_id)
+    await hass.async_block_till_done()
+    commands["zones"].return_value = {"zones": 3, "valves": 4, "drop_valve": 3}
+
+
+async def test_valve_default_zones(hass, data_from_device):
+    """Test the firmware without the zones command has three zones."""
+    commands["zones"].side_effect = RuntimeError("Command response: Unknown")
+    config_entry = MockConfigEntry(
+        domain=DOMAIN, data=MOCK_CONFIG, options=MOCK_OPTIONS, entry_id="test"
+    )
+    await hass.config_entries.async_add(config_entry)
+    await hass.async_block_till_done()
+
+    coordinator = hass.data[DOMAIN][config_entry.entry_id]
+    assert coordinator.zone_count == 3
+    assert hass.states.get(ENT_VALVE4)
+
+    await hass.config_entries.async_remove(config_entry.entry_id)
+    await hass.async_block_till_done()
+    commands["zones"].side_effect = None